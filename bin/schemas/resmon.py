@@ -0,0 +1,34 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""The schema used by the resource monitor, weewx.resmon.StdResourceMonitor"""
+
+# =============================================================================
+# Memory sizes are in megabytes. CPU use is the percentage of one CPU used
+# over the sample interval. The gc_gen columns are the counts returned by
+# gc.get_count(), while gc_objects is the number of objects tracked by the
+# garbage collector. The queue columns hold the number of packets and records
+# waiting for the RESTful threads.
+# =============================================================================
+schema = [('dateTime',             'INTEGER NOT NULL UNIQUE PRIMARY KEY'),
+          ('usUnits',              'INTEGER NOT NULL'),
+          ('interval',             'INTEGER NOT NULL'),
+          ('mem_vsz',              'REAL'),
+          ('mem_rss',              'REAL'),
+          ('mem_share',            'REAL'),
+          ('mem_data',             'REAL'),
+          ('cpu_user',             'REAL'),
+          ('cpu_system',           'REAL'),
+          ('threads',              'INTEGER'),
+          ('open_fds',             'INTEGER'),
+          ('gc_gen0',              'INTEGER'),
+          ('gc_gen1',              'INTEGER'),
+          ('gc_gen2',              'INTEGER'),
+          ('gc_objects',           'INTEGER'),
+          ('restful_loop_queue',   'INTEGER'),
+          ('restful_archive_queue','INTEGER'),
+          ('report_running',       'INTEGER')]
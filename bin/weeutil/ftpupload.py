@@ -15,11 +15,13 @@ import cPickle
 import time
 import syslog
 
+import weeutil.manifest
+
 class FtpUpload(object):
     """Uploads a directory and all its descendants to a remote server.
     
     Keeps track of when a file was last uploaded, so it is uploaded only
-    if its modification time is newer."""
+    if its modification time is newer, and its contents have changed."""
 
     def __init__(self, server, 
                  user, password, 
@@ -64,6 +66,8 @@ class FtpUpload(object):
         
         # Get the timestamp and members of the last upload:
         (timestamp, fileset) = self.getLastUpload()
+        # The generators keep the digests of the files they make here:
+        self.hashes = weeutil.manifest.HashManifest(self.local_root)
 
         n_uploaded = 0
         try:
@@ -112,7 +116,7 @@ class FtpUpload(object):
                         else:
                             # Success. Log it, break out of the loop
                             n_uploaded += 1
-                            fileset.add(full_local_path)
+                            fileset[full_local_path] = self.hashes.digest(full_local_path)
                             syslog.syslog(syslog.LOG_DEBUG, "ftpupload: Uploaded file %s" % full_remote_path)
                             break
                         finally:
@@ -133,10 +137,16 @@ class FtpUpload(object):
         
         timestamp = time.time()
         self.saveLastUpload(timestamp, fileset)
+        try:
+            self.hashes.save()
+        except (IOError, OSError), e:
+            syslog.syslog(syslog.LOG_ERR, "ftpupload: Unable to save %s: %s" % (self.hashes.path, e))
         return n_uploaded
     
     def getLastUpload(self):
-        """Reads the time and members of the last upload from the local root"""
+        """Reads the time and members of the last upload from the local root.
+        The members are a dictionary. Key is the path of a file, value is its
+        digest when it was uploaded."""
         
         timeStampFile = os.path.join(self.local_root, "#%s.last" % self.name )
 
@@ -148,7 +158,7 @@ class FtpUpload(object):
                 fileset   = cPickle.load(f) 
         except IOError:
             timestamp = 0
-            fileset = set()
+            fileset = {}
             # Either the file does not exist, or it is garbled.
             # Either way, it's safe to remove it.
             try:
@@ -156,6 +166,10 @@ class FtpUpload(object):
             except OSError:
                 pass
 
+        # Older versions kept a set of the files, without their digests:
+        if not isinstance(fileset, dict):
+            fileset = dict.fromkeys(fileset)
+
         return (timestamp, fileset)
 
     def saveLastUpload(self, timestamp, fileset):
@@ -202,7 +216,8 @@ class FtpUpload(object):
         if full_local_path not in fileset:
             return False
         
-        if os.stat(full_local_path).st_mtime > timestamp:
+        if os.stat(full_local_path).st_mtime > timestamp \
+                and self.hashes.digest(full_local_path) != fileset[full_local_path]:
             return False
         
         # Filename is in the set, and is up to date. 
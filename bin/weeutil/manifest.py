@@ -0,0 +1,109 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""A dictionary that is kept in a file between runs, such as a record of the
+files a report generator has made."""
+
+from __future__ import with_statement
+import cPickle
+import hashlib
+import os
+import time
+
+class Manifest(dict):
+    """A dictionary that is loaded from a file, and saved back to it.
+
+    It is kept as a pickle. If the file does not exist, or is garbled, the
+    manifest starts out empty. Files whose names start with '#' are not
+    uploaded by ftpupload, so that is a good choice for a manifest in a
+    directory that gets uploaded."""
+
+    def __init__(self, path):
+        dict.__init__(self)
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                self.update(cPickle.load(f))
+        except IOError:
+            pass
+        except Exception:
+            # The file is garbled. Start over.
+            pass
+
+    def save(self):
+        """Save the manifest. It is written to a temporary file first, so a
+        crash does not leave a partial file behind."""
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'wb') as f:
+            cPickle.dump(dict(self), f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmpname, self.path)
+
+class HashManifest(Manifest):
+    """The MD5 digests of the files in a directory.
+
+    The manifest is kept in the file '#hashes' in the directory. Key is the
+    path of a file, relative to the directory. Value is a tuple (digest,
+    mtime, checked_ts), where mtime is the modification time of the file
+    when the digest was taken, and checked_ts is the last time a generator
+    made the file, whether or not it had to be written.
+
+    Generators use write(), so that a file whose contents have not changed
+    keeps its modification time. Uploaders use digest() to tell whether a
+    file has really changed since it was uploaded."""
+
+    def __init__(self, root):
+        self.root = os.path.normpath(root)
+        Manifest.__init__(self, os.path.join(self.root, '#hashes'))
+
+    def digest(self, path):
+        """Return the MD5 digest of a file. The digest in the manifest is used,
+        unless the file has been modified since it was taken."""
+        key = self._key(path)
+        mtime = os.path.getmtime(path)
+        entry = self.get(key)
+        if entry is None or entry[1] != mtime:
+            with open(path, 'rb') as f:
+                digest = hashlib.md5(f.read()).hexdigest()
+            entry = (digest, mtime, entry[2] if entry is not None else mtime)
+            self[key] = entry
+        return entry[0]
+
+    def write(self, path, data):
+        """Write a string to a file, unless the file already holds it. Returns
+        True if the file was written, False if it was not."""
+        digest = hashlib.md5(data).hexdigest()
+        if os.path.exists(path) and self.digest(path) == digest:
+            written = False
+        else:
+            tmpname = path + '.tmp'
+            try:
+                with open(tmpname, 'wb') as f:
+                    f.write(data)
+                os.rename(tmpname, path)
+            finally:
+                try:
+                    os.unlink(tmpname)
+                except OSError:
+                    pass
+            written = True
+        self[self._key(path)] = (digest, os.path.getmtime(path), time.time())
+        return written
+
+    def checked(self, path):
+        """Return the last time a generator made a file, or its modification
+        time if it is not in the manifest."""
+        mtime = os.path.getmtime(path)
+        entry = self.get(self._key(path))
+        if entry is None or entry[1] != mtime:
+            return mtime
+        return entry[2]
+
+    def _key(self, path):
+        path = os.path.normpath(path)
+        if path.startswith(self.root + os.sep):
+            return path[len(self.root) + 1:]
+        return path
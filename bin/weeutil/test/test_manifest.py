@@ -0,0 +1,63 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Test module weeutil.manifest"""
+
+from __future__ import with_statement
+import os
+import shutil
+import tempfile
+import unittest
+
+from weeutil.manifest import Manifest, HashManifest
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_manifest(self):
+        path = os.path.join(self.tmp_dir, '#test')
+        manifest = Manifest(path)
+        self.assertEqual(manifest, {})
+        manifest['a'] = (1, 2)
+        manifest.save()
+        self.assertEqual(Manifest(path), {'a' : (1, 2)})
+        # A garbled file is ignored:
+        with open(path, 'w') as f:
+            f.write('garbage')
+        self.assertEqual(Manifest(path), {})
+
+    def test_hashes(self):
+        path = os.path.join(self.tmp_dir, 'sub', 'index.html')
+        os.mkdir(os.path.dirname(path))
+        hashes = HashManifest(self.tmp_dir)
+        self.assertTrue(hashes.write(path, 'hello'))
+        self.assertTrue(os.path.join('sub', 'index.html') in hashes)
+        os.utime(path, (0, 0))
+
+        # The same contents are not written again, but the file is checked:
+        self.assertFalse(hashes.write(path, 'hello'))
+        self.assertEqual(os.path.getmtime(path), 0)
+        self.assertTrue(hashes.checked(path) > 0)
+        self.assertTrue(hashes.write(path, 'goodbye'))
+        self.assertEqual(open(path).read(), 'goodbye')
+
+        # A file modified by someone else is hashed again:
+        hashes.save()
+        with open(path, 'w') as f:
+            f.write('hello')
+        os.utime(path, (100, 100))
+        hashes = HashManifest(self.tmp_dir)
+        self.assertEqual(hashes.digest(path), HashManifest(self.tmp_dir + '/x').digest(path))
+        self.assertFalse(hashes.write(path, 'hello'))
+
+if __name__ == '__main__':
+    unittest.main()
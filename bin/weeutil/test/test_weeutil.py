@@ -10,6 +10,7 @@
 import unittest
 import calendar
 import os
+import pickle
 import time
 
 from weeutil.weeutil import startOfInterval, option_as_list, TimeSpan, genYearSpans, genMonthSpans, genDaySpans
@@ -261,6 +262,11 @@ class WeeutilTest(unittest.TestCase):
         dic[tright] = 'tright'
         
         self.assertEqual(dic[t], 't')
+
+        # They can be pickled, as when they are sent to worker processes:
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            self.assertEqual(pickle.loads(pickle.dumps(t, protocol)), t)
+            self.assertTrue(isinstance(pickle.loads(pickle.dumps(t, protocol)), TimeSpan))
     
     def test_genYearSpans(self):
 
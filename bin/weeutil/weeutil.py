@@ -287,6 +287,10 @@ class TimeSpan(tuple):
             raise ValueError("start time (%d) is greater than stop time (%d)" % (args[0], args[1])) 
         return tuple.__new__(cls, args)
 
+    def __getnewargs__(self):
+        # So it can be pickled. Otherwise, __new__ gets the tuple as one argument.
+        return tuple(self)
+
     @property
     def start(self):
         return self[0]
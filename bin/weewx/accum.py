@@ -9,6 +9,7 @@
 etc., of a sequence of records."""
 
 import math
+import re
 
 import weewx
 from weewx.units import ListOfDicts
@@ -26,6 +27,11 @@ class ScalarStats(object):
     Property 'last' is the last non-None value seen. Property 'lasttime' is
     the time it was seen. """
     
+    # There is one of these for every observation type in every accumulator,
+    # so keep them small:
+    __slots__ = ('min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'wsum', 'sumtime',
+                 'last', 'lasttime')
+
     default_init = (None, None, None, None, 0.0, 0, 0.0, 0)
     
     def __init__(self, stats_tuple=None):
@@ -95,12 +101,62 @@ class ScalarStats(object):
     def avg(self):
         return self.wsum / self.sumtime if self.count else None
 
+class QuantileStats(ScalarStats):
+    """Like ScalarStats, but also keeps a histogram of the values, from which
+    quantiles (such as the median) can be estimated.
+    
+    The histogram has bins of a fixed width. Only bins that hold something
+    are kept, so the histogram stays small, and two histograms can be merged
+    by simply adding their counts. A quantile is accurate to within one bin
+    width.
+    
+    The histogram appears as an extra element at the end of the stats-tuple,
+    serialized as a string. See format_sketch()."""
+
+    __slots__ = ('width', 'hist')
+
+    def __init__(self, width, stats_tuple=None):
+        self.width = width
+        super(QuantileStats, self).__init__(stats_tuple)
+
+    def setStats(self, stats_tuple=None):
+        if stats_tuple and len(stats_tuple) > len(ScalarStats.default_init):
+            ScalarStats.setStats(self, stats_tuple[:-1])
+            (width, self.hist) = parse_sketch(stats_tuple[-1])
+            if width is not None:
+                self.width = width
+        else:
+            ScalarStats.setStats(self, stats_tuple)
+            self.hist = {}
+
+    def getStatsTuple(self):
+        return ScalarStats.getStatsTuple(self) + (format_sketch(self.width, self.hist),)
+
+    def mergeSum(self, x_stats):
+        ScalarStats.mergeSum(self, x_stats)
+        if isinstance(x_stats, QuantileStats):
+            merge_sketch(self.hist, x_stats.hist)
+
+    def addSum(self, val, weight=1):
+        if val is not None:
+            ScalarStats.addSum(self, val, weight)
+            b = int(math.floor(val / self.width))
+            self.hist[b] = self.hist.get(b, 0) + 1
+
+    def quantile(self, q):
+        """Return an estimate of quantile q (0 <= q <= 1) of the values seen."""
+        return sketch_quantile(self.width, self.hist, q)
+
 class VecStats(object):
     """Accumulates statistics for a vector value.
      
     Property 'last' is the last non-None value seen. It is a two-way tuple (mag, dir).
     Property 'lasttime' is the time it was seen. """
 
+    __slots__ = ('min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'wsum', 'sumtime',
+                 'max_dir', 'xsum', 'ysum', 'dirsumtime', 'squaresum', 'wsquaresum',
+                 'last', 'lasttime')
+
     default_init = (None, None, None, None, 
                     0.0, 0, 0.0, 0, None, 0.0, 0.0, 0, 0.0, 0.0)
      
@@ -210,6 +266,75 @@ class VecStats(object):
                 _result += 360.0
             return _result
 
+#===============================================================================
+#                        Quantile sketch utilities
+#===============================================================================
+
+def parse_sketch(sketch_str):
+    """Parse a sketch, as written by format_sketch().
+    
+    returns: A 2-way tuple (width, hist). The width is None if the string is
+    empty or None."""
+    if not sketch_str:
+        return (None, {})
+    (width, bins) = sketch_str.split(';')
+    hist = {}
+    if bins:
+        for pair in bins.split(','):
+            (b, count) = pair.split(':')
+            hist[int(b)] = int(count)
+    return (float(width), hist)
+
+def format_sketch(width, hist):
+    """Serialize a histogram of bin width 'width' as a string such as
+    '0.5;12:3,13:10', where each pair is a bin number and its count. Returns
+    None for an empty histogram."""
+    if not hist:
+        return None
+    return "%r;%s" % (width, ','.join(["%d:%d" % (b, hist[b]) for b in sorted(hist)]))
+
+def merge_sketch(hist, x_hist):
+    """Add the counts of histogram x_hist to histogram hist."""
+    for b in x_hist:
+        hist[b] = hist.get(b, 0) + x_hist[b]
+
+def sketch_quantile(width, hist, q):
+    """Estimate quantile q (0 <= q <= 1) from a histogram. The values are
+    assumed to be spread evenly within each bin. Returns None if the
+    histogram is empty."""
+    total = sum(hist.itervalues())
+    if not total:
+        return None
+    target = q * total
+    cum = 0
+    for b in sorted(hist):
+        count = hist[b]
+        if cum + count >= target:
+            return (b + float(target - cum) / count) * width
+        cum += count
+    return (b + 1) * width
+
+_percentile_re = re.compile(r'^p(\d{1,2})$')
+
+def get_quantile(aggregate_type):
+    """If aggregate_type is a quantile, such as 'p90' or 'median', return it
+    as a fraction (e.g., 0.9). Otherwise, return None."""
+    if aggregate_type == 'median':
+        return 0.5
+    m = _percentile_re.match(aggregate_type)
+    return int(m.group(1)) / 100.0 if m else None
+
+def exact_quantile(sorted_values, q):
+    """Calculate quantile q of a sorted list of values, interpolating between
+    neighboring values. Returns None if the list is empty."""
+    if not sorted_values:
+        return None
+    pos = q * (len(sorted_values) - 1)
+    i = int(math.floor(pos))
+    if i + 1 >= len(sorted_values):
+        return sorted_values[-1]
+    return sorted_values[i] + (pos - i) * (sorted_values[i + 1] - sorted_values[i])
+
 #===============================================================================
 #                             Class Accum
 #===============================================================================
@@ -235,11 +360,22 @@ class Accum(dict):
         if not self.timespan.includesArchiveTime(record['dateTime']):
             raise OutOfSpan, "Attempt to add out-of-interval record"
 
-        for obs_type in record:
-            # Get the proper function ...
-            func = add_record_dict.get(obs_type, Accum.add_value)
-            # ... then call it.
-            func(self, record, obs_type, add_hilo)
+        ts = record['dateTime']
+        for (obs_type, stats_class, func) in _get_plan(record):
+            if func is None:
+                # A plain scalar. This is the common case, so it is done
+                # here, rather than through add_value().
+                try:
+                    stats = self[obs_type]
+                except KeyError:
+                    stats = self[obs_type] = stats_class()
+                val = record[obs_type]
+                if val is not None:
+                    if add_hilo:
+                        stats.addHiLo(val, ts)
+                    stats.addSum(val)
+            else:
+                func(self, record, obs_type, add_hilo)
                             
     def updateHiLo(self, accumulator):
         """Merge the high/low stats of another accumulator into me."""
@@ -349,13 +485,75 @@ class Accum(dict):
             if self.unit_system != new_unit_system:
                 raise ValueError("Unit system mismatch %d v. %d" % (self.unit_system, new_unit_system))
             
+#===============================================================================
+#                            Dispatch plans
+#===============================================================================
+
+# LOOP packets from a given station almost always hold the same set of
+# observation types. Rather than look up the function for every type in every
+# packet, the lookups are done once for each set of types, then cached. The
+# cache is keyed by a tuple of the types in the order the packet holds them,
+# which is the same for packets built the same way. The tuple is still made for
+# every packet, but it is smaller and cheaper to hash than a frozenset, and the
+# strings in it are already hashed. The configuration dictionaries below throw
+# the cache away whenever they are changed.
+_plan_cache = {}
+
+def _get_plan(record):
+    """Return the list of (obs_type, stats_class, func) tuples that adds the
+    given record to an accumulator. The function is None for plain
+    scalars."""
+    key = tuple(record)
+    try:
+        return _plan_cache[key]
+    except KeyError:
+        pass
+    # Stations that emit partial packets can produce many different sets.
+    # Don't let the cache grow without bound:
+    if len(_plan_cache) >= 256:
+        clear_plans()
+    plan = []
+    for obs_type in key:
+        func = add_record_dict.get(obs_type, Accum.add_value)
+        if func == Accum.noop:
+            continue
+        plan.append((obs_type, init_dict.get(obs_type, ScalarStats), None if func == Accum.add_value else func))
+    _plan_cache[key] = plan
+    return plan
+
+def clear_plans():
+    """Throw away the cached dispatch plans. This is done automatically when
+    one of the configuration dictionaries is changed, but an extension that
+    changes a dictionary it has already passed to extend() must call it."""
+    _plan_cache.clear()
+
+class _PlannedDict(ListOfDicts):
+    """A configuration dictionary that throws away the cached dispatch plans
+    whenever it is changed."""
+
+    def __setitem__(self, key, value):
+        ListOfDicts.__setitem__(self, key, value)
+        clear_plans()
+
+    def __delitem__(self, key):
+        ListOfDicts.__delitem__(self, key)
+        clear_plans()
+
+    def update(self, *args, **kwargs):
+        ListOfDicts.update(self, *args, **kwargs)
+        clear_plans()
+
+    def extend(self, new_dict):
+        ListOfDicts.extend(self, new_dict)
+        clear_plans()
+
 #===============================================================================
 #                            Configuration dictionaries
 #===============================================================================
 
-init_dict = ListOfDicts({'wind' : VecStats})
+init_dict = _PlannedDict({'wind' : VecStats})
 
-add_record_dict = ListOfDicts({'windSpeed' : Accum.add_wind_value,
+add_record_dict = _PlannedDict({'windSpeed' : Accum.add_wind_value,
                                'usUnits'   : Accum.check_units,
                                'dateTime'  : Accum.noop})
 
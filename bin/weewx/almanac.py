@@ -287,8 +287,8 @@ class Almanac():
             # This is how you call a function on an instance when all you have
             # is the function's name as a string
             djd = getattr(ephem, attr)(self.time_djd)
-            return weewx.units.ValueHelper((djd, "dublin_jd", "group_time"), 
-                                           context="ephem_year", formatter=self.formatter)
+            result = weewx.units.ValueHelper((djd, "dublin_jd", "group_time"), 
+                                             context="ephem_year", formatter=self.formatter)
         else:
             # It's not a calendar event. The attribute must be a heavenly body
             # (such as 'sun', or 'jupiter'). Create an instance of
@@ -298,7 +298,12 @@ class Almanac():
             # Now try getting the body as an attribute. If successful, an
             # instance of BodyWrapper will be returned. If not, an exception of
             # type AttributeError will be raised.
-            return getattr(binder, attr)
+            result = getattr(binder, attr)
+
+        # Remember the result, so it is not calculated again. An almanac
+        # can be used by many templates.
+        setattr(self, attr, result)
+        return result
             
 fn_map = {'rise'    : 'next_rising',
           'set'     : 'next_setting',
@@ -332,10 +337,19 @@ class BodyWrapper(object):
         self.sod_djd = timestamp_to_djd(time.mktime((y,m,d,0,0,0,0,0,-1)))
 
     def __call__(self, use_center=False):
-        self.use_center = use_center
-        return self
+        # The wrapper remembers its results, so return a new one, rather
+        # than changing this one.
+        wrapper = BodyWrapper(self.body_factory, self.observer, self.formatter)
+        wrapper.use_center = use_center
+        return wrapper
     
     def __getattr__(self, attr):
+        # Remember the result, so it is not calculated again:
+        result = self._calc(attr)
+        setattr(self, attr, result)
+        return result
+
+    def _calc(self, attr):
         if attr in ['az', 'alt', 'a_ra', 'a_dec', 'g_ra', 'ra', 'g_dec', 'dec', 
                      'elong', 'radius', 'hlong', 'hlat', 'sublat', 'sublong']:
             # Return the results in degrees rather than radians
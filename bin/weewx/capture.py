@@ -0,0 +1,140 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Capture the LOOP packets and archive records seen by the engine.
+
+The service StdCapture appends every LOOP packet and archive record it sees to
+a capture file. The file can later be fed back through a complete engine by
+the replay driver, weewx.drivers.replay, to reproduce the load of a real
+station without the station being attached.
+
+The service captures the data as it appears at its position in the service
+lists. To capture what comes off the hardware, put it first:
+
+    [StdCapture]
+        capture_file = archive/weewx.capture
+
+    [Engine]
+        [[Services]]
+            prep_services = weewx.capture.StdCapture, weewx.engine.StdTimeSynch
+
+The capture file is append-only. It starts with a short magic string, then
+holds one entry for each packet or record. Each entry is a header holding the
+entry kind (one character) and the length of the payload, followed by the
+payload, which is the packet dictionary encoded with the marshal module. A
+partially written entry at the end of the file (for example, after a crash)
+is ignored when reading.
+"""
+
+from __future__ import with_statement
+import marshal
+import os
+import os.path
+import struct
+import syslog
+
+import weewx
+import weewx.engine
+
+# The magic string at the start of every capture file:
+MAGIC = 'weewx-capture-1\n'
+
+# Entry kinds:
+LOOP     = 'L'
+HARDWARE = 'H'
+SOFTWARE = 'S'
+
+_header = struct.Struct('<cI')
+
+class CaptureWriter(object):
+    """Appends packets and records to a capture file."""
+
+    def __init__(self, path):
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def write(self, kind, record):
+        """Append a packet or record to the file.
+
+        kind: One of LOOP, HARDWARE, or SOFTWARE.
+
+        record: The packet or record dictionary."""
+        payload = marshal.dumps(record)
+        self.file.write(_header.pack(kind, len(payload)))
+        self.file.write(payload)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def genCapture(path, payload=True):
+    """Generator function that returns the entries in a capture file.
+
+    path: Path to the capture file.
+
+    payload: If False, then the packets are not decoded and None is returned in
+    their place. This is much faster when only the kinds are needed.
+
+    Yields: a 2-way tuple (kind, record)"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise weewx.ViolatedPrecondition("%s is not a weewx capture file" % path)
+        while True:
+            header = f.read(_header.size)
+            if len(header) < _header.size:
+                return
+            (kind, length) = _header.unpack(header)
+            if payload:
+                data = f.read(length)
+                if len(data) < length:
+                    return
+                yield (kind, marshal.loads(data))
+            else:
+                f.seek(length, os.SEEK_CUR)
+                yield (kind, None)
+
+#==============================================================================
+#                    Class StdCapture
+#==============================================================================
+
+class StdCapture(weewx.engine.StdService):
+    """Service that appends LOOP packets and archive records to a capture
+    file."""
+
+    config_sections = ['StdCapture']
+
+    def __init__(self, engine, config_dict):
+        super(StdCapture, self).__init__(engine, config_dict)
+
+        capture_file = config_dict.get('StdCapture', {}).get('capture_file', 'archive/weewx.capture')
+        self.capture_path = os.path.join(config_dict.get('WEEWX_ROOT', ''), capture_file)
+        self.writer = CaptureWriter(self.capture_path)
+        syslog.syslog(syslog.LOG_INFO, "capture: Capturing LOOP packets and archive records to %s" %
+                      self.capture_path)
+
+        self.bind(weewx.NEW_LOOP_PACKET, self.new_loop_packet)
+        self.bind(weewx.NEW_ARCHIVE_RECORD, self.new_archive_record)
+
+    def new_loop_packet(self, event):
+        self._write(LOOP, event.packet)
+
+    def new_archive_record(self, event):
+        self._write(SOFTWARE if event.origin == 'software' else HARDWARE, event.record)
+
+    def _write(self, kind, record):
+        try:
+            self.writer.write(kind, record)
+        except ValueError, e:
+            # The packet holds something marshal cannot encode.
+            syslog.syslog(syslog.LOG_ERR, "capture: Unable to capture packet %s: %s" % (record, e))
+
+    def shutDown(self):
+        self.writer.close()
@@ -16,6 +16,9 @@ Configuration Options
   encoding = (html_entities|utf8|strict_ascii)
   template = filename.tmpl           # must end with .tmpl
   stale_age = s                      # age in seconds
+  template_cache_dir = dir           # where to keep compiled templates
+  worker_count = n                   # render in n worker processes
+  incremental = (True|False)         # render only if the data has changed
 
 The strings YYYY and MM will be replaced if they appear in the filename.
 
@@ -55,7 +58,11 @@ Example:
 """
 
 from __future__ import with_statement
+import hashlib
+import imp
 import os.path
+import re
+import sys
 import syslog
 import time
 
@@ -63,14 +70,18 @@ import configobj
 
 import Cheetah.Template
 import Cheetah.Filters
+from Cheetah.Version import Version as cheetah_version
 
+import weedb
+import weeutil.manifest
 import weeutil.weeutil
 import weewx.almanac
+import weewx.loopbuffer
 import weewx.reportengine
 import weewx.station
 import weewx.units
 import weewx.tags
-from weeutil.weeutil import to_int
+from weeutil.weeutil import to_bool, to_int
 
 # Default search list:
 default_search_list = [
@@ -78,7 +89,98 @@ default_search_list = [
     "weewx.cheetahgenerator.Station",
     "weewx.cheetahgenerator.Stats",
     "weewx.cheetahgenerator.UnitInfo",
-    "weewx.cheetahgenerator.Extras"]
+    "weewx.cheetahgenerator.Extras",
+    "weewx.cheetahgenerator.Loop"]
+
+# Tags of the form $span.obs_type.aggregate_type, such as $month.outTemp.max,
+# whose aggregates can be fetched before a template is rendered:
+_tag_re = re.compile(r'\$\{?(day|yesterday|week|month|year|rainyear)\.(\w+)\.(\w+)')
+
+def scan_template(template):
+    """Return the set of (span, obs_type, aggregate_type) tuples for the tags
+    in a template file that aggregate over a time span."""
+    with open(template) as _file:
+        return set(_tag_re.findall(_file.read()))
+
+# Key is the path of a template, value is a tuple (mtime, compiled class):
+_template_classes = {}
+
+def get_template_class(template, cache_dir=None):
+    """Return the class Cheetah compiles from a template file.
+    
+    Classes are kept in memory, and a template is compiled again only if its
+    modification time changes. If cache_dir is given, the code that Cheetah
+    generates is also saved there, so the template does not have to be
+    compiled again when weewx restarts. Saved code is used only if it was
+    generated from the same path, with the same modification time, by the
+    same version of Cheetah."""
+    mtime = os.path.getmtime(template)
+    entry = _template_classes.get(template)
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+
+    class_name = 'tmpl_' + hashlib.md5(template).hexdigest()
+    header = "# Compiled from %s, modified %r, by Cheetah %s\n" % (template, mtime, cheetah_version)
+    code = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, class_name + '.py')
+        try:
+            with open(cache_file) as _file:
+                if _file.readline() == header:
+                    code = _file.read()
+        except IOError:
+            pass
+    if code is None:
+        code = Cheetah.Template.Template.compile(file=template, returnAClass=False,
+                                                 moduleName=class_name, className=class_name)
+        if cache_dir:
+            tmpname = cache_file + '.tmp'
+            try:
+                if not os.path.exists(cache_dir):
+                    os.makedirs(cache_dir)
+                with open(tmpname, 'w') as _file:
+                    _file.write(header)
+                    _file.write(code)
+                os.rename(tmpname, cache_file)
+            except (IOError, OSError), e:
+                logdbg("Unable to save compiled template %s: %s" % (template, e))
+
+    # Load the code as a module, the way Cheetah itself does. Cheetah looks
+    # the module up in sys.modules when the class is instantiated.
+    module = imp.new_module(class_name)
+    module.__file__ = template
+    exec compile(code, template, 'exec') in module.__dict__
+    sys.modules[class_name] = module
+    template_class = getattr(module, class_name)
+    _template_classes[template] = (mtime, template_class)
+    return template_class
+
+# Search list extensions that can be shared. Key is a tuple (class, cache
+# key), value is a tuple (expiration time, instance). See get_extension().
+_extension_cache = {}
+
+def get_extension(class_, generator):
+    """Return an instance of a search list extension class for a generator.
+    
+    If the class has an attribute cache_ttl, an instance made earlier, for any
+    generator in this process, is returned instead of a new one, as long as it
+    is less than cache_ttl seconds old, and class_.cache_key(generator) has
+    not changed."""
+    cache_ttl = getattr(class_, 'cache_ttl', None)
+    if cache_ttl is None:
+        return class_(generator)
+
+    now = time.time()
+    key = (class_, class_.cache_key(generator))
+    entry = _extension_cache.get(key)
+    if entry is None or entry[0] <= now:
+        # Get rid of anything that has expired:
+        for (old_key, (expiration, unused)) in _extension_cache.items():
+            if expiration <= now:
+                del _extension_cache[old_key]
+        entry = (now + cache_ttl, class_(generator))
+        _extension_cache[key] = entry
+    return entry[1]
 
 def logmsg(lvl, msg):
     syslog.syslog(lvl, 'cheetahgenerator: %s' % msg)
@@ -139,9 +241,27 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
 
         self.initExtensions(gen_dict[option_section_name])
 
+        # If there is more than one worker, the templates are rendered after
+        # they have all been found, by run_jobs():
+        worker_count = to_int(gen_dict[option_section_name].get('worker_count', 1))
+        self.jobs = [] if worker_count > 1 else None
+
         # Generate any templates in the given dictionary:
         ngen = self.generate(gen_dict[option_section_name], self.gen_ts)
 
+        if self.jobs:
+            results = weewx.reportengine.run_jobs(self, '_render_job', [job for (job, _fullname, mark) in self.jobs],
+                                                  worker_count)
+            for ((job, _fullname, mark), result) in zip(self.jobs, results):
+                ngen += self._finish(_fullname, result, mark)
+
+        for manifest in (self.manifest, self.hashes):
+            if manifest is not None:
+                try:
+                    manifest.save()
+                except (IOError, OSError), e:
+                    logerr("Unable to save %s: %s" % (manifest.path, e))
+
         self.teardown()
 
         elapsed_time = time.time() - t1
@@ -153,6 +273,20 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
 
         self.formatter = weewx.units.Formatter.fromSkinDict(self.skin_dict)
         self.converter = weewx.units.Converter.fromSkinDict(self.skin_dict)
+        # Key is a template, value is the set of tags found in it by scan_template():
+        self.template_tags = {}
+        # Templates waiting to be rendered by worker processes:
+        self.jobs = None
+        # The watermarks of the files made by incremental templates. It is
+        # loaded when first needed:
+        self.manifest = None
+        # Key is (binding, start, stop), value is the watermark of the data:
+        self.watermarks = {}
+        self.signature = None
+        # The digests of the files in HTML_ROOT, so a file is written only if
+        # its contents change:
+        self.hashes = weeutil.manifest.HashManifest(os.path.join(self.config_dict['WEEWX_ROOT'],
+                                                                 self.skin_dict['HTML_ROOT']))
 
     def initExtensions(self, gen_dict):
         """Load the search list"""
@@ -173,7 +307,7 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
                 # Get the class
                 class_ = weeutil.weeutil._get_object(x)
                 # Then instantiate the class, passing self as the sole argument
-                self.search_list_objs.append(class_(self))
+                self.search_list_objs.append(get_extension(class_, self))
                 
     def teardown(self):
         """Delete any extension objects we created to prevent back references
@@ -223,6 +357,10 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         
         (template, dest_dir, encoding, default_binding) = self._prepGen(report_dict)
 
+        cache_dir = report_dict.get('template_cache_dir')
+        if cache_dir:
+            cache_dir = os.path.join(self.config_dict['WEEWX_ROOT'], cache_dir)
+
         # Get start and stop times        
         default_archive = self.db_binder.get_manager(default_binding)
         start_ts = default_archive.firstGoodStamp()
@@ -263,12 +401,15 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
                     and not timespan.includesArchiveTime(stop_ts):
                 continue
 
-            # skip files that are fresh, but only if staleness is defined
+            # skip files that are fresh, but only if staleness is defined. A
+            # file whose contents did not change is not written again, so
+            # the time it was last made comes from the manifest of hashes,
+            # rather than from its modification time.
             stale = to_int(report_dict.get('stale_age'))
             if stale is not None:
                 t_now = time.time()
                 try:
-                    last_mod = os.path.getmtime(_fullname)
+                    last_mod = self.hashes.checked(_fullname)
                     if t_now - last_mod < stale:
                         logdbg("skip '%s': last_mod=%s age=%s stale=%s" %
                                (_filename, last_mod, t_now - last_mod, stale))
@@ -276,33 +417,148 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
                 except os.error:
                     pass
 
-            searchList = self._getSearchList(encoding, timespan,
-                                             default_binding)
-            
-            text = Cheetah.Template.Template(file=template,
-                                             searchList=searchList,
-                                             filter=encoding,
-                                             filtersLib=weewx.cheetahgenerator)
-            tmpname = _fullname + '.tmp'
-            try:
-                with open(tmpname, mode='w') as _file:
-                    print >> _file, text
-                os.rename(tmpname, _fullname)
-            except Exception, e:
-                logerr("Generate failed with exception '%s'" % type(e))
-                logerr("**** Ignoring template %s" % template)
-                logerr("**** Reason: %s" % e)
-                weeutil.weeutil.log_traceback("****  ")
+            # skip incremental files, if the data they were made from has
+            # not changed since
+            mark = None
+            if to_bool(report_dict.get('incremental', False)):
+                mark = self._get_mark(_fullname, timespan, default_binding)
+                if mark is None:
+                    logdbg("skip '%s': data unchanged" % _filename)
+                    continue
+
+            args = (template, timespan, encoding, default_binding, cache_dir)
+            if self.jobs is not None:
+                # Render it later, in a worker process. The list of summaries
+                # is copied as it is now, so the result is the same as if it
+                # were rendered now.
+                outputted_dict = dict([(k, list(v)) for (k, v) in self.outputted_dict.iteritems()])
+                self.jobs.append(((args, outputted_dict), _fullname, mark))
             else:
-                ngen += 1
-            finally:
-                try:
-                    os.unlink(tmpname)
-                except OSError:
-                    pass
+                ngen += self._finish(_fullname, self._render(*args), mark)
 
         return ngen
 
+    def _render_job(self, args, outputted_dict):
+        """Render a template that was put off until later, with the list of
+        summaries as it was when the job was made. The job is run by
+        weewx.reportengine.run_jobs(), usually in a worker process."""
+        saved_dict = self.outputted_dict
+        self.outputted_dict = outputted_dict
+        try:
+            return self._render(*args)
+        finally:
+            self.outputted_dict = saved_dict
+
+    def _render(self, template, timespan, encoding, default_binding, cache_dir):
+        """Render a template for a timespan. Returns a tuple (text, bindings),
+        where text is None if it failed, and bindings is the set of data
+        bindings the template used."""
+        self.db_binder.bindings_used = set()
+        searchList = self._getSearchList(encoding, timespan,
+                                         default_binding)
+        self._prefetch(template, searchList)
+
+        template_class = get_template_class(template, cache_dir)
+        try:
+            text = str(template_class(searchList=searchList,
+                                      filter=encoding,
+                                      filtersLib=weewx.cheetahgenerator))
+        except Exception, e:
+            logerr("Generate failed with exception '%s'" % type(e))
+            logerr("**** Ignoring template %s" % template)
+            logerr("**** Reason: %s" % e)
+            weeutil.weeutil.log_traceback("****  ")
+            text = None
+        return (text, self.db_binder.bindings_used)
+
+    def _finish(self, _fullname, result, mark):
+        """Write the result of _render() to its file and, if the template is
+        incremental, remember the watermark of the data it was made from.
+        Returns the number of files written."""
+        (text, bindings_used) = result
+        if not self._write(_fullname, text):
+            return 0
+        if mark is not None:
+            (timespan, watermark) = mark
+            # The template may have used bindings it did not use last time:
+            for data_binding in bindings_used:
+                if data_binding not in watermark:
+                    watermark[data_binding] = self._get_watermark(data_binding, timespan)
+            self.manifest[_fullname] = (self._get_signature(), watermark)
+        return 1
+
+    def _get_mark(self, _fullname, timespan, default_binding):
+        """Check whether the file made by an incremental template is up to
+        date. Returns None if it is. Otherwise, returns a tuple (timespan,
+        watermark), to be passed on to _finish().
+        
+        The watermark of a file is a dictionary. Key is the name of a data
+        binding the template used, value is the last dateTime, and the number
+        of records, in the timespan of the file. The file is up to date if it
+        exists, if the watermark has not changed, and if nothing in the skin,
+        or the configuration file, has been modified since it was made."""
+        if self.manifest is None:
+            self.manifest = weeutil.manifest.Manifest(os.path.join(self.config_dict['WEEWX_ROOT'],
+                                                                   self.skin_dict['HTML_ROOT'],
+                                                                   '#%s.watermarks' % self.skin_dict['REPORT_NAME']))
+        entry = self.manifest.get(_fullname)
+        data_bindings = set([default_binding])
+        if entry is not None:
+            data_bindings.update(entry[1])
+        watermark = dict([(data_binding, self._get_watermark(data_binding, timespan))
+                          for data_binding in data_bindings])
+        if entry == (self._get_signature(), watermark) and os.path.exists(_fullname):
+            return None
+        return (timespan, watermark)
+
+    def _get_watermark(self, data_binding, timespan):
+        """Return a tuple (last dateTime, number of records) for the records
+        in a timespan, or None if the binding cannot be opened."""
+        key = (data_binding, timespan.start, timespan.stop)
+        if key not in self.watermarks:
+            try:
+                dbmanager = self.db_binder.get_manager(data_binding)
+                _row = dbmanager.getSql("SELECT MAX(dateTime), COUNT(*) FROM %s "
+                                        "WHERE dateTime >= ? AND dateTime <= ?" % dbmanager.table_name,
+                                        (timespan.start, timespan.stop))
+                self.watermarks[key] = tuple(_row) if _row else None
+            except (weedb.DatabaseError, weewx.UnknownBinding), e:
+                logdbg("Unable to get watermark of binding '%s': %s" % (data_binding, e))
+                self.watermarks[key] = None
+        return self.watermarks[key]
+
+    def _get_signature(self):
+        """Return the modification times of the newest file in the skin, and
+        of the configuration file. If either changes, everything incremental
+        is rendered again."""
+        if self.signature is None:
+            skin_dir = os.path.join(self.config_dict['WEEWX_ROOT'],
+                                    self.skin_dict['SKIN_ROOT'],
+                                    self.skin_dict['skin'])
+            skin_mtime = None
+            for (dirpath, dirnames, filenames) in os.walk(skin_dir):
+                for filename in filenames:
+                    skin_mtime = max(skin_mtime, os.path.getmtime(os.path.join(dirpath, filename)))
+            config_path = getattr(self.config_dict, 'filename', None)
+            config_mtime = os.path.getmtime(config_path) if config_path and os.path.exists(config_path) else None
+            self.signature = (skin_mtime, config_mtime)
+        return self.signature
+
+    def _write(self, _fullname, text):
+        """Write the text of a rendered template to its file. The file is
+        left alone if it already holds the text, so it keeps its modification
+        time, and the uploaders do not send it again. Returns the number of
+        files generated."""
+        if text is None:
+            return 0
+        try:
+            if not self.hashes.write(_fullname, text + '\n'):
+                logdbg("'%s' is unchanged" % _fullname)
+        except Exception, e:
+            logerr("Unable to write %s: %s" % (_fullname, e))
+            return 0
+        return 1
+
     def _getSearchList(self, encoding, timespan, default_binding):
         """Get the complete search list to be used by Cheetah."""
 
@@ -313,8 +569,9 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
                        'encoding'   : encoding},
                       self.outputted_dict]
         
-        # Bind to the default_binding:
-        db_lookup = self.db_binder.bind_default(default_binding)
+        # Bind to the default_binding. The binder lasts only as long as this
+        # report run, so query results can be cached:
+        db_lookup = self.db_binder.bind_default(default_binding, cached=True)
         
         # Then add the V3.X style search list extensions
         for obj in self.search_list_objs:
@@ -322,6 +579,21 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
 
         return searchList
 
+    def _prefetch(self, template, searchList):
+        """Fetch the aggregates used by a template in batches, before it is
+        rendered, so tags such as $month.outTemp.max do not each need a query."""
+        if template not in self.template_tags:
+            try:
+                self.template_tags[template] = scan_template(template)
+            except IOError:
+                # Let Cheetah report the problem
+                self.template_tags[template] = set()
+        if not self.template_tags[template]:
+            return
+        for obj in searchList:
+            if isinstance(obj, weewx.tags.TimeBinder):
+                obj.prefetch(self.template_tags[template])
+
     def _getFileName(self, template, timespan):
         """Calculate a destination filename given a template filename.
         Replace 'YYYY' with the year, 'MM' with the month.  Strip off any
@@ -378,7 +650,17 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
 # =============================================================================
 
 class SearchList(object):
-    """Abstract base class used for search list extensions."""
+    """Abstract base class used for search list extensions.
+    
+    An extension that is expensive to make can be shared by reports, and
+    reused on later runs, by setting cache_ttl to how long, in seconds, it can
+    be reused, and overriding cache_key() to return something that changes
+    when the extension must be made again. A shared extension must not use
+    the generator after it has been made, other than in cache_key()."""
+
+    # How long an instance can be reused. None means it is made anew for
+    # every report run:
+    cache_ttl = None
 
     def __init__(self, generator):
         """Create an instance of SearchList.
@@ -400,12 +682,58 @@ class SearchList(object):
         """
         return [self]
 
+    @classmethod
+    def cache_key(cls, generator):
+        """Return something hashable. An instance made for another generator
+        is reused only if this is the same. See cache_ttl."""
+        return None
+
 class Almanac(SearchList):
-    """Class that implements the '$almanac' tag."""
+    """Class that implements the '$almanac' tag.
+    
+    The almanac remembers what it calculates, so it is shared by all the
+    reports that are run for the same time, with the same conditions."""
+
+    cache_ttl = 3600
+
+    @classmethod
+    def cache_key(cls, generator):
+        (celestial_ts, temperature_C, pressure_mbar) = cls._get_conditions(generator)
+        formatter = generator.formatter
+        return (celestial_ts, temperature_C, pressure_mbar,
+                generator.stn_info.latitude_f,
+                generator.stn_info.longitude_f,
+                generator.stn_info.altitude_vt,
+                tuple(cls._get_moon_phases(generator)),
+                # The almanac formats only times, and missing values:
+                tuple(sorted(formatter.time_format_dict.items())),
+                formatter.none_string)
 
     def __init__(self, generator):
         SearchList.__init__(self, generator)
 
+        (celestial_ts, temperature_C, pressure_mbar) = self._get_conditions(generator)
+
+        self.moonphases = self._get_moon_phases(generator)
+
+        altitude_vt = weewx.units.convert(generator.stn_info.altitude_vt, "meter")
+
+        self.almanac = weewx.almanac.Almanac(celestial_ts,
+                                             generator.stn_info.latitude_f,
+                                             generator.stn_info.longitude_f,
+                                             altitude=altitude_vt[0],
+                                             temperature=temperature_C,
+                                             pressure=pressure_mbar,
+                                             moon_phases=self.moonphases,
+                                             formatter=generator.formatter)
+
+    @staticmethod
+    def _get_moon_phases(generator):
+        return generator.skin_dict.get('Almanac', {}).get('moon_phases', weeutil.Moon.moon_phases)
+
+    @staticmethod
+    def _get_conditions(generator):
+        """Return a tuple (time, temperature, pressure) for the almanac."""
         celestial_ts = generator.gen_ts
 
         # For better accuracy, the almanac requires the current temperature
@@ -419,7 +747,7 @@ class Almanac(SearchList):
         # See if we can get more accurate values by looking them up in the weather
         # database. The database might not exist, so be prepared for a KeyError exception.
         try:
-            archive = self.generator.db_binder.get_manager()
+            archive = generator.db_binder.get_cached_manager()
         except KeyError:
             pass
         else:
@@ -438,19 +766,8 @@ class Almanac(SearchList):
                         temperature_C = weewx.units.convert(weewx.units.as_value_tuple(rec, 'outTemp'), "degree_C")[0]
                     if 'barometer' in rec:
                         pressure_mbar = weewx.units.convert(weewx.units.as_value_tuple(rec, 'barometer'), "mbar")[0]
-        
-        self.moonphases = generator.skin_dict.get('Almanac', {}).get('moon_phases', weeutil.Moon.moon_phases)
 
-        altitude_vt = weewx.units.convert(generator.stn_info.altitude_vt, "meter")
-
-        self.almanac = weewx.almanac.Almanac(celestial_ts,
-                                             generator.stn_info.latitude_f,
-                                             generator.stn_info.longitude_f,
-                                             altitude=altitude_vt[0],
-                                             temperature=temperature_C,
-                                             pressure=pressure_mbar,
-                                             moon_phases=self.moonphases,
-                                             formatter=generator.formatter)
+        return (celestial_ts, temperature_C, pressure_mbar)
 
 class Station(SearchList):
     """Class that implements the $station tag."""
@@ -504,6 +821,19 @@ class Extras(SearchList):
         # an empty dictionary.
         self.Extras = generator.skin_dict['Extras'] if generator.skin_dict.has_key('Extras') else {}
     
+class Loop(SearchList):
+    """Class that implements the $loop tags, which give statistics over the
+    recent LOOP packets held in memory by StdArchive."""
+
+    @property
+    def loop(self):
+        # The buffer is looked up when it is used, rather than when the
+        # extension is made, so a worker process started by
+        # weewx.reportengine.run_jobs() uses its own copy.
+        return weewx.tags.LoopBinder(weewx.loopbuffer.loop_buffer,
+                                     self.generator.formatter,
+                                     self.generator.converter)
+
 # =============================================================================
 # Filters used for encoding
 # =============================================================================
@@ -0,0 +1,205 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Declarations of derived quantities, and a planner to calculate them.
+
+A derived quantity, such as dewpoint, is declared by registering the
+observation types it is calculated from, and a formula that calculates it
+from their values:
+
+    weewx.derived.register('dewpoint', ('outTemp', 'outHumidity'),
+                           weewx.wxformulas.dewpointF, (weewx.US,))
+
+A formula is registered separately for each unit system it works in, because
+the units of the inputs depend on the unit system of the packet. Registering
+a type again replaces the formula, so an extension can substitute its own.
+
+A type can also be registered as an intermediate. An intermediate is not
+put in the packet. It is calculated, at most once per packet, only when
+something that uses it is calculated. A formula can return MISSING if it
+cannot calculate anything at all. Anything that depends on it is then skipped,
+just as it would be if one of its inputs were not in the packet.
+
+The derived quantities form a graph. Given the types to be calculated, the
+class Plan works out an order in which to calculate them, so that each one is
+calculated after the ones it depends on. StdWXCalculate makes one plan for
+each unit system it sees.
+
+An extension adds a new quantity by registering it, typically when its module
+is imported:
+
+    def humidexC(T, Td):
+        ...
+    weewx.derived.register('humidex', ('outTemp', 'dewpoint'), humidexC,
+                           (weewx.METRIC, weewx.METRICWX))
+
+Like the built-in quantities, StdWXCalculate calculates it unless the option
+for it in [StdWXCalculate] is 'hardware'.
+"""
+
+import weewx
+
+# Returned by a formula that cannot calculate anything:
+MISSING = object()
+
+# Key is a unit system; value is a list of the Derivations for it, in order
+# of registration.
+_registry = {}
+
+#==============================================================================
+#                    Class Derivation
+#==============================================================================
+
+class Derivation(object):
+    """How to calculate one observation type."""
+
+    def __init__(self, obs_type, inputs, func, intermediate=False):
+        """Initialize an instance of Derivation.
+
+        obs_type: The type that is calculated, such as 'dewpoint'.
+
+        inputs: A sequence of the types it is calculated from.
+
+        func: The formula. It is called with the values of the inputs, in
+        order, and returns the value, or MISSING.
+
+        intermediate: True if the result is used only by other derivations,
+        and is not put in the packet."""
+        self.obs_type = obs_type
+        self.inputs = tuple(inputs)
+        self.func = func
+        self.intermediate = intermediate
+
+    def __repr__(self):
+        return "Derivation(%r, %r)" % (self.obs_type, self.inputs)
+
+def register(obs_type, inputs, func, unit_systems=(weewx.US, weewx.METRIC, weewx.METRICWX),
+             intermediate=False):
+    """Register how to calculate an observation type, in one or more unit
+    systems. Any earlier registration of the type in those unit systems is
+    replaced."""
+    derivation = Derivation(obs_type, inputs, func, intermediate)
+    for unit_system in unit_systems:
+        derivations = _registry.setdefault(unit_system, [])
+        for (i, old) in enumerate(derivations):
+            if old.obs_type == obs_type:
+                derivations[i] = derivation
+                break
+        else:
+            derivations.append(derivation)
+
+def get_derivations(unit_system):
+    """Return a list of the Derivations registered for a unit system, in
+    order of registration."""
+    return list(_registry.get(unit_system, []))
+
+#==============================================================================
+#                    Class Plan
+#==============================================================================
+
+class Plan(object):
+    """The order in which to calculate a set of derived quantities."""
+
+    def __init__(self, obs_types, derivations):
+        """Plan the calculation of some observation types.
+
+        obs_types: The types to be calculated. Types in the list that have no
+        derivation are ignored.
+
+        derivations: A list of Derivations for the unit system. Those that are
+        not intermediates, and are not in obs_types, are not calculated. If
+        another quantity depends on them, their value in the packet is used.
+
+        If two types are calculated from each other, such as pressure and
+        barometer, the one registered first is calculated first, from the
+        value in the packet of the other. With the option 'prefer_hardware',
+        this means whichever one the hardware supplies is used to calculate
+        the other."""
+        derivation_dict = dict((d.obs_type, d) for d in derivations)
+        self.intermediates = dict((d.obs_type, d) for d in derivations if d.intermediate)
+
+        # The types to be calculated, in order of registration:
+        wanted = set(obs_types)
+        pending = [d for d in derivations if derivation_dict[d.obs_type] is d and
+                   not d.intermediate and d.obs_type in wanted]
+        calculated = set(d.obs_type for d in pending)
+
+        # Work out which of the calculated types each one depends on, looking
+        # through any intermediates it uses:
+        def find_inputs(derivation, path):
+            inputs = set()
+            for input_type in derivation.inputs:
+                if input_type in calculated:
+                    inputs.add(input_type)
+                elif input_type in self.intermediates:
+                    if input_type in path:
+                        raise weewx.ViolatedPrecondition("Intermediate '%s' depends on itself" % input_type)
+                    inputs |= find_inputs(self.intermediates[input_type], path + [input_type])
+            return inputs
+        depends = dict((d.obs_type, find_inputs(d, []) - set([d.obs_type])) for d in pending)
+
+        # Take the first type whose inputs have all been calculated. If there
+        # is none, the rest depend on each other, so take the first one that
+        # is part of a cycle. It uses the values in the packet.
+        def in_cycle(obs_type):
+            seen = set()
+            stack = list(depends[obs_type] - done)
+            while stack:
+                input_type = stack.pop()
+                if input_type == obs_type:
+                    return True
+                if input_type not in seen:
+                    seen.add(input_type)
+                    stack.extend(depends[input_type] - done)
+            return False
+        self.targets = []
+        done = set()
+        while pending:
+            for derivation in pending:
+                if depends[derivation.obs_type] <= done:
+                    break
+            else:
+                derivation = [d for d in pending if in_cycle(d.obs_type)][0]
+            pending.remove(derivation)
+            done.add(derivation.obs_type)
+            self.targets.append(derivation)
+
+    def obs_types(self):
+        """The types that are calculated, in order of calculation."""
+        return [derivation.obs_type for derivation in self.targets]
+
+    def calculate(self, data, needs_calc=None):
+        """Add the derived quantities to a dictionary, in place.
+
+        needs_calc: A function that is called with an observation type and the
+        dictionary. If it returns False, the type is not calculated, and any
+        value already in the dictionary is used. If None, everything is
+        calculated."""
+        # The intermediates calculated so far for this dictionary:
+        scratch = {}
+        for derivation in self.targets:
+            if needs_calc is not None and not needs_calc(derivation.obs_type, data):
+                continue
+            val = self._evaluate(derivation, data, scratch)
+            if val is not MISSING:
+                data[derivation.obs_type] = val
+
+    def _evaluate(self, derivation, data, scratch):
+        """Calculate one derivation, or return MISSING if any of its inputs
+        are missing."""
+        args = []
+        for obs_type in derivation.inputs:
+            if obs_type in self.intermediates:
+                if obs_type not in scratch:
+                    scratch[obs_type] = self._evaluate(self.intermediates[obs_type], data, scratch)
+                val = scratch[obs_type]
+            else:
+                val = data.get(obs_type, MISSING)
+            if val is MISSING:
+                return MISSING
+            args.append(val)
+        return derivation.func(*args)
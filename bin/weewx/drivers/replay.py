@@ -0,0 +1,170 @@
+# $Id$
+# Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+# See the file LICENSE.txt for your full rights.
+
+"""Driver that replays a capture file made by weewx.capture.StdCapture.
+
+The LOOP packets in the capture are emitted in order, with their original
+timestamps. Archive records that came from the hardware are returned through
+genArchiveRecords(), just as the original station returned them. If the
+capture holds no hardware records, the driver raises NotImplementedError,
+so the engine falls back to software record generation.
+
+When the end of the capture is reached, an exception of type weewx.StopNow is
+raised, which stops the engine."""
+
+import collections
+import os.path
+import syslog
+import time
+
+import weewx
+import weewx.capture
+import weewx.drivers
+
+DRIVER_NAME = 'Replay'
+DRIVER_VERSION = "1.0"
+
+def loader(config_dict, engine):
+    stn_dict = dict(config_dict[DRIVER_NAME])
+    stn_dict['capture_file'] = os.path.join(config_dict.get('WEEWX_ROOT', ''),
+                                            stn_dict.get('capture_file', 'archive/weewx.capture'))
+    return Replay(**stn_dict)
+
+class Replay(weewx.drivers.AbstractDevice):
+    """Replays a capture file"""
+
+    def __init__(self, **stn_dict):
+        """Initialize the replay driver
+
+        NAMED ARGUMENTS:
+
+        capture_file: Path to the capture file. [Required]
+
+        speed: How fast to replay, relative to real time. 1 replays in real
+        time, 10 replays ten times faster. 0 replays as fast as possible.
+        [Optional. Default is 1]
+        """
+        self.capture_file = stn_dict['capture_file']
+        self.speed = float(stn_dict.get('speed', 1.0))
+
+        # See whether the capture holds any archive records from the hardware,
+        # and what their interval is:
+        self._archive_interval = None
+        for (kind, _) in weewx.capture.genCapture(self.capture_file, payload=False):
+            if kind == weewx.capture.HARDWARE:
+                self.has_archive = True
+                break
+        else:
+            self.has_archive = False
+
+        self.entries = weewx.capture.genCapture(self.capture_file)
+        # Entries that have been read, but not yet used:
+        self.pending = collections.deque()
+        # The time of the last LOOP packet emitted. Before the first packet,
+        # it's the time of the first packet in the capture.
+        self.the_time = None
+        first = self._peek_loop()
+        if first is not None:
+            self.the_time = first['dateTime']
+        # The start of the replay, in capture time and wall clock time:
+        self.start_ts = self.start_wall = None
+
+        syslog.syslog(syslog.LOG_INFO, "replay: Replaying %s at speed %s" %
+                      (self.capture_file, self.speed if self.speed else 'unlimited'))
+
+    def genLoopPackets(self):
+        while True:
+            packet = self._next_loop()
+            if packet is None:
+                raise weewx.StopNow("Replay: end of capture file %s" % self.capture_file)
+            if self.speed:
+                if self.start_ts is None:
+                    self.start_ts = packet['dateTime']
+                    self.start_wall = time.time()
+                # Keep in step with the wall clock, scaled by the speed:
+                sleep_time = self.start_wall + (packet['dateTime'] - self.start_ts) / self.speed - time.time()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+            self.the_time = packet['dateTime']
+            yield packet
+
+    def genArchiveRecords(self, lastgood_ts):
+        if not self.has_archive:
+            raise NotImplementedError("Capture %s holds no hardware archive records" % self.capture_file)
+        # The archive records follow the LOOP packets that triggered them, so
+        # read ahead up to the next LOOP packet.
+        self._peek_loop()
+        while self.pending and self.pending[0][0] != weewx.capture.LOOP:
+            (kind, record) = self.pending.popleft()
+            if kind == weewx.capture.HARDWARE and record['dateTime'] > lastgood_ts:
+                yield record
+
+    @property
+    def archive_interval(self):
+        if self._archive_interval is None:
+            if not self.has_archive:
+                raise NotImplementedError("Capture %s holds no hardware archive records" % self.capture_file)
+            for (kind, record) in weewx.capture.genCapture(self.capture_file):
+                if kind == weewx.capture.HARDWARE:
+                    self._archive_interval = int(record['interval']) * 60
+                    break
+        return self._archive_interval
+
+    def getTime(self):
+        return self.the_time
+
+    @property
+    def hardware_name(self):
+        return "Replay"
+
+    def _peek_loop(self):
+        """Read ahead until the next LOOP packet is pending. Return it, or None
+        if there are no more LOOP packets."""
+        for (kind, record) in self.pending:
+            if kind == weewx.capture.LOOP:
+                return record
+        for (kind, record) in self.entries:
+            self.pending.append((kind, record))
+            if kind == weewx.capture.LOOP:
+                return record
+        return None
+
+    def _next_loop(self):
+        """Return the next LOOP packet, skipping any archive records before it,
+        or None if there are no more."""
+        if self._peek_loop() is None:
+            return None
+        while True:
+            (kind, record) = self.pending.popleft()
+            if kind == weewx.capture.LOOP:
+                return record
+
+def confeditor_loader():
+    return ReplayConfEditor()
+
+class ReplayConfEditor(weewx.drivers.AbstractConfEditor):
+    @property
+    def default_stanza(self):
+        return """
+[Replay]
+    # This section is for replaying a capture made by weewx.capture.StdCapture
+
+    # Path to the capture file, relative to WEEWX_ROOT:
+    capture_file = archive/weewx.capture
+
+    # How fast to replay, relative to real time. Set to 0 to replay as fast
+    # as possible.
+    speed = 1
+
+    # The driver to use:
+    driver = weewx.drivers.replay
+"""
+
+
+if __name__ == "__main__":
+    import sys
+    import weeutil.weeutil
+    station = Replay(capture_file=sys.argv[1], speed=0)
+    for packet in station.genLoopPackets():
+        print weeutil.weeutil.timestamp_to_string(packet['dateTime']), packet
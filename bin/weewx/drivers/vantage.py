@@ -1616,7 +1616,10 @@ _archive_map={'barometer'      : _val1000Zero,
 
 class VantageService(Vantage, weewx.engine.StdService):
     """Weewx service for the Vantage weather stations."""
-    
+
+    # Reopening the port on every reload would be wasteful:
+    config_sections = [DRIVER_NAME]
+
     def __init__(self, engine, config_dict):
         Vantage.__init__(self, **config_dict[DRIVER_NAME])
         weewx.engine.StdService.__init__(self, engine, config_dict)
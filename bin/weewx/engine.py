@@ -18,14 +18,13 @@ import time
 
 # 3rd party imports:
 import configobj
-import daemon
 
 # weewx imports:
 import weedb
 import weewx.accum
+import weewx.loopbuffer
 import weewx.manager
 import weewx.station
-import weewx.reportengine
 import weeutil.weeutil
 from weeutil.weeutil import to_bool, to_int
 
@@ -36,6 +35,14 @@ class BreakLoop(Exception):
 all_service_groups = ['prep_services', 'data_services', 'process_services',
                       'archive_services', 'restful_services', 'report_services']
 
+# Sections of the configuration file that cannot be changed without a full
+# restart of the engine:
+restart_sections = ['Station', 'DataBindings', 'Databases']
+
+# Set by the signal handler for SIGHUP. The engine checks it between LOOP
+# packets.
+reload_requested = False
+
 #==============================================================================
 #                    Class StdEngine
 #==============================================================================
@@ -54,6 +61,15 @@ class StdEngine(object):
         """Initialize an instance of StdEngine.
         
         config_dict: The configuration dictionary. """
+        # Keep track of when we started, so the startup time can be logged:
+        self.init_ts = time.time()
+
+        # Hang on to the configuration dictionary, so it can be compared
+        # against a new one on a reload:
+        self.config_dict = config_dict
+        global reload_requested
+        reload_requested = False
+
         # Set a default socket time out, in case FTP or HTTP hang:
         timeout = int(config_dict.get('socket_timeout', 20))
         socket.setdefaulttimeout(timeout)
@@ -65,13 +81,18 @@ class StdEngine(object):
         self.callbacks = dict()
 
         # Set up the weather station hardware:
+        t1 = time.time()
         self.setupStation(config_dict)
+        syslog.syslog(syslog.LOG_INFO, "engine: Station set up in %.2f seconds" % (time.time() - t1))
 
         # Hook for performing any chores before loading the services:
         self.preLoadServices(config_dict)
 
         # Load the services:
+        t1 = time.time()
         self.loadServices(config_dict)
+        syslog.syslog(syslog.LOG_INFO, "engine: Loaded %d services in %.2f seconds" % 
+                      (len(self.service_obj), time.time() - t1))
 
         # Another hook for after the services load.
         self.postLoadServices(config_dict)
@@ -87,18 +108,12 @@ class StdEngine(object):
         
         syslog.syslog(syslog.LOG_INFO, "engine: Loading station type %s (%s)" % (stationType, driver))
 
-        # Import the driver:
-        __import__(driver)
-    
         # Open up the weather station, wrapping it in a try block in case
         # of failure.
         try:
-            # This is a bit of Python wizardry. First, find the driver module
-            # in sys.modules.
-            driver_module = sys.modules[driver]
-            # Find the function 'loader' within the module:
-            loader_function = getattr(driver_module, 'loader')
-            # Call it with the configuration dictionary as the only argument:
+            # Import the driver and find the function 'loader' within it:
+            loader_function = weeutil.weeutil._get_object(driver + '.loader')
+            # Call the loader with the configuration dictionary and the engine:
             self.console = loader_function(config_dict, self)
         except Exception, ex:
             # Caught unrecoverable error. Log it:
@@ -117,8 +132,9 @@ class StdEngine(object):
         global all_service_groups
 
         # This will hold the list of objects, after the services has been
-        # instantiated:
+        # instantiated, and the names they were loaded with:
         self.service_obj = []
+        self.service_names = []
 
         # Wrap the instantiation of the services in a try block, so if an
         # exception occurs, any service that may have started can be shut
@@ -136,9 +152,8 @@ class StdEngine(object):
                     # For each service, instantiates an instance of the class,
                     # passing self and the configuration dictionary as the
                     # arguments:
-                    syslog.syslog(syslog.LOG_DEBUG, "engine: Loading service %s" % svc)
-                    self.service_obj.append(weeutil.weeutil._get_object(svc)(self, config_dict))
-                    syslog.syslog(syslog.LOG_DEBUG, "engine: Finished loading service %s" % svc)
+                    self.service_obj.append(self._load_service(svc, config_dict))
+                    self.service_names.append(svc)
         except Exception:
             # An exception occurred. Shut down any running services, then
             # reraise the exception.
@@ -148,6 +163,149 @@ class StdEngine(object):
     def postLoadServices(self, config_dict):
         pass
 
+    def reloadServices(self, new_config_dict):
+        """Switch to a new configuration, restarting only the services whose
+        configuration has changed.
+        
+        The console, the database connections, and any services whose
+        configuration did not change, keep running. A service that is
+        restarted can carry state over from the instance it replaces (see
+        StdService.carry_over()).
+        
+        If the change cannot be made without a full restart (for example,
+        the station or the databases changed), an exception of type Restart
+        is raised."""
+        old_config_dict = self.config_dict
+
+        # Check for any changes that require a full restart:
+        for section in restart_sections + [old_config_dict['Station']['station_type']]:
+            if old_config_dict.get(section) != new_config_dict.get(section):
+                syslog.syslog(syslog.LOG_INFO, "engine: Section [%s] changed. Full restart required." % section)
+                raise Restart
+        for scalar in set(old_config_dict.scalars + new_config_dict.scalars):
+            if scalar != 'debug' and old_config_dict.get(scalar) != new_config_dict.get(scalar):
+                syslog.syslog(syslog.LOG_INFO, "engine: Option '%s' changed. Full restart required." % scalar)
+                raise Restart
+
+        # Work out the new list of services, in order
+        new_names = []
+        for service_group in all_service_groups:
+            for svc in weeutil.weeutil.option_as_list(new_config_dict['Engine']['Services'].get(service_group, [])):
+                if svc != '':
+                    new_names.append(svc)
+
+        old_services = zip(self.service_names, self.service_obj)
+        new_service_obj = []
+        new_service_names = []
+        for svc in new_names:
+            # Look for a running instance of this service
+            for i, (name, obj) in enumerate(old_services):
+                if name == svc:
+                    old_obj = obj
+                    del old_services[i]
+                    break
+            else:
+                old_obj = None
+
+            if old_obj is not None and not old_obj.config_changed(old_config_dict, new_config_dict):
+                # No change. Keep it.
+                new_service_obj.append(old_obj)
+                new_service_names.append(svc)
+                continue
+
+            if old_obj is not None:
+                syslog.syslog(syslog.LOG_INFO, "engine: Configuration of service %s changed. Restarting it." % svc)
+                self._unload_service(old_obj)
+            else:
+                syslog.syslog(syslog.LOG_INFO, "engine: Adding service %s" % svc)
+            try:
+                new_obj = self._load_service(svc, new_config_dict)
+            except Exception, e:
+                syslog.syslog(syslog.LOG_ERR, "engine: Unable to load service %s: %s" % (svc, e))
+                # Leave the engine with the services that are running now,
+                # so the shutdown that follows stops each of them once:
+                self.service_obj = new_service_obj + [obj for (name, obj) in old_services]
+                self.service_names = new_service_names + [name for (name, obj) in old_services]
+                raise Restart
+            if old_obj is not None:
+                new_obj.carry_over(old_obj)
+            new_service_obj.append(new_obj)
+            new_service_names.append(svc)
+
+        # Whatever is left is no longer wanted
+        for (name, obj) in old_services:
+            syslog.syslog(syslog.LOG_INFO, "engine: Removing service %s" % name)
+            self._unload_service(obj)
+
+        self.service_obj = new_service_obj
+        self.service_names = new_names
+        self.config_dict = new_config_dict
+
+        # The new services bound their callbacks at the end of the lists. Put
+        # the callbacks of the services back in the order of the services. Any
+        # other callback stays right after the service callback it followed.
+        order = dict((id(obj), i) for (i, obj) in enumerate(self.service_obj))
+        for callbacks in self.callbacks.values():
+            keys = {}
+            last = -1
+            for cb in callbacks:
+                i = order.get(id(getattr(cb, 'im_self', None)))
+                if i is None:
+                    keys[id(cb)] = (last, 1)
+                else:
+                    keys[id(cb)] = (i, 0)
+                    last = i
+            # (The sort is stable, so each service's callbacks stay in the
+            # order it bound them)
+            callbacks.sort(key=lambda cb: keys[id(cb)])
+
+    def _load_service(self, svc, config_dict):
+        """Instantiate a service."""
+        syslog.syslog(syslog.LOG_DEBUG, "engine: Loading service %s" % svc)
+        t1 = time.time()
+        obj = weeutil.weeutil._get_object(svc)(self, config_dict)
+        syslog.syslog(syslog.LOG_DEBUG, "engine: Finished loading service %s in %.2f seconds" % 
+                      (svc, time.time() - t1))
+        return obj
+
+    def _unload_service(self, obj):
+        """Shut down a service, and remove any callbacks it has bound."""
+        try:
+            obj.shutDown()
+        except Exception, e:
+            syslog.syslog(syslog.LOG_ERR, "engine: Error while shutting down service %s: %s" % (obj.__class__.__name__, e))
+        for event_type in self.callbacks:
+            self.callbacks[event_type] = [cb for cb in self.callbacks[event_type] 
+                                          if getattr(cb, 'im_self', None) is not obj]
+
+    def _reload(self):
+        """Reread the configuration file, and reload any services whose
+        configuration has changed."""
+        global reload_requested
+        reload_requested = False
+
+        config_path = getattr(self.config_dict, 'filename', None)
+        if not config_path or not to_bool(self.config_dict['Engine'].get('hot_reload', True)):
+            raise Restart
+        syslog.syslog(syslog.LOG_INFO, "engine: Reloading configuration file %s" % config_path)
+        try:
+            new_config_dict = configobj.ConfigObj(config_path, file_error=True)
+        except (IOError, configobj.ConfigObjError), e:
+            syslog.syslog(syslog.LOG_ERR, "engine: Unable to reload configuration file: %s" % e)
+            syslog.syslog(syslog.LOG_ERR, "    ****  Keeping the old configuration")
+            return
+
+        t1 = time.time()
+        self.reloadServices(new_config_dict)
+
+        weewx.debug = int(new_config_dict.get('debug', 0))
+        if weewx.debug:
+            syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_DEBUG))
+        else:
+            syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_INFO))
+
+        syslog.syslog(syslog.LOG_INFO, "engine: Reload finished in %.2f seconds" % (time.time() - t1))
+
     def run(self):
         """Main execution entry point."""
         
@@ -155,9 +313,12 @@ class StdEngine(object):
         # should an exception occur:
         try:
             # Send out a STARTUP event:
+            t1 = time.time()
             self.dispatchEvent(weewx.Event(weewx.STARTUP))
+            syslog.syslog(syslog.LOG_INFO, "engine: Startup event processed in %.2f seconds" % (time.time() - t1))
             
-            syslog.syslog(syslog.LOG_INFO, "engine: Starting main packet loop.")
+            syslog.syslog(syslog.LOG_INFO, "engine: Starting main packet loop %.2f seconds after initialization began." %
+                          (time.time() - self.init_ts))
 
             last_gc = int(time.time())
 
@@ -191,6 +352,12 @@ class StdEngine(object):
                         # Allow services to break the loop by throwing
                         # an exception:
                         self.dispatchEvent(weewx.Event(weewx.CHECK_LOOP, packet=packet))
+
+                        # If a SIGHUP has arrived, reload the configuration.
+                        # This is done here, between packets, where no
+                        # service is in the middle of anything.
+                        if reload_requested:
+                            self._reload()
     
                 except BreakLoop:
                     
@@ -234,6 +401,7 @@ class StdEngine(object):
                 del self.service_obj[-1]
 
             del self.service_obj
+            del self.service_names
             
         try:
             del self.callbacks
@@ -266,6 +434,13 @@ class StdEngine(object):
 class StdService(object):
     """Abstract base class for all services."""
     
+    # The sections of the configuration file that the service uses. If any of
+    # them change, the service is restarted on a reload. Subsections are given
+    # as a path, separated by periods (e.g., 'StdRESTful.CWOP'). None means
+    # the service could be using anything, so it is restarted if anything in
+    # the configuration file changes.
+    config_sections = None
+
     def __init__(self, engine, config_dict):
         self.engine = engine
         self.config_dict = config_dict
@@ -278,6 +453,29 @@ class StdService(object):
     def shutDown(self):
         pass
 
+    def config_changed(self, old_config_dict, new_config_dict):
+        """Returns True if the configuration used by this service differs
+        between two configuration dictionaries."""
+        if self.config_sections is None:
+            return old_config_dict != new_config_dict
+        for section in self.config_sections:
+            if _get_section(old_config_dict, section) != _get_section(new_config_dict, section):
+                return True
+        return False
+
+    def carry_over(self, old_service):
+        """Called on a reload, when this service replaces an older instance
+        of itself. Services with state worth keeping should copy it over."""
+        pass
+
+def _get_section(config_dict, path):
+    """Return the section at a path such as 'StdRESTful.CWOP', or None if it
+    does not exist."""
+    section = config_dict
+    for name in path.split('.'):
+        section = section.get(name) if section is not None else None
+    return section
+
 #==============================================================================
 #                    Class StdConvert
 #==============================================================================
@@ -290,6 +488,8 @@ class StdConvert(StdService):
     
     This service should be run before most of the others, so observations appear
     in the correct unit."""
+
+    config_sections = ['StdConvert']
     
     def __init__(self, engine, config_dict):
         # Initialize my base class:
@@ -340,6 +540,8 @@ class StdCalibrate(StdService):
     
     This service must be run before StdArchive, so the correction is applied
     before the data is archived."""
+
+    config_sections = ['StdCalibrate']
     
     def __init__(self, engine, config_dict):
         # Initialize my base class:
@@ -392,6 +594,8 @@ class StdCalibrate(StdService):
 class StdQC(StdService):
     """Performs quality check on incoming data."""
 
+    config_sections = ['StdQC', 'StdConvert']
+
     def __init__(self, engine, config_dict):
         super(StdQC, self).__init__(engine, config_dict)
 
@@ -450,6 +654,8 @@ class StdQC(StdService):
 
 class StdArchive(StdService):
     """Service that archives LOOP and archive data in the SQL databases."""
+
+    config_sections = ['StdArchive']
     
     # This service manages an "accumulator", which records high/lows and
     # averages of LOOP packets over an archive period. At the end of the
@@ -465,12 +671,16 @@ class StdArchive(StdService):
             self.archive_delay = to_int(config_dict['StdArchive'].get('archive_delay', 15))
             software_interval  = to_int(config_dict['StdArchive'].get('archive_interval', 300))
             self.loop_hilo     = to_bool(config_dict['StdArchive'].get('loop_hilo', True))
+            loop_buffer_length = to_int(config_dict['StdArchive'].get('loop_buffer_length', 3600))
+            self.catchup_batch_size = to_int(config_dict['StdArchive'].get('catchup_batch_size', 1000))
         else:
             self.data_binding = 'wx_binding'
             self.record_generation = 'hardware'
             self.archive_delay = 15
             software_interval = 300
             self.loop_hilo = True
+            loop_buffer_length = 3600
+            self.catchup_batch_size = 1000
             
         syslog.syslog(syslog.LOG_INFO, "engine: Archive will use data binding %s" % self.data_binding)
         
@@ -499,6 +709,20 @@ class StdArchive(StdService):
 
         syslog.syslog(syslog.LOG_DEBUG, "engine: Use LOOP data in hi/low calculations: %d" % 
                       (self.loop_hilo,))
+
+        # Keep the most recent LOOP packets in memory, where the reports can
+        # get at them:
+        if loop_buffer_length:
+            self.loop_buffer = weewx.loopbuffer.LoopBuffer(loop_buffer_length)
+            syslog.syslog(syslog.LOG_DEBUG, "engine: Keeping %d seconds of LOOP packets in memory" % 
+                          loop_buffer_length)
+        else:
+            self.loop_buffer = None
+        weewx.loopbuffer.loop_buffer = self.loop_buffer
+
+        # Records from the console waiting to be added to the database. This
+        # is None, except during a catchup.
+        self.catchup_records = None
         
         self.setup_database(config_dict)
         
@@ -549,6 +773,9 @@ class StdArchive(StdService):
             # Add the LOOP packet to the new accumulator:
             self.accumulator.addRecord(event.packet, self.loop_hilo)
 
+        if self.loop_buffer is not None:
+            self.loop_buffer.add_packet(event.packet)
+
     def check_loop(self, event):
         """Called after any loop packets have been processed. This is the opportunity
         to break the main loop by throwing an exception."""
@@ -590,6 +817,11 @@ class StdArchive(StdService):
     def new_archive_record(self, event):
         """Called when a new archive record has arrived. 
         Put it in the archive database."""
+        # During a catchup, the records from the console are saved up, then
+        # added as a batch:
+        if self.catchup_records is not None and event.origin == 'hardware':
+            self.catchup_records.append(event.record)
+            return
         dbmanager = self.engine.db_binder.get_manager(self.data_binding)
         dbmanager.addRecord(event.record)
 
@@ -612,6 +844,21 @@ class StdArchive(StdService):
         else:
             syslog.syslog(syslog.LOG_INFO,
                           "engine: Daily summaries up to date.")
+
+        # Add any quantile sketches that have been asked for, but do not exist
+        # yet:
+        quantiles_dict = config_dict.get('StdArchive', {}).get('Quantiles', {})
+        for obs_type in quantiles_dict:
+            if obs_type in getattr(dbmanager, 'quantile_widths', {}):
+                if float(quantiles_dict[obs_type]) != dbmanager.quantile_widths[obs_type]:
+                    syslog.syslog(syslog.LOG_ERR, "engine: Quantile sketch for '%s' already has bin width %s. "
+                                  "Width %s ignored." % (obs_type, dbmanager.quantile_widths[obs_type],
+                                                         quantiles_dict[obs_type]))
+                continue
+            try:
+                dbmanager.add_quantile_sketch(obs_type, quantiles_dict[obs_type])
+            except (AttributeError, weewx.ViolatedPrecondition), e:
+                syslog.syslog(syslog.LOG_ERR, "engine: Unable to add quantile sketch for '%s': %s" % (obs_type, e))
     
 
     def _catchup(self, generator):
@@ -624,6 +871,11 @@ class StdArchive(StdService):
         # Find out when the database was last updated.
         lastgood_ts = dbmanager.lastGoodStamp()
 
+        # The records are still sent through the services one at a time, but
+        # new_archive_record() saves them up, so they can be added to the
+        # database in batches. Each batch takes a single transaction.
+        if self.catchup_batch_size > 1:
+            self.catchup_records = []
         try:
             # Now ask the console for any new records since then.
             # (Not all consoles support this feature).
@@ -631,9 +883,28 @@ class StdArchive(StdService):
                 self.engine.dispatchEvent(weewx.Event(weewx.NEW_ARCHIVE_RECORD,
                                                       record=record,
                                                       origin='hardware'))
+                if self.catchup_records and len(self.catchup_records) >= self.catchup_batch_size:
+                    self._add_catchup_records(dbmanager)
         except weewx.HardwareError, e:
             syslog.syslog(syslog.LOG_ERR, "engine: Internal error detected. Catchup abandoned")
             syslog.syslog(syslog.LOG_ERR, "**** %s" % e)
+        finally:
+            # Add whatever is left, even if the catchup was abandoned:
+            try:
+                self._add_catchup_records(dbmanager)
+            finally:
+                self.catchup_records = None
+
+    def _add_catchup_records(self, dbmanager):
+        """Add the records saved up during a catchup to the database."""
+        # The batch is taken off before it is added, so that a batch that
+        # fails is not tried again by _catchup() on the way out:
+        records, self.catchup_records = self.catchup_records, []
+        if records:
+            if len(records) > 1:
+                syslog.syslog(syslog.LOG_INFO, "engine: Adding batch of %d records from the console" %
+                              len(records))
+            dbmanager.addRecord(records)
         
     def _software_catchup(self):
         # Extract a record out of the old accumulator. 
@@ -643,6 +914,32 @@ class StdArchive(StdService):
         # Send out an event with the new record:
         self.engine.dispatchEvent(weewx.Event(weewx.NEW_ARCHIVE_RECORD, record=record, origin='software'))
     
+    def carry_over(self, old_service):
+        """Keep the accumulators and archive timing of the instance being
+        replaced, so no data is lost on a reload."""
+        if self.loop_buffer is not None and old_service.loop_buffer is not None:
+            old_service.loop_buffer.max_age = self.loop_buffer.max_age
+            self.loop_buffer = weewx.loopbuffer.loop_buffer = old_service.loop_buffer
+        if old_service.archive_interval == self.archive_interval:
+            for attr in ('accumulator', 'old_accumulator', 'end_archive_period_ts', 'end_archive_delay_ts'):
+                if hasattr(old_service, attr):
+                    setattr(self, attr, getattr(old_service, attr))
+            return
+
+        # The archive periods of the old interval do not fit the new one. Save
+        # the highs and lows of the LOOP packets seen so far, as post_loop()
+        # would, then start a new archive period.
+        syslog.syslog(syslog.LOG_INFO, "engine: Archive interval changed from %d to %d seconds. "
+                      "Starting a new archive period." % (old_service.archive_interval, self.archive_interval))
+        dbmanager = self.engine.db_binder.get_manager(self.data_binding)
+        for attr in ('old_accumulator', 'accumulator'):
+            if hasattr(old_service, attr):
+                dbmanager.updateHiLo(getattr(old_service, attr))
+        if hasattr(old_service, 'end_archive_period_ts'):
+            self.accumulator = self._new_accumulator(self.engine._get_console_time())
+            self.end_archive_period_ts = self.accumulator.timespan.stop
+            self.end_archive_delay_ts  = self.end_archive_period_ts + self.archive_delay
+
     def _new_accumulator(self, timestamp):
         start_ts = weeutil.weeutil.startOfInterval(timestamp,
                                                    self.archive_interval)
@@ -658,6 +955,8 @@ class StdArchive(StdService):
 
 class StdTimeSynch(StdService):
     """Regularly asks the station to synch up its clock."""
+
+    config_sections = ['StdTimeSynch']
     
     def __init__(self, engine, config_dict):
         super(StdTimeSynch, self).__init__(engine, config_dict)
@@ -708,6 +1007,9 @@ class StdTimeSynch(StdService):
 class StdPrint(StdService):
     """Service that prints diagnostic information when a LOOP
     or archive packet is received."""
+
+    # It uses no configuration at all:
+    config_sections = []
     
     def __init__(self, engine, config_dict):
         super(StdPrint, self).__init__(engine, config_dict)
@@ -732,21 +1034,34 @@ class StdReport(StdService):
     
     def __init__(self, engine, config_dict):
         super(StdReport, self).__init__(engine, config_dict)
-        self.max_wait    = int(config_dict['StdReport'].get('max_wait', 60))
         self.thread      = None
         self.launch_time = None
         
         self.bind(weewx.POST_LOOP, self.launch_report_thread)
+
+    def config_changed(self, old_config_dict, new_config_dict):
+        # The reports can use any part of the configuration file, but the
+        # engine's configuration is read every time a report thread is
+        # launched, so there is no need to restart the service (which would
+        # mean waiting for a running report to finish).
+        return False
         
     def launch_report_thread(self, event):
         """Called after the packet LOOP. Processes any new data."""
         # Do not launch the reporting thread if an old one is still alive.
         # To guard against a zombie thread (alive, but doing nothing) launch
-        # anyway if enough time has passed.
-        if self.thread and self.thread.isAlive() and time.time()-self.launch_time < self.max_wait:
+        # anyway if enough time has passed. Use the engine's configuration,
+        # which is replaced on a reload.
+        config_dict = self.engine.config_dict
+        max_wait = int(config_dict['StdReport'].get('max_wait', 60))
+        if self.thread and self.thread.isAlive() and time.time()-self.launch_time < max_wait:
             return
-            
-        self.thread = weewx.reportengine.StdReportEngine(self.config_dict,
+
+        # The report machinery is imported only when it is first needed, so
+        # it does not slow down startup:
+        import weewx.reportengine
+
+        self.thread = weewx.reportengine.StdReportEngine(config_dict,
                                                          self.engine.stn_info,
                                                          first_run= not self.launch_time) 
         self.thread.start()
@@ -770,8 +1085,9 @@ class Restart(Exception):
     """Exception thrown when restarting the engine is desired."""
     
 def sigHUPhandler(dummy_signum, dummy_frame):
-    syslog.syslog(syslog.LOG_DEBUG, "engine: Received signal HUP. Initiating restart.")
-    raise Restart
+    global reload_requested
+    syslog.syslog(syslog.LOG_DEBUG, "engine: Received signal HUP. Initiating reload.")
+    reload_requested = True
 
 class Terminate(Exception):
     """Exception thrown when terminating the engine."""
@@ -805,6 +1121,7 @@ def main(options, args, EngineClass=StdEngine) :
     cwd = os.getcwd()
 
     if options.daemon:
+        import daemon
         syslog.syslog(syslog.LOG_INFO, "engine: pid file is %s" % options.pidfile)
         daemon.daemonize(pidfile=options.pidfile)
 
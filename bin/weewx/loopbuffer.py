@@ -0,0 +1,207 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""An in-memory buffer of recent LOOP packets.
+
+The accumulators in StdArchive fold LOOP packets into archive records, so
+anything finer than the archive interval is normally lost. The class
+LoopBuffer keeps the last few minutes or hours of LOOP packets at full
+resolution, so statistics such as "the highest gust in the last 10 minutes"
+can be calculated without touching the database.
+
+The packets are stored column-wise: one array of doubles for the timestamps,
+and one for each observation type. A missing value is stored as NaN. Old
+packets are dropped as new ones arrive.
+
+StdArchive feeds the buffer, if option loop_buffer_length in [StdArchive] is
+non-zero, and makes it available as weewx.loopbuffer.loop_buffer. Reports run
+in the same process can then use the $loop tags (see weewx.tags.LoopBinder):
+
+    $loop.minutes(10).windGust.max
+    $loop.hours(1).outTemp.avg
+    $loop.latest.outTemp
+"""
+
+from __future__ import with_statement
+import array
+import bisect
+import math
+import threading
+
+import weewx.units
+
+# The buffer fed by StdArchive, or None if there is none:
+loop_buffer = None
+
+_nan = float('nan')
+
+#==============================================================================
+#                    Class LoopBuffer
+#==============================================================================
+
+class LoopBuffer(object):
+    """Holds the LOOP packets seen over a recent period of time."""
+
+    # The aggregations that can be done:
+    aggregate_types = ('min', 'max', 'avg', 'sum', 'count', 'first', 'last',
+                       'mintime', 'maxtime', 'firsttime', 'lasttime')
+
+    def __init__(self, max_age=3600):
+        """Initialize the buffer.
+
+        max_age: How long to keep packets, in seconds."""
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Throw away all the packets."""
+        self.unit_system = None
+        self.times = array.array('d')
+        self.columns = {}
+        # Index of the oldest packet still in use. Packets before it have
+        # expired, but are only removed from the arrays now and then.
+        self.head = 0
+
+    def __len__(self):
+        return len(self.times) - self.head
+
+    @property
+    def first_ts(self):
+        """The time of the oldest packet in the buffer, or None."""
+        return self.times[self.head] if len(self) else None
+
+    @property
+    def last_ts(self):
+        """The time of the newest packet in the buffer, or None."""
+        return self.times[-1] if len(self) else None
+
+    def obs_types(self):
+        """The observation types seen in the buffer."""
+        return self.columns.keys()
+
+    def add_packet(self, packet):
+        """Add a LOOP packet to the buffer. Packets must arrive in order of
+        time. Values that are not numbers are ignored."""
+        with self.lock:
+            if packet['usUnits'] != self.unit_system or (len(self) and packet['dateTime'] < self.times[-1]):
+                # The units changed, or time went backwards. Start over.
+                self.clear()
+                self.unit_system = packet['usUnits']
+            n = len(self.times)
+            self.times.append(packet['dateTime'])
+            for obs_type in packet:
+                if obs_type in ('dateTime', 'usUnits'):
+                    continue
+                column = self.columns.get(obs_type)
+                if column is None:
+                    # A new type. Fill in the packets that did not have it.
+                    column = self.columns[obs_type] = array.array('d', [_nan]) * n
+                val = packet[obs_type]
+                try:
+                    column.append(_nan if val is None else val)
+                except TypeError:
+                    column.append(_nan)
+            # Any types missing from this packet get a NaN:
+            n += 1
+            for column in self.columns.itervalues():
+                if len(column) < n:
+                    column.append(_nan)
+            self._expire(packet['dateTime'] - self.max_age)
+
+    def copy(self):
+        """Return a copy of the buffer, with a lock of its own. A process
+        forked from a thread other than the one adding packets should use a
+        copy made before forking: if the lock happens to be held when the
+        process is forked, the process inherits it held, and can never take
+        it."""
+        with self.lock:
+            other = LoopBuffer(self.max_age)
+            other.unit_system = self.unit_system
+            other.times = self.times[self.head:]
+            other.columns = dict((obs_type, column[self.head:])
+                                 for (obs_type, column) in self.columns.iteritems())
+        return other
+
+    def aggregate(self, obs_type, aggregate_type, start_ts=None, stop_ts=None):
+        """Calculate an aggregate over the packets in a window of time.
+
+        obs_type: The observation type, such as 'outTemp'
+
+        aggregate_type: One of the aggregate_types, such as 'max'.
+
+        start_ts, stop_ts: The window, exclusive of start_ts, inclusive of
+        stop_ts. Either can be None, meaning the start or end of the buffer.
+
+        returns: A ValueTuple. The value is None if there is no data."""
+        if aggregate_type not in LoopBuffer.aggregate_types:
+            raise weewx.ViolatedPrecondition("Aggregation type '%s' not supported by the LOOP buffer" %
+                                             aggregate_type)
+        with self.lock:
+            (t_unit, t_group) = weewx.units.getStandardUnitType(self.unit_system, obs_type, aggregate_type)
+            column = self.columns.get(obs_type)
+            if column is None:
+                value = 0 if aggregate_type == 'count' else None
+                return weewx.units.ValueTuple(value, t_unit, t_group)
+            lo = self.head if start_ts is None else bisect.bisect_right(self.times, start_ts, self.head)
+            hi = len(self.times) if stop_ts is None else bisect.bisect_right(self.times, stop_ts, lo)
+            value = _aggregate(self.times, column, lo, hi, aggregate_type)
+        return weewx.units.ValueTuple(value, t_unit, t_group)
+
+    def latest(self, obs_type):
+        """Return the latest non-missing value of an observation type as a
+        ValueTuple."""
+        return self.aggregate(obs_type, 'last')
+
+    def _expire(self, oldest_ts):
+        """Drop the packets at or before oldest_ts."""
+        times = self.times
+        self.head = bisect.bisect_right(times, oldest_ts, self.head)
+        # Deleting from the front of an array means moving everything after
+        # it, so only do it when half the array has expired.
+        if self.head > 64 and self.head * 2 > len(times):
+            del times[:self.head]
+            for column in self.columns.itervalues():
+                del column[:self.head]
+            self.head = 0
+
+def _aggregate(times, column, lo, hi, aggregate_type):
+    """Calculate an aggregate over column[lo:hi], skipping NaNs."""
+    isnan = math.isnan
+    if aggregate_type in ('first', 'firsttime'):
+        for i in xrange(lo, hi):
+            if not isnan(column[i]):
+                return column[i] if aggregate_type == 'first' else int(times[i])
+        return None
+    if aggregate_type in ('last', 'lasttime'):
+        for i in xrange(hi - 1, lo - 1, -1):
+            if not isnan(column[i]):
+                return column[i] if aggregate_type == 'last' else int(times[i])
+        return None
+    if aggregate_type in ('min', 'mintime', 'max', 'maxtime'):
+        best = best_i = None
+        if aggregate_type in ('min', 'mintime'):
+            for i in xrange(lo, hi):
+                val = column[i]
+                if not isnan(val) and (best is None or val < best):
+                    (best, best_i) = (val, i)
+        else:
+            for i in xrange(lo, hi):
+                val = column[i]
+                if not isnan(val) and (best is None or val > best):
+                    (best, best_i) = (val, i)
+        if best_i is None or aggregate_type in ('min', 'max'):
+            return best
+        return int(times[best_i])
+    # What is left are sum, count, and avg:
+    values = [val for val in column[lo:hi] if not isnan(val)]
+    if aggregate_type == 'count':
+        return len(values)
+    if not values:
+        return None
+    total = math.fsum(values)
+    return total if aggregate_type == 'sum' else total / len(values)
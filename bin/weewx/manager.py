@@ -429,6 +429,13 @@ class Manager(object):
         type is unknown. The second element is the unit type (eg, 'degree_F').
         The third element is the unit group (eg, "group_temperature") """
         
+        q = weewx.accum.get_quantile(aggregate_type)
+        if q is not None:
+            # A quantile, such as 'p90'. It has to be calculated from all the
+            # values in the time span.
+            (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
+            return weewx.units.ValueTuple(self._getQuantile(timespan, obs_type, q), t, g)
+
         if aggregate_type not in ['sum', 'count', 'avg', 'max', 'min', 
                                   'mintime', 'maxtime', 'last', 'lasttime']:
             raise weewx.ViolatedPrecondition("Invalid aggregation type '%s'" % aggregate_type)
@@ -450,6 +457,33 @@ class Manager(object):
         # Form the value tuple and return it:
         return weewx.units.ValueTuple(_result, t, g)
     
+    def getAggregates(self, timespan, obs_type, aggregate_types, **option_dict):
+        """Returns several aggregations of an observation type over the same
+        time period.
+        
+        returns: A dictionary. Key is the aggregation type, value is the value
+        tuple that getAggregate() would return for it. This version simply
+        calls getAggregate() for each type."""
+        return dict((aggregate_type, self.getAggregate(timespan, obs_type, aggregate_type, **option_dict))
+                    for aggregate_type in aggregate_types)
+
+    def getAggregateSeries(self, timespans, obs_type, aggregate_types, **option_dict):
+        """Returns aggregations over each of a sequence of consecutive time
+        periods, such as the days of a month.
+        
+        returns: A list, with a dictionary for each timespan, as getAggregates()
+        would return it. This version simply calls getAggregates() for each."""
+        return [self.getAggregates(timespan, obs_type, aggregate_types, **option_dict) 
+                for timespan in timespans]
+
+    def _getQuantile(self, timespan, obs_type, q):
+        """Calculate a quantile from all the values in the archive table."""
+        values = [_row[0] for _row in self.genSql("SELECT %s FROM %s WHERE dateTime > ? AND dateTime <= ? "
+                                                  "AND %s IS NOT NULL ORDER BY %s" % 
+                                                  (obs_type, self.table_name, obs_type, obs_type),
+                                                  (timespan.start, timespan.stop))]
+        return weewx.accum.exact_quantile(values, q)
+
     def getSqlVectors(self, timespan, obs_type, 
                       aggregate_type=None,
                       aggregate_interval=None): 
@@ -804,8 +838,13 @@ class DBBinder(object):
         self.databases_dict = databases_dict
         self.default_binding_dict = {}
         self.manager_cache = {}
+        self.cached_manager_cache = {}
+        # The names of the bindings that have been asked for. A caller can
+        # reset this, to find out which bindings something uses.
+        self.bindings_used = set()
     
     def close(self):
+        self.cached_manager_cache = {}
         for data_binding in self.manager_cache.keys():
             try:
                 self.manager_cache[data_binding].close()
@@ -825,6 +864,7 @@ class DBBinder(object):
     def get_manager(self, data_binding='wx_binding', initialize=False):
         """Given a binding name, returns the managed object"""
 
+        self.bindings_used.add(data_binding)
         if data_binding not in self.manager_cache:
             manager_dict = get_manager_dict(self.bindings_dict, 
                                             self.databases_dict, 
@@ -837,16 +877,117 @@ class DBBinder(object):
     # For backwards compatibility with early alphas:
     get_database = get_manager
     
-    def bind_default(self, default_binding='wx_binding'):
-        """Returns a function that holds a default database binding."""
+    def get_cached_manager(self, data_binding='wx_binding'):
+        """Like get_manager(), except the managed object is wrapped in a
+        CachingManager, which remembers the results of queries. Use it only
+        for something no longer lived than this binder, such as a report."""
+
+        self.bindings_used.add(data_binding)
+        if data_binding not in self.cached_manager_cache:
+            self.cached_manager_cache[data_binding] = CachingManager(self.get_manager(data_binding))
+
+        return self.cached_manager_cache[data_binding]
+
+    def bind_default(self, default_binding='wx_binding', cached=False):
+        """Returns a function that holds a default database binding. If cached
+        is True, the function returns CachingManagers."""
         
+        get_manager = self.get_cached_manager if cached else self.get_manager
         def db_lookup(data_binding=None):
             if data_binding is None:
                 data_binding = default_binding
-            return self.get_manager(data_binding)
+            return get_manager(data_binding)
 
         return db_lookup
 
+#===============================================================================
+#                    Class CachingManager
+#===============================================================================
+
+class CachingManager(object):
+    """Wraps a manager, remembering the results of getAggregate() and
+    getRecord(). Everything else is passed on to the manager.
+    
+    It is meant for something short lived, such as a report run, which can ask
+    for the same aggregate many times, and which does not need to see records
+    added after it started. The aggregates can also be fetched in advance, in
+    batches, with prefetch()."""
+    
+    def __init__(self, manager):
+        self.manager = manager
+        # Key is (start, stop, obs_type, aggregate_type, val); value is a ValueTuple.
+        self.aggregate_cache = {}
+        # Key is (timestamp, max_delta); value is a record, or None.
+        self.record_cache = {}
+        # The series fetched by prefetch_series():
+        self.series_done = set()
+
+    def __getattr__(self, attr):
+        return getattr(self.manager, attr)
+
+    def getAggregate(self, timespan, obs_type, aggregate_type, **option_dict):
+        """Returns an aggregation, as the manager would, from the cache if
+        possible."""
+        key = (timespan.start, timespan.stop, obs_type, aggregate_type, option_dict.get('val'))
+        try:
+            return self.aggregate_cache[key]
+        except KeyError:
+            result = self.aggregate_cache[key] = self.manager.getAggregate(timespan, obs_type,
+                                                                           aggregate_type, **option_dict)
+            return result
+
+    def getRecord(self, timestamp, max_delta=None):
+        """Returns a record, as the manager would, from the cache if possible.
+        The same dictionary is returned each time, so it should not be
+        modified."""
+        key = (timestamp, max_delta)
+        try:
+            return self.record_cache[key]
+        except KeyError:
+            record = self.record_cache[key] = self.manager.getRecord(timestamp, max_delta)
+            return record
+
+    def prefetch_series(self, timespans, obs_type, aggregate_type, **option_dict):
+        """Fetch an aggregation over each of a sequence of consecutive time
+        periods, such as the days of a month, and put them in the cache. Any
+        other aggregations the manager calculates along the way are cached as
+        well. Nothing is done if the series has been fetched before."""
+        val = option_dict.get('val')
+        key = (timespans[0].start, timespans[-1].stop, len(timespans), obs_type)
+        if (key, aggregate_type, val) in self.series_done:
+            return
+        self.series_done.add((key, aggregate_type, val))
+        try:
+            series = self.manager.getAggregateSeries(timespans, obs_type, [aggregate_type], **option_dict)
+        except (AttributeError, KeyError, weewx.ViolatedPrecondition, weedb.DatabaseError), e:
+            syslog.syslog(syslog.LOG_DEBUG, "manager: Unable to prefetch series of %s: %s" % (obs_type, e))
+            return
+        for (timespan, results) in zip(timespans, series):
+            for other_type in results:
+                # Only the aggregation asked for can depend on val
+                other_val = val if other_type == aggregate_type else None
+                self.aggregate_cache[(timespan.start, timespan.stop, obs_type, other_type, other_val)] = results[other_type]
+                self.series_done.add((key, other_type, other_val))
+
+    def prefetch(self, timespan, obs_type, aggregate_types, **option_dict):
+        """Fetch several aggregations of an observation type over a timespan,
+        using as few queries as the manager can, and put them in the cache.
+        
+        Errors are not raised. Any aggregation that could not be fetched is
+        left to getAggregate(), which will raise the error if it is ever
+        asked for."""
+        wanted = [aggregate_type for aggregate_type in aggregate_types
+                  if (timespan.start, timespan.stop, obs_type, aggregate_type, None) not in self.aggregate_cache]
+        if not wanted:
+            return
+        try:
+            results = self.manager.getAggregates(timespan, obs_type, wanted, **option_dict)
+        except (AttributeError, KeyError, weewx.ViolatedPrecondition, weedb.DatabaseError), e:
+            syslog.syslog(syslog.LOG_DEBUG, "manager: Unable to prefetch %s over %s: %s" % (obs_type, timespan, e))
+            return
+        for aggregate_type in results:
+            self.aggregate_cache[(timespan.start, timespan.stop, obs_type, aggregate_type, None)] = results[aggregate_type]
+
 #===============================================================================
 #                                 Utilities
 #===============================================================================
@@ -989,7 +1130,12 @@ class DaySummaryManager(Manager):
     sumtime is the sum of the archive intervals.
         
     In addition to all the tables for each type, there is one additional table called
-    'archive_day__metadata', which currently holds the time of the last update. """
+    'archive_day__metadata', which currently holds the time of the last update. 
+    
+    Optionally, a type can also have a quantile sketch, which allows quantiles such
+    as the median to be calculated from the daily summaries. Its table then has an
+    extra column 'sketch', and the bin width of the sketch is kept in the metadata
+    under name 'quantiles'. See add_quantile_sketch(). """
     
     version = "1.0"
 
@@ -1035,6 +1181,49 @@ class DaySummaryManager(Manager):
                'min_le'     : "SELECT SUM(min <= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
                'sum_ge'     : "SELECT SUM(sum >= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s"}
     
+    # The aggregation types that getAggregates() can calculate together, in one
+    # query. Value is the columns needed, in the order they appear in sqlDict.
+    batch_columns = {'min'     : ('MIN(min)',),
+                     'minmax'  : ('MIN(max)',),
+                     'max'     : ('MAX(max)',),
+                     'maxmin'  : ('MAX(min)',),
+                     'meanmin' : ('AVG(min)',),
+                     'meanmax' : ('AVG(max)',),
+                     'maxsum'  : ('MAX(sum)',),
+                     'sum'     : ('SUM(sum)',),
+                     'count'   : ('SUM(count)',),
+                     'avg'     : ('SUM(wsum)', 'SUM(sumtime)')}
+    
+    # The aggregation types that getAggregateSeries() calculates from the rows of
+    # the daily summaries. Value is a column that must be in the summary.
+    series_types   = {'min'        : 'min',
+                      'minmax'     : 'max',
+                      'max'        : 'max',
+                      'maxmin'     : 'min',
+                      'meanmin'    : 'min',
+                      'meanmax'    : 'max',
+                      'maxsum'     : 'sum',
+                      'mintime'    : 'mintime',
+                      'maxmintime' : 'mintime',
+                      'maxtime'    : 'maxtime',
+                      'minmaxtime' : 'maxtime',
+                      'maxsumtime' : 'maxtime',
+                      'gustdir'    : 'max_dir',
+                      'sum'        : 'sum',
+                      'count'      : 'count',
+                      'avg'        : 'wsum',
+                      'rms'        : 'wsquaresum',
+                      'vecavg'     : 'xsum',
+                      'vecdir'     : 'xsum',
+                      'max_ge'     : 'max',
+                      'max_le'     : 'max',
+                      'min_le'     : 'min',
+                      'sum_ge'     : 'sum'}
+    val_types      = ['max_ge', 'max_le', 'min_le', 'sum_ge']
+    # The columns it reads:
+    series_columns = ['dateTime', 'min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'wsum', 'sumtime',
+                      'max_dir', 'xsum', 'ysum', 'dirsumtime', 'wsquaresum']
+    
     def __init__(self, connection, table_name='archive', schema=None):
         """Initialize an instance of DaySummaryManager
         
@@ -1072,6 +1261,17 @@ class DaySummaryManager(Manager):
         row = self.connection.execute("""SELECT value FROM %s_day__metadata WHERE name = 'Version';""" % self.table_name)
         self.version = row[0] if row is not None else "1.0"
 
+        # The columns of each daily summary, as they are needed by getAggregateSeries():
+        self.day_columns = {}
+
+        # The types with quantile sketches, and their bin widths:
+        row = self.getSql("""SELECT value FROM %s_day__metadata WHERE name = 'quantiles';""" % self.table_name)
+        self.quantile_widths = {}
+        if row is not None and row[0]:
+            for item in row[0].split(','):
+                (obs_type, width) = item.split(':')
+                self.quantile_widths[obs_type] = float(width)
+
     def _initialize_day_tables(self, archiveSchema, cursor):
         """Initialize the tables needed for the daily summary."""
         # Create the tables needed for the daily summaries.
@@ -1082,6 +1282,55 @@ class DaySummaryManager(Manager):
         # Put the version number in it:
         cursor.execute(DaySummaryManager.meta_replace_str % self.table_name, ("Version", DaySummaryManager.version))
 
+    def addRecord(self, record_obj, log_level=syslog.LOG_NOTICE):
+        """Specialized version that adds a collection of records as a batch.
+
+        The records are added to the archive table one by one, but the daily
+        summary of each day is read and written only once, rather than once
+        for every record. It all happens in a single transaction. Records
+        should be in order of time, or the summary for a day may be read and
+        written more than once."""
+
+        # A single record is done the regular way:
+        if hasattr(record_obj, 'keys'):
+            return super(DaySummaryManager, self).addRecord(record_obj, log_level)
+
+        min_ts = None
+        max_ts = 0
+        _day_accum = None
+        _lastTime = None
+        with weedb.Transaction(self.connection) as cursor:
+
+            for record in record_obj:
+                # Let my superclass add the record to the main archive table:
+                super(DaySummaryManager, self)._addSingleRecord(record, cursor, log_level=log_level)
+
+                # If the record belongs to a different day, save the summary
+                # of the old day, then get the summary of the new day:
+                _sod_ts = weeutil.weeutil.startOfArchiveDay(record['dateTime'])
+                if _day_accum is None or _day_accum.timespan.start != _sod_ts:
+                    if _day_accum is not None:
+                        self._set_day_summary(_day_accum, _lastTime, cursor)
+                    _day_accum = self._get_day_summary(_sod_ts, cursor)
+                _day_accum.addRecord(record)
+                _lastTime = record['dateTime']
+                syslog.syslog(log_level, "manager: added record %s to daily summary in '%s'" %
+                              (weeutil.weeutil.timestamp_to_string(record['dateTime']),
+                               self.database_name))
+
+                min_ts = min(min_ts, record['dateTime']) if min_ts is not None else record['dateTime']
+                max_ts = max(max_ts, record['dateTime'])
+
+            # Save the summary of the last day:
+            if _day_accum is not None:
+                self._set_day_summary(_day_accum, _lastTime, cursor)
+
+        # Update the cached timestamps. This has to sit outside the
+        # transaction context, in case an exception occurs.
+        if min_ts is not None:
+            self.first_timestamp = min(min_ts, self.first_timestamp)
+            self.last_timestamp  = max(max_ts, self.last_timestamp)
+
     def _addSingleRecord(self, record, cursor, log_level):
         """Specialized version that updates the daily summaries, as well as the 
         main archive table."""
@@ -1133,13 +1382,7 @@ class DaySummaryManager(Manager):
         type is unknown. The second element is the unit type (eg, 'degree_F').
         The third element is the unit group (eg, "group_temperature") """
         
-        # We can use the day summary optimizations if the starting and ending times of
-        # the aggregation interval sit on midnight boundaries, or are the first or last
-        # records in the database.
-        if aggregate_type in ['last', 'lasttime'] or not (weeutil.weeutil.isMidnight(timespan.start) or \
-                                                          timespan.start == self.first_timestamp) \
-                                                  or not (weeutil.weeutil.isMidnight(timespan.stop)  or \
-                                                          timespan.stop  == self.last_timestamp):
+        if aggregate_type in ['last', 'lasttime'] or not self._use_day_summary(timespan):
             
             # Cannot use the day summaries. We'll have to calculate the aggregate
             # using the regular archive table:
@@ -1157,18 +1400,22 @@ class DaySummaryManager(Manager):
         if obs_type not in self.daykeys:
             raise AttributeError, "Unknown daily summary type %s" % (obs_type,)
 
-        val = option_dict.get('val')
-        if val is None:
-            target_val = None
-        else:
-            # The following is for backwards compatibility when ValueTuples had
-            # just two members. This hack avoids breaking old skins.
-            if len(val) == 2:
-                if val[1] in ['degree_F', 'degree_C']:
-                    val += ("group_temperature",)
-                elif val[1] in ['inch', 'mm', 'cm']:
-                    val += ("group_rain",)
-            target_val = weewx.units.convertStd(val, self.std_unit_system)[0]
+        q = weewx.accum.get_quantile(aggregate_type)
+        if q is not None:
+            if obs_type not in self.quantile_widths:
+                # No sketch. Fall back to the archive table.
+                return Manager.getAggregate(self, timespan, obs_type, aggregate_type, **option_dict)
+            # Merge the sketches of all the days in the span:
+            width = self.quantile_widths[obs_type]
+            hist = {}
+            for _row in self.genSql("SELECT sketch FROM %s_day_%s WHERE dateTime >= ? AND dateTime < ?" % 
+                                    (self.table_name, obs_type),
+                                    (weeutil.weeutil.startOfDay(timespan.start), timespan.stop)):
+                weewx.accum.merge_sketch(hist, weewx.accum.parse_sketch(_row[0])[1])
+            (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
+            return weewx.units.ValueTuple(weewx.accum.sketch_quantile(width, hist, q), t, g)
+
+        target_val = self._get_target_val(option_dict.get('val'))
 
         # convert to lower-case:
         aggregate_type = aggregate_type.lower()
@@ -1184,6 +1431,213 @@ class DaySummaryManager(Manager):
         # Run the query against the database:
         _row = self.getSql(DaySummaryManager.sqlDict[aggregate_type] % interDict)
 
+        _result = DaySummaryManager._calc_aggregate(aggregate_type, _row)
+
+        # Look up the unit type and group of this combination of stats type and aggregation:
+        (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
+        # Form the value tuple and return it:
+        return weewx.units.ValueTuple(_result, t, g)
+        
+    def getAggregates(self, timespan, obs_type, aggregate_types, **option_dict):
+        """Returns several aggregations of an observation type over the same
+        time period, as a dictionary keyed by aggregation type.
+        
+        If the daily summaries can be used, all the aggregations that are
+        simple functions of the summary columns (see batch_columns) are
+        calculated with a single query. The rest are done by getAggregate()."""
+
+        results = {}
+        if self._use_day_summary(timespan) and obs_type in self.daykeys:
+            batch = [aggregate_type for aggregate_type in aggregate_types 
+                     if aggregate_type.lower() in DaySummaryManager.batch_columns]
+            columns = []
+            for aggregate_type in batch:
+                for column in DaySummaryManager.batch_columns[aggregate_type.lower()]:
+                    if column not in columns:
+                        columns.append(column)
+            if columns:
+                _row = self.getSql("SELECT %s FROM %s_day_%s WHERE dateTime >= ? AND dateTime < ?" % 
+                                   (', '.join(columns), self.table_name, obs_type),
+                                   (weeutil.weeutil.startOfDay(timespan.start), timespan.stop))
+                for aggregate_type in batch:
+                    _sub_row = tuple([_row[columns.index(column)] for column in 
+                                      DaySummaryManager.batch_columns[aggregate_type.lower()]]) if _row else None
+                    _result = DaySummaryManager._calc_aggregate(aggregate_type.lower(), _sub_row)
+                    (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type.lower())
+                    results[aggregate_type] = weewx.units.ValueTuple(_result, t, g)
+
+        others = [aggregate_type for aggregate_type in aggregate_types if aggregate_type not in results]
+        results.update(Manager.getAggregates(self, timespan, obs_type, others, **option_dict))
+        return results
+
+    def getAggregateSeries(self, timespans, obs_type, aggregate_types, **option_dict):
+        """Returns aggregations over each of a sequence of consecutive time
+        periods, such as the days of a month, as a list of dictionaries.
+        
+        If the daily summaries can be used for all the timespans, the summaries
+        of the whole period are read with a single query, and the aggregations
+        for each timespan are calculated from them. The dictionaries then hold
+        every aggregation that can be calculated that way (see
+        _aggregate_rows()), not just those asked for. Any others are done by
+        getAggregate()."""
+
+        if not timespans or obs_type not in self.daykeys or \
+                not all([self._use_day_summary(timespan) for timespan in timespans]):
+            return Manager.getAggregateSeries(self, timespans, obs_type, aggregate_types, **option_dict)
+
+        columns = self._get_day_columns(obs_type)
+        _rows = [dict(zip(columns, _row)) for _row in 
+                 self.genSql("SELECT %s FROM %s_day_%s WHERE dateTime >= ? AND dateTime < ? ORDER BY dateTime" %
+                             (', '.join(columns), self.table_name, obs_type),
+                             (weeutil.weeutil.startOfDay(timespans[0].start), timespans[-1].stop))]
+        target_val = self._get_target_val(option_dict.get('val'))
+        # Only the aggregations asked for can use val, and some need columns
+        # that only the wind summary has:
+        series_types = [aggregate_type for aggregate_type in DaySummaryManager.series_types
+                        if (aggregate_type not in DaySummaryManager.val_types or
+                            (target_val is not None and aggregate_type in [x.lower() for x in aggregate_types])) and
+                        DaySummaryManager.series_types[aggregate_type] in columns]
+
+        series = []
+        i = 0
+        for timespan in timespans:
+            # The rows are in order, so the ones for each timespan follow on from
+            # the ones for the timespan before:
+            start_ts = weeutil.weeutil.startOfDay(timespan.start)
+            while i < len(_rows) and _rows[i]['dateTime'] < start_ts:
+                i += 1
+            j = i
+            while j < len(_rows) and _rows[j]['dateTime'] < timespan.stop:
+                j += 1
+            results = {}
+            for aggregate_type in series_types:
+                _row = DaySummaryManager._aggregate_rows(aggregate_type, _rows[i:j], target_val)
+                (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
+                results[aggregate_type] = weewx.units.ValueTuple(DaySummaryManager._calc_aggregate(aggregate_type, _row), t, g)
+            for aggregate_type in aggregate_types:
+                if aggregate_type.lower() in results:
+                    results[aggregate_type] = results[aggregate_type.lower()]
+            others = [aggregate_type for aggregate_type in aggregate_types if aggregate_type not in results]
+            results.update(Manager.getAggregates(self, timespan, obs_type, others, **option_dict))
+            series.append(results)
+            i = j
+        return series
+
+    def _get_day_columns(self, obs_type):
+        """Returns the columns of the daily summary of an observation type that
+        are used by getAggregateSeries()."""
+        if obs_type not in self.day_columns:
+            all_columns = self.connection.columnsOf('%s_day_%s' % (self.table_name, obs_type))
+            self.day_columns[obs_type] = [column for column in DaySummaryManager.series_columns 
+                                          if column in all_columns]
+        return self.day_columns[obs_type]
+
+    @staticmethod
+    def _aggregate_rows(aggregate_type, _rows, target_val=None):
+        """Returns what the query for an aggregation in sqlDict would return,
+        if it were run over the daily summary rows in _rows, which are
+        dictionaries in order of time."""
+
+        def values(column):
+            # The non-null values in a column, as the SQL aggregate functions see them
+            return [_row[column] for _row in _rows if _row[column] is not None]
+        def sql_min(column):
+            v = values(column)
+            return min(v) if v else None
+        def sql_max(column):
+            v = values(column)
+            return max(v) if v else None
+        def sql_sum(column):
+            v = values(column)
+            return sum(v) if v else None
+        def sql_avg(column):
+            v = values(column)
+            return sum(v) / float(len(v)) if v else None
+        def sql_time(column, target, time_column):
+            # The time of the first row whose column holds the target value
+            for _row in _rows:
+                if target is not None and _row[column] == target:
+                    return _row[time_column]
+            return None
+        def sql_count(column, test):
+            v = values(column)
+            return sum([1 for x in v if test(x)]) if v else None
+
+        if aggregate_type == 'min':
+            return (sql_min('min'),)
+        elif aggregate_type == 'minmax':
+            return (sql_min('max'),)
+        elif aggregate_type == 'max':
+            return (sql_max('max'),)
+        elif aggregate_type == 'maxmin':
+            return (sql_max('min'),)
+        elif aggregate_type == 'meanmin':
+            return (sql_avg('min'),)
+        elif aggregate_type == 'meanmax':
+            return (sql_avg('max'),)
+        elif aggregate_type == 'maxsum':
+            return (sql_max('sum'),)
+        elif aggregate_type == 'mintime':
+            return (sql_time('min', sql_min('min'), 'mintime'),)
+        elif aggregate_type == 'maxmintime':
+            return (sql_time('min', sql_max('min'), 'mintime'),)
+        elif aggregate_type == 'maxtime':
+            return (sql_time('max', sql_max('max'), 'maxtime'),)
+        elif aggregate_type == 'minmaxtime':
+            return (sql_time('max', sql_min('max'), 'maxtime'),)
+        elif aggregate_type == 'maxsumtime':
+            return (sql_time('sum', sql_max('sum'), 'maxtime'),)
+        elif aggregate_type == 'gustdir':
+            return (sql_time('max', sql_max('max'), 'max_dir'),)
+        elif aggregate_type == 'sum':
+            return (sql_sum('sum'),)
+        elif aggregate_type == 'count':
+            return (sql_sum('count'),)
+        elif aggregate_type == 'avg':
+            return (sql_sum('wsum'), sql_sum('sumtime'))
+        elif aggregate_type == 'rms':
+            return (sql_sum('wsquaresum'), sql_sum('sumtime'))
+        elif aggregate_type == 'vecavg':
+            return (sql_sum('xsum'), sql_sum('ysum'), sql_sum('dirsumtime'))
+        elif aggregate_type == 'vecdir':
+            return (sql_sum('xsum'), sql_sum('ysum'))
+        elif aggregate_type == 'max_ge':
+            return (sql_count('max', lambda x : x >= target_val),)
+        elif aggregate_type == 'max_le':
+            return (sql_count('max', lambda x : x <= target_val),)
+        elif aggregate_type == 'min_le':
+            return (sql_count('min', lambda x : x <= target_val),)
+        elif aggregate_type == 'sum_ge':
+            return (sql_count('sum', lambda x : x >= target_val),)
+        raise weewx.ViolatedPrecondition("Invalid aggregation type '%s'" % aggregate_type)
+
+    def _get_target_val(self, val):
+        """Convert the value used by aggregations such as 'max_ge' to the unit
+        system of the database."""
+        if val is None:
+            return None
+        # The following is for backwards compatibility when ValueTuples had
+        # just two members. This hack avoids breaking old skins.
+        if len(val) == 2:
+            if val[1] in ['degree_F', 'degree_C']:
+                val += ("group_temperature",)
+            elif val[1] in ['inch', 'mm', 'cm']:
+                val += ("group_rain",)
+        return weewx.units.convertStd(val, self.std_unit_system)[0]
+
+    def _use_day_summary(self, timespan):
+        """Returns True if aggregates over the timespan can be calculated from
+        the daily summaries."""
+        # We can use the day summary optimizations if the starting and ending times of
+        # the aggregation interval sit on midnight boundaries, or are the first or last
+        # records in the database.
+        return (weeutil.weeutil.isMidnight(timespan.start) or timespan.start == self.first_timestamp) and \
+               (weeutil.weeutil.isMidnight(timespan.stop)  or timespan.stop  == self.last_timestamp)
+
+    @staticmethod
+    def _calc_aggregate(aggregate_type, _row):
+        """Calculate an aggregate from the row returned by its query in sqlDict."""
+
         #=======================================================================
         # Each aggregation type requires a slightly different calculation.
         #=======================================================================
@@ -1223,10 +1677,7 @@ class DaySummaryManager(Manager):
             # Unknown aggregation. Return None
             _result = None
 
-        # Look up the unit type and group of this combination of stats type and aggregation:
-        (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
-        # Form the value tuple and return it:
-        return weewx.units.ValueTuple(_result, t, g)
+        return _result
         
     def exists(self, obs_type):
         """Checks whether the observation type exists in the database."""
@@ -1311,6 +1762,128 @@ class DaySummaryManager(Manager):
         return (nrecs, ndays)
 
 
+    def rebuild_day_summary(self, obs_types, start_ts=None, stop_ts=None,
+                            progress_fn=show_progress):
+        """Rebuild the daily summaries of some observation types from the
+        archive table, leaving the summaries of all other types alone. This is
+        useful after the archive values of a type have been changed.
+
+        obs_types: An iterable with the types to be rebuilt, such as
+        ['dewpoint', 'windchill'].
+
+        start_ts, stop_ts: The days that include these times will be rebuilt.
+        [Optional. Default is all days in the archive.]
+
+        progress_fn: This function will be called after processing every 1000 records.
+
+        returns: A 2-way tuple (nrecs, ndays) where
+          nrecs is the number of records used;
+          ndays is the number of days rebuilt
+        """
+        obs_types = [x for x in obs_types if x in self.daykeys]
+        if not obs_types:
+            return (0, 0)
+
+        # Whole days have to be rebuilt:
+        start_ts = weeutil.weeutil.startOfArchiveDay(start_ts) if start_ts else None
+        stop_ts = weeutil.weeutil.archiveDaySpan(stop_ts).stop if stop_ts else None
+
+        # The time of the last update does not change. If there is none, the
+        # daily summaries are empty, and a backfill will take care of them.
+        _lastUpdate = self._getLastUpdate()
+        if _lastUpdate is None:
+            return (0, 0)
+
+        nrecs = 0
+        ndays = 0
+        _day_accum = None
+        _sql_str = "SELECT dateTime, usUnits, `interval`, %s FROM %s WHERE dateTime > ? AND dateTime <= ? "\
+            "ORDER BY dateTime" % (','.join(obs_types), self.table_name)
+        _keys = ['dateTime', 'usUnits', 'interval'] + obs_types
+
+        with weedb.Transaction(self.connection) as _cursor:
+            for _row in self.genSql(_sql_str, (start_ts or 0, stop_ts or 0x7fffffff)):
+                _rec = dict(zip(_keys, _row))
+                _sod_ts = weeutil.weeutil.startOfArchiveDay(_rec['dateTime'])
+                if _day_accum is None or _day_accum.timespan.start != _sod_ts:
+                    if _day_accum is not None:
+                        self._set_day_summary(_day_accum, _lastUpdate, _cursor)
+                        ndays += 1
+                    # Start with empty statistics for the types being rebuilt:
+                    _day_accum = weewx.accum.Accum(weeutil.weeutil.archiveDaySpan(_sod_ts, 0))
+                    for _obs_type in obs_types:
+                        if _obs_type in self.quantile_widths:
+                            _day_accum[_obs_type] = weewx.accum.QuantileStats(self.quantile_widths[_obs_type])
+                        else:
+                            _day_accum.init_type(_obs_type)
+                _day_accum.addRecord(_rec)
+                nrecs += 1
+                if progress_fn and nrecs % 1000 == 0:
+                    progress_fn(nrecs, _rec['dateTime'])
+
+            if _day_accum is not None:
+                self._set_day_summary(_day_accum, _lastUpdate, _cursor)
+                ndays += 1
+
+        return (nrecs, ndays)
+
+    def add_quantile_sketch(self, obs_type, width):
+        """Add a quantile sketch to the daily summaries of an observation type,
+        then fill it in from the archive table.
+        
+        obs_type: The observation type, such as 'windSpeed'. It must be a
+        scalar.
+        
+        width: The width of each bin in the sketch, in the units of the
+        database. Quantiles will be accurate to within this width.
+        
+        returns: The number of days filled in."""
+        
+        if obs_type not in self.daykeys or obs_type == 'wind':
+            raise weewx.ViolatedPrecondition("No scalar daily summary for type '%s'" % obs_type)
+        if obs_type in self.quantile_widths:
+            raise weewx.ViolatedPrecondition("Type '%s' already has a quantile sketch" % obs_type)
+        width = float(width)
+        if width <= 0:
+            raise weewx.ViolatedPrecondition("Sketch bin width must be greater than zero")
+
+        ndays = 0
+        with weedb.Transaction(self.connection) as _cursor:
+            # Some databases commit before altering a table, so write the
+            # metadata first. Then the column and the metadata always agree.
+            quantile_widths = dict(self.quantile_widths)
+            quantile_widths[obs_type] = width
+            _cursor.execute(DaySummaryManager.meta_replace_str % self.table_name, 
+                            ('quantiles', ','.join(["%s:%r" % (k, quantile_widths[k]) for k in quantile_widths])))
+            # The column may be left over from an earlier attempt:
+            if 'sketch' not in self.connection.columnsOf('%s_day_%s' % (self.table_name, obs_type)):
+                _cursor.execute("ALTER TABLE %s_day_%s ADD COLUMN sketch TEXT" % (self.table_name, obs_type))
+
+            # Fill in the sketches in one pass through the archive. 
+            stats = None
+            for _row in self.genSql("SELECT dateTime, %s FROM %s WHERE %s IS NOT NULL ORDER BY dateTime" % 
+                                    (obs_type, self.table_name, obs_type)):
+                _sod_ts = weeutil.weeutil.startOfArchiveDay(_row[0])
+                if stats is None or _sod_ts != _day_start:
+                    if stats is not None:
+                        self._set_sketch(_cursor, obs_type, _day_start, stats)
+                        ndays += 1
+                    stats = weewx.accum.QuantileStats(width)
+                    _day_start = _sod_ts
+                stats.addSum(_row[1])
+            if stats is not None:
+                self._set_sketch(_cursor, obs_type, _day_start, stats)
+                ndays += 1
+        self.quantile_widths = quantile_widths
+
+        syslog.syslog(syslog.LOG_INFO, "manager: Added quantile sketch with bin width %s to type '%s' (%d days)" %
+                      (width, obs_type, ndays))
+        return ndays
+
+    def _set_sketch(self, cursor, obs_type, sod_ts, stats):
+        cursor.execute("UPDATE %s_day_%s SET sketch = ? WHERE dateTime = ?" % (self.table_name, obs_type),
+                       (weewx.accum.format_sketch(stats.width, stats.hist), sod_ts))
+
     #--------------------------- UTILITY FUNCTIONS -----------------------------------
 
     def _get_day_summary(self, sod_ts, cursor=None):
@@ -1323,6 +1896,9 @@ class DaySummaryManager(Manager):
 
         # Get an empty day accumulator:
         _day_accum = weewx.accum.Accum(_timespan)
+        # Types with a quantile sketch need a special kind of statistics:
+        for _obs_type in self.quantile_widths:
+            _day_accum[_obs_type] = weewx.accum.QuantileStats(self.quantile_widths[_obs_type])
         
         _cursor = cursor or self.connection.cursor()
 
@@ -21,10 +21,16 @@ import traceback
 
 # 3rd party imports:
 import configobj
+try:
+    import multiprocessing
+except ImportError:
+    # Python 2.5
+    multiprocessing = None
 
 # Weewx imports:
 import weeutil.weeutil
 from weeutil.weeutil import to_bool
+import weewx.loopbuffer
 import weewx.manager
 
 #===============================================================================
@@ -175,6 +181,63 @@ class ReportGenerator(object):
     def finalize(self):
         self.db_binder.close()
 
+def run_jobs(generator, method_name, jobs, worker_count=1):
+    """Call a method of a report generator for each of a list of jobs, and
+    return the results, in the same order as the jobs.
+    
+    generator: The report generator.
+    
+    method_name: The name of the method to call.
+    
+    jobs: A list of tuples. The method is called with each tuple as its
+    arguments.
+    
+    If worker_count is more than one, the jobs are shared out among that many
+    worker processes. Workers are forked from this process, so each starts
+    with a copy of the generator, but nothing they change is seen here. Each
+    worker opens its own database connections, rather than sharing the ones
+    the generator has open. The jobs and their results must be picklable.
+    
+    Otherwise, or if module multiprocessing is not available, the jobs are
+    run in this process, one after another."""
+    if worker_count > 1 and len(jobs) > 1 and multiprocessing is not None:
+        # The workers are forked from this thread, while the engine thread
+        # keeps adding LOOP packets to the buffer. Give them a copy of it, so
+        # they do not inherit its lock held.
+        loop_buffer = weewx.loopbuffer.loop_buffer
+        if loop_buffer is not None:
+            loop_buffer = loop_buffer.copy()
+        pool = multiprocessing.Pool(min(worker_count, len(jobs)), _init_worker,
+                                    (generator, method_name, loop_buffer))
+        try:
+            results = pool.map(_run_job, jobs, chunksize=1)
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+        return results
+    method = getattr(generator, method_name)
+    return [method(*job) for job in jobs]
+
+# In a worker process started by run_jobs(), the copy of the generator, and
+# the method to be called:
+_worker_generator = None
+_worker_method = None
+
+def _init_worker(generator, method_name, loop_buffer):
+    global _worker_generator, _worker_method
+    weewx.loopbuffer.loop_buffer = loop_buffer
+    generator.db_binder = weewx.manager.DBBinder(generator.config_dict['DataBindings'],
+                                                 generator.config_dict['Databases'])
+    _worker_generator = generator
+    _worker_method = getattr(generator, method_name)
+
+def _run_job(job):
+    return _worker_method(*job)
+
 #===============================================================================
 #                    Class FtpGenerator
 #===============================================================================
@@ -0,0 +1,206 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Monitor the resources used by weewx itself.
+
+The service StdResourceMonitor samples the memory, CPU, thread, and file
+descriptor use of the weewxd process, the state of the garbage collector, and
+the backlog of the RESTful and report threads. All of it is read from within
+the process (from /proc on Linux), so no external programs are run.
+
+The samples are stored in a database of their own, with the schema
+schemas.resmon.schema. They are buffered in memory, then written in a single
+transaction when the next archive record arrives. Because the database is an
+ordinary weewx database, memory growth can be charted with the image
+generator and the tag system, like any other observation.
+
+To use it, add the service to weewx.conf:
+
+    [Engine]
+        [[Services]]
+            archive_services = weewx.engine.StdArchive, weewx.resmon.StdResourceMonitor
+
+The options are in section [StdResourceMonitor]:
+
+    [StdResourceMonitor]
+        data_binding = resmon_binding
+        # How often to take a sample, in seconds:
+        sample_interval = 60
+        # How long to keep the samples, in seconds. They are deleted a day at a
+        # time. Default is forever:
+        # max_age = 31536000
+        # Counting the objects tracked by the garbage collector takes a few
+        # milliseconds. Set to False to skip it.
+        count_objects = True
+"""
+
+from __future__ import with_statement
+import gc
+import os
+import syslog
+import threading
+import time
+
+import weedb
+import weewx
+import weewx.engine
+import weeutil.weeutil
+from weeutil.weeutil import to_bool, to_int
+
+# Where the Linux kernel keeps the statistics of the current process:
+_statm_path = '/proc/self/statm'
+_stat_path  = '/proc/self/stat'
+_fd_path    = '/proc/self/fd'
+
+#==============================================================================
+#                    Class StdResourceMonitor
+#==============================================================================
+
+class StdResourceMonitor(weewx.engine.StdService):
+    """Service that samples the resources used by the weewx process."""
+
+    config_sections = ['StdResourceMonitor']
+
+    def __init__(self, engine, config_dict):
+        super(StdResourceMonitor, self).__init__(engine, config_dict)
+
+        resmon_dict = config_dict.get('StdResourceMonitor', {})
+        self.data_binding    = resmon_dict.get('data_binding', 'resmon_binding')
+        self.sample_interval = to_int(resmon_dict.get('sample_interval', 60))
+        self.max_age         = to_int(resmon_dict.get('max_age', None))
+        self.count_objects   = to_bool(resmon_dict.get('count_objects', True))
+
+        self.page_mb  = os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+        self.clk_tck  = float(os.sysconf('SC_CLK_TCK'))
+        self.has_proc = os.path.exists(_statm_path)
+        if not self.has_proc:
+            syslog.syslog(syslog.LOG_INFO, "resmon: %s not available. Memory use will not be recorded." % _statm_path)
+
+        # Make sure the database exists
+        self.engine.db_binder.get_manager(self.data_binding, initialize=True)
+
+        # Samples waiting to be written to the database:
+        self.samples = []
+        self.last_sample = None
+        self.last_prune_ts = 0
+
+        syslog.syslog(syslog.LOG_INFO, "resmon: Sampling resource use every %d seconds using binding '%s'" %
+                      (self.sample_interval, self.data_binding))
+
+        self.bind(weewx.NEW_LOOP_PACKET, self.new_loop_packet)
+        self.bind(weewx.NEW_ARCHIVE_RECORD, self.new_archive_record)
+
+    def new_loop_packet(self, event):
+        """Take a sample, if it is time to do so."""
+        now = time.time()
+        if self.last_sample is None or now - self.last_sample[0] >= self.sample_interval:
+            self.take_sample(now)
+
+    def new_archive_record(self, event):
+        """Write any samples taken since the last archive record."""
+        self.flush()
+        if self.max_age and event.record['dateTime'] - self.last_prune_ts >= 86400:
+            self.prune(event.record['dateTime'] - self.max_age)
+            self.last_prune_ts = event.record['dateTime']
+
+    def shutDown(self):
+        try:
+            self.flush()
+        except Exception, e:
+            syslog.syslog(syslog.LOG_ERR, "resmon: Unable to save resource samples: %s" % e)
+
+    def take_sample(self, now=None):
+        """Sample the resources in use, and add the results to the list of
+        samples waiting to be written."""
+        if now is None:
+            now = time.time()
+        record = {'dateTime' : int(now + 0.5),
+                  'usUnits'  : weewx.METRIC,
+                  'interval' : max(self.sample_interval / 60, 1)}
+
+        (cpu_user, cpu_system) = self._get_proc(record)
+        if self.last_sample is not None:
+            elapsed = now - self.last_sample[0]
+            if elapsed > 0:
+                record['cpu_user']   = 100.0 * (cpu_user   - self.last_sample[1]) / elapsed
+                record['cpu_system'] = 100.0 * (cpu_system - self.last_sample[2]) / elapsed
+        self.last_sample = (now, cpu_user, cpu_system)
+
+        (record['gc_gen0'], record['gc_gen1'], record['gc_gen2']) = gc.get_count()
+        if self.count_objects:
+            record['gc_objects'] = len(gc.get_objects())
+
+        self._get_queues(record)
+
+        self.samples.append(record)
+        return record
+
+    def flush(self):
+        """Write any waiting samples to the database, in a single
+        transaction."""
+        if self.samples:
+            dbmanager = self.engine.db_binder.get_manager(self.data_binding)
+            dbmanager.addRecord(self.samples, log_level=syslog.LOG_DEBUG)
+            self.samples = []
+
+    def prune(self, ts):
+        """Delete any samples from days that started before ts, along with the
+        daily summaries of those days. Whole days are deleted, so the daily
+        summaries that are left agree with the samples."""
+        sod_ts = weeutil.weeutil.startOfDay(ts)
+        dbmanager = self.engine.db_binder.get_manager(self.data_binding)
+        with weedb.Transaction(dbmanager.connection) as cursor:
+            cursor.execute("DELETE FROM %s WHERE dateTime < ?" % dbmanager.table_name, (sod_ts,))
+            for obs_type in getattr(dbmanager, 'daykeys', []):
+                cursor.execute("DELETE FROM %s_day_%s WHERE dateTime < ?" % (dbmanager.table_name, obs_type),
+                               (sod_ts,))
+        # The manager caches the time of the first record:
+        dbmanager.first_timestamp = dbmanager.firstGoodStamp()
+        syslog.syslog(syslog.LOG_DEBUG, "resmon: Deleted samples older than %s" %
+                      weeutil.weeutil.timestamp_to_string(sod_ts))
+
+    def _get_proc(self, record):
+        """Fill in the memory, thread, and file descriptor use. Returns the
+        total CPU time used so far, as a tuple (user, system), in seconds."""
+        if not self.has_proc:
+            (cpu_user, cpu_system) = os.times()[:2]
+            record['threads'] = threading.active_count()
+            return (cpu_user, cpu_system)
+
+        with open(_statm_path) as f:
+            statm = f.read().split()
+        record['mem_vsz']   = int(statm[0]) * self.page_mb
+        record['mem_rss']   = int(statm[1]) * self.page_mb
+        record['mem_share'] = int(statm[2]) * self.page_mb
+        record['mem_data']  = int(statm[5]) * self.page_mb
+
+        with open(_stat_path) as f:
+            stat = f.read()
+        # The name of the program is in parentheses and may hold spaces, so
+        # start after it. The fields are numbered as in proc(5), less 3:
+        fields = stat[stat.rfind(')') + 2:].split()
+        record['threads'] = int(fields[17])
+
+        # The listing itself uses one file descriptor:
+        record['open_fds'] = len(os.listdir(_fd_path)) - 1
+
+        return (int(fields[11]) / self.clk_tck, int(fields[12]) / self.clk_tck)
+
+    def _get_queues(self, record):
+        """Fill in the backlog of the RESTful and report threads."""
+        loop_queue = archive_queue = 0
+        report_running = 0
+        for obj in self.engine.service_obj:
+            if getattr(obj, 'loop_queue', None) is not None:
+                loop_queue += obj.loop_queue.qsize()
+            if getattr(obj, 'archive_queue', None) is not None:
+                archive_queue += obj.archive_queue.qsize()
+            if isinstance(obj, weewx.engine.StdReport) and obj.thread and obj.thread.isAlive():
+                report_running = 1
+        record['restful_loop_queue']    = loop_queue
+        record['restful_archive_queue'] = archive_queue
+        record['report_running']        = report_running
@@ -110,6 +110,10 @@ class StdRESTful(weewx.engine.StdService):
     """Abstract base class for RESTful weewx services.
     
     Offers a few common bits of functionality."""
+
+    # The RESTful services inherit options from the [StdRESTful] section, so
+    # any change in it restarts them all.
+    config_sections = ['StdRESTful']
         
     def shutDown(self):
         """Shut down any threads"""
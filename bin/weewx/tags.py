@@ -118,6 +118,28 @@ class TimeBinder(object):
                               context='rainyear',  formatter=self.formatter, converter=self.converter, 
                               **self.option_dict)
 
+    def prefetch(self, tags):
+        """Fetch, in batches, aggregates that will be asked for later.
+        
+        tags: An iterable of (span, obs_type, aggregate_type) tuples, such as
+        ('month', 'outTemp', 'max') for the tag $month.outTemp.max. The span
+        must be one of the attributes above that take no arguments.
+        
+        The results are kept by the manager of the default binding. This does
+        nothing unless it is a CachingManager."""
+        manager = self.db_lookup()
+        if not hasattr(manager, 'prefetch'):
+            return
+        wanted = {}
+        for (span, obs_type, aggregate_type) in tags:
+            # Skip things like $day.outTemp.has_data, which are not aggregates
+            if hasattr(ObservationBinder, aggregate_type):
+                continue
+            wanted.setdefault((span, obs_type), set()).add(aggregate_type)
+        for ((span, obs_type), aggregate_types) in wanted.iteritems():
+            timespan = getattr(self, span)().timespan
+            manager.prefetch(timespan, obs_type, aggregate_types, **self.option_dict)
+
 
 #===============================================================================
 #                    Class TimespanBinder
@@ -143,7 +165,7 @@ class TimespanBinder(object):
     """
     def __init__(self, timespan, db_lookup, data_binding=None, context='current',
                  formatter=weewx.units.Formatter(),
-                 converter=weewx.units.Converter(), **option_dict):
+                 converter=weewx.units.Converter(), series=None, **option_dict):
         """Initialize an instance of TimespanBinder.
 
         timespan: An instance of weeutil.Timespan with the time span
@@ -167,6 +189,10 @@ class TimespanBinder(object):
         information to be used. [Optional. If not given, the default
         Converter will be used.]
 
+        series: If the timespan is one of a sequence being iterated over, such
+        as the days of a month, a list of all the timespans in the sequence.
+        [Optional.]
+
         option_dict: Other options which can be used to customize calculations.
         [Optional.]
         """
@@ -177,6 +203,7 @@ class TimespanBinder(object):
         self.context     = context
         self.formatter   = formatter
         self.converter   = converter
+        self.series      = series
         self.option_dict = option_dict
 
     # Iterate over days in the time period:
@@ -201,8 +228,11 @@ class TimespanBinder(object):
     @staticmethod
     def _seqGenerator(genSpanFunc, timespan, *args, **option_dict):
         """Generator function that returns TimespanBinder for the appropriate timespans"""
-        for span in genSpanFunc(timespan.start, timespan.stop):
-            yield TimespanBinder(span, *args, **option_dict)
+        # Each TimespanBinder is told about the whole sequence, so aggregates
+        # can be fetched for all of them at once:
+        series = list(genSpanFunc(timespan.start, timespan.stop))
+        for span in series:
+            yield TimespanBinder(span, *args, series=series, **option_dict)
 
     # Return the start time of the time period as a ValueHelper
     @property
@@ -225,7 +255,7 @@ class TimespanBinder(object):
         # Return an ObservationBinder: if an attribute is
         # requested from it, an aggregation value will be returned.
         return ObservationBinder(obs_type, self.timespan, self.db_lookup, self.data_binding, self.context,
-                                 self.formatter, self.converter, **self.option_dict)
+                                 self.formatter, self.converter, self.series, **self.option_dict)
 
 #===============================================================================
 #                    Class ObservationBinder
@@ -240,7 +270,7 @@ class ObservationBinder(object):
     """
 
     def __init__(self, obs_type, timespan, db_lookup, data_binding, context,
-                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(), **option_dict):
+                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(), series=None, **option_dict):
         """ Initialize an instance of ObservationBinder
 
         obs_type: A string with the stats type (e.g., 'outTemp') for which the query is
@@ -266,6 +296,9 @@ class ObservationBinder(object):
         information to be used. [Optional. If not given, the default
         Converter will be used.]
 
+        series: A list of timespans, if the timespan is one of a sequence
+        being iterated over. [Optional.]
+
         option_dict: Other options which can be used to customize calculations.
         [Optional.]
         """
@@ -277,6 +310,7 @@ class ObservationBinder(object):
         self.context      = context
         self.formatter    = formatter
         self.converter    = converter
+        self.series       = series
         self.option_dict  = option_dict
 
     def max_ge(self, val):
@@ -320,6 +354,10 @@ class ObservationBinder(object):
     def _do_query(self, aggregate_type, val=None):
         """Run a query against the databases, using the given aggregation type."""
         db_manager = self.db_lookup(self.data_binding)
+        if self.series is not None and hasattr(db_manager, 'prefetch_series'):
+            # Fetch the aggregate for the whole sequence at once
+            db_manager.prefetch_series(self.series, self.obs_type, aggregate_type,
+                                       val=val, **self.option_dict)
         result = db_manager.getAggregate(self.timespan, self.obs_type, aggregate_type, 
                                          val=val, **self.option_dict)
         return weewx.units.ValueHelper(result, self.context, self.formatter, self.converter)
@@ -440,3 +478,111 @@ class TrendObj(object):
         return weewx.units.ValueHelper(trend, 'current',
                                        self.formatter,
                                        self.converter)
+
+#===============================================================================
+#                             Class LoopBinder
+#===============================================================================
+
+class LoopBinder(object):
+    """Helper class for statistics over recent LOOP packets, held in an
+    instance of weewx.loopbuffer.LoopBuffer. No database is used.
+    
+    This class allows tags such as:
+      $loop.minutes(10).windGust.max
+      $loop.latest.outTemp
+    
+    The windows end with the newest packet in the buffer.
+    """
+    
+    def __init__(self, loop_buffer, formatter, converter):
+        """Initialize a LoopBinder.
+        
+        loop_buffer: An instance of weewx.loopbuffer.LoopBuffer, or None if
+        there is no buffer. In that case, all values are None."""
+        self.loop_buffer = loop_buffer
+        self.formatter   = formatter
+        self.converter   = converter
+
+    def seconds(self, seconds):
+        return LoopSpanBinder(self.loop_buffer, seconds, self.formatter, self.converter)
+    def minutes(self, minutes):
+        return self.seconds(minutes * 60)
+    def hours(self, hours):
+        return self.seconds(hours * 3600)
+
+    @property
+    def latest(self):
+        """The latest value of each observation type."""
+        return LoopLatestBinder(self.loop_buffer, self.formatter, self.converter)
+
+class LoopSpanBinder(object):
+    """Binds a LOOP buffer and a window of time. Returns a
+    LoopObservationBinder when an observation type is given as an
+    attribute."""
+    
+    def __init__(self, loop_buffer, seconds, formatter, converter):
+        self.loop_buffer = loop_buffer
+        self.seconds     = seconds
+        self.formatter   = formatter
+        self.converter   = converter
+        
+    def __getattr__(self, obs_type):
+        # This is to get around bugs in the Python version of Cheetah's namemapper:
+        if obs_type in ['__call__', 'has_key']:
+            raise AttributeError
+        return LoopObservationBinder(obs_type, self.loop_buffer, self.seconds, 
+                                     self.formatter, self.converter)
+
+class LoopObservationBinder(object):
+    """Binds a LOOP buffer, a window of time, and an observation type. When an
+    aggregation type (eg, 'max') is given as an attribute, returns the
+    aggregate as a ValueHelper."""
+
+    def __init__(self, obs_type, loop_buffer, seconds, formatter, converter):
+        self.obs_type    = obs_type
+        self.loop_buffer = loop_buffer
+        self.seconds     = seconds
+        self.formatter   = formatter
+        self.converter   = converter
+
+    @property
+    def has_data(self):
+        return self.loop_buffer is not None and self.__getattr__('count').raw > 0
+
+    def __getattr__(self, aggregate_type):
+        # This is to get around bugs in the Python version of Cheetah's namemapper:
+        if aggregate_type in ['__call__', 'has_key']:
+            raise AttributeError
+        if self.loop_buffer is None:
+            vt = ValueTuple(None, None, None)
+        else:
+            last_ts = self.loop_buffer.last_ts
+            start_ts = last_ts - self.seconds if last_ts is not None else None
+            vt = self.loop_buffer.aggregate(self.obs_type, aggregate_type, start_ts)
+        return weewx.units.ValueHelper(vt, 'current', self.formatter, self.converter)
+
+class LoopLatestBinder(object):
+    """Returns the latest value of an observation type in a LOOP buffer."""
+
+    def __init__(self, loop_buffer, formatter, converter):
+        self.loop_buffer = loop_buffer
+        self.formatter   = formatter
+        self.converter   = converter
+
+    @property
+    def dateTime(self):
+        ts = self.loop_buffer.last_ts if self.loop_buffer is not None else None
+        if ts is not None:
+            ts = int(ts)
+        return weewx.units.ValueHelper(ValueTuple(ts, 'unix_epoch', 'group_time'), 'current',
+                                       self.formatter, self.converter)
+
+    def __getattr__(self, obs_type):
+        # This is to get around bugs in the Python version of Cheetah's namemapper:
+        if obs_type in ['__call__', 'has_key']:
+            raise AttributeError
+        if self.loop_buffer is None:
+            vt = ValueTuple(None, None, None)
+        else:
+            vt = self.loop_buffer.latest(obs_type)
+        return weewx.units.ValueHelper(vt, 'current', self.formatter, self.converter)
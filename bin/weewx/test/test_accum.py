@@ -9,6 +9,7 @@
 import time
 import unittest
 
+import weeutil.weeutil
 import weewx.accum
 from gen_fake_data import genFakeRecords
 
@@ -66,7 +67,49 @@ class AccumTest(unittest.TestCase):
         
         self.assertEqual(ss.sum, 2*tsum)
         self.assertEqual(ss.count, 2*tcount)
-        
+
+    def test_accum_key_sets(self):
+
+        accum = weewx.accum.Accum(weeutil.weeutil.TimeSpan(start_ts - 1, stop_ts))
+        tsum = tcount = 0
+        for (i, record) in enumerate(self.dataset):
+            # Alternate between full and partial records, so more than one
+            # dispatch plan is used:
+            if i % 2:
+                record = {'dateTime' : record['dateTime'], 'usUnits' : record['usUnits'],
+                          'outTemp'  : record['outTemp']}
+            else:
+                # Extending the dispatch dictionary must be noticed:
+                weewx.accum.add_record_dict.extend({})
+            accum.addRecord(record)
+            if record['outTemp'] is not None:
+                tsum += record['outTemp']
+                tcount += 1
+
+        self.assertEqual(accum['outTemp'].count, tcount)
+        self.assertEqual(accum['outTemp'].sum, tsum)
+        self.assertEqual(accum['barometer'].count,
+                         len([r for r in self.dataset[::2] if r['barometer'] is not None]))
+        self.assertEqual(accum['wind'].count, accum['windSpeed'].count)
+        self.assertFalse(hasattr(accum['outTemp'], '__dict__'))
+
+    def test_accum_replace_handler(self):
+
+        accum = weewx.accum.Accum(weeutil.weeutil.TimeSpan(start_ts - 1, stop_ts))
+        weewx.accum.add_record_dict['outTemp'] = weewx.accum.Accum.add_value
+        try:
+            accum.addRecord(self.dataset[0])
+            # Replacing the handler of a type must be noticed, even though the
+            # dictionary stays the same size:
+            weewx.accum.add_record_dict['outTemp'] = weewx.accum.Accum.noop
+            accum.addRecord(self.dataset[1])
+            self.assertEqual(accum['outTemp'].count, 1 if self.dataset[0]['outTemp'] is not None else 0)
+        finally:
+            del weewx.accum.add_record_dict['outTemp']
+        accum.addRecord(self.dataset[2])
+        self.assertEqual(accum['outTemp'].count,
+                         len([r for r in (self.dataset[0], self.dataset[2]) if r['outTemp'] is not None]))
+
 if __name__ == '__main__':
     unittest.main()
             
@@ -0,0 +1,138 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Test modules weewx.capture and weewx.drivers.replay"""
+from __future__ import with_statement
+import os
+import shutil
+import tempfile
+import unittest
+
+import weewx
+import weewx.capture
+import weewx.drivers.replay
+from weewx.capture import LOOP, HARDWARE, SOFTWARE
+
+start_ts = 1420070400
+
+def loop_packet(ts):
+    return {'dateTime' : ts, 'usUnits' : weewx.US, 'outTemp' : 20.0 + (ts - start_ts) / 60.0,
+            'windDir' : None}
+
+def archive_record(ts, interval=5):
+    return {'dateTime' : ts, 'usUnits' : weewx.US, 'interval' : interval, 'outTemp' : 21.5}
+
+class CaptureFileTestCase(unittest.TestCase):
+    """Sets up a scratch directory for a capture file."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'sub', 'weewx.capture')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, entries):
+        writer = weewx.capture.CaptureWriter(self.path)
+        for (kind, record) in entries:
+            writer.write(kind, record)
+        writer.close()
+
+class CaptureTest(CaptureFileTestCase):
+
+    def test_round_trip(self):
+        entries = [(LOOP, loop_packet(start_ts)),
+                   (LOOP, loop_packet(start_ts + 150)),
+                   (HARDWARE, archive_record(start_ts + 300)),
+                   (SOFTWARE, archive_record(start_ts + 300))]
+        self.write(entries[:2])
+        # A second writer appends to the same file:
+        self.write(entries[2:])
+        self.assertEqual(list(weewx.capture.genCapture(self.path)), entries)
+        self.assertEqual(list(weewx.capture.genCapture(self.path, payload=False)),
+                         [(kind, None) for (kind, _) in entries])
+
+    def test_truncated(self):
+        entries = [(LOOP, loop_packet(start_ts)),
+                   (HARDWARE, archive_record(start_ts + 300))]
+        self.write(entries[:1])
+        good_size = os.path.getsize(self.path)
+        self.write(entries[1:])
+        # Chop the last entry in the middle of its payload, then in the
+        # middle of its header:
+        for size in (os.path.getsize(self.path) - 5, good_size + 2):
+            with open(self.path, 'r+b') as f:
+                f.truncate(size)
+            self.assertEqual(list(weewx.capture.genCapture(self.path)), entries[:1])
+        self.assertEqual(len(list(weewx.capture.genCapture(self.path, payload=False))), 1)
+
+    def test_not_capture(self):
+        os.mkdir(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('something else entirely')
+        self.assertRaises(weewx.ViolatedPrecondition, list, weewx.capture.genCapture(self.path))
+
+class ReplayTest(CaptureFileTestCase):
+
+    def test_replay(self):
+        # Two archive periods of LOOP packets, each followed by the archive
+        # record the hardware made for it:
+        entries = []
+        for period in range(2):
+            for i in range(1, 11):
+                entries.append((LOOP, loop_packet(start_ts + period * 300 + i * 30)))
+            entries.append((HARDWARE, archive_record(start_ts + (period + 1) * 300)))
+            entries.append((SOFTWARE, archive_record(start_ts + (period + 1) * 300)))
+        self.write(entries)
+
+        station = weewx.drivers.replay.Replay(capture_file=self.path, speed=0)
+        self.assertTrue(station.has_archive)
+        self.assertEqual(station.archive_interval, 300)
+        self.assertEqual(station.getTime(), start_ts + 30)
+
+        # Do what the engine does: at the end of each archive period, ask
+        # for the records since the last good one.
+        seen = []
+        lastgood_ts = start_ts
+        try:
+            for packet in station.genLoopPackets():
+                seen.append((LOOP, packet))
+                self.assertEqual(station.getTime(), packet['dateTime'])
+                if packet['dateTime'] % 300 == 0:
+                    for record in station.genArchiveRecords(lastgood_ts):
+                        seen.append((HARDWARE, record))
+                        lastgood_ts = record['dateTime']
+        except weewx.StopNow:
+            pass
+        self.assertEqual(seen, [entry for entry in entries if entry[0] != SOFTWARE])
+
+    def test_archive_records(self):
+        self.write([(LOOP, loop_packet(start_ts + 150)),
+                    (HARDWARE, archive_record(start_ts)),
+                    (HARDWARE, archive_record(start_ts + 300)),
+                    (LOOP, loop_packet(start_ts + 450))])
+        station = weewx.drivers.replay.Replay(capture_file=self.path, speed=0)
+        packets = station.genLoopPackets()
+        packets.next()
+        # Records no newer than lastgood_ts are skipped:
+        self.assertEqual(list(station.genArchiveRecords(start_ts)), [archive_record(start_ts + 300)])
+        # They have been used up, and the next LOOP packet is still there:
+        self.assertEqual(list(station.genArchiveRecords(start_ts)), [])
+        self.assertEqual(packets.next(), loop_packet(start_ts + 450))
+        self.assertRaises(weewx.StopNow, packets.next)
+
+    def test_no_archive(self):
+        self.write([(LOOP, loop_packet(start_ts)),
+                    (SOFTWARE, archive_record(start_ts + 300))])
+        station = weewx.drivers.replay.Replay(capture_file=self.path, speed=0)
+        self.assertFalse(station.has_archive)
+        self.assertRaises(NotImplementedError, list, station.genArchiveRecords(0))
+        self.assertRaises(NotImplementedError, getattr, station, 'archive_interval')
+        self.assertEqual(station.genLoopPackets().next(), loop_packet(start_ts))
+
+if __name__ == '__main__':
+    unittest.main()
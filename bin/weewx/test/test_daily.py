@@ -21,8 +21,12 @@ import configobj
 
 os.environ['TZ'] = 'America/Los_Angeles'
 
+import weedb
 import weeutil.weeutil
+import weewx.manager
 import weewx.tags
+import weewx.wxformulas
+import weewx.wxservices
 import gen_fake_data
 from weewx.units import ValueHelper
 
@@ -283,6 +287,184 @@ class Common(unittest.TestCase):
                     self.assertEqual(str(table_answer), str(daily_answer), 
                                      msg="aggregation=%s; %s vs %s" % (aggregation, table_answer, daily_answer))
             
+    def test_prefetch(self):
+        """Test batched aggregates against one at a time"""
+        month_span = weeutil.weeutil.TimeSpan(time.mktime((2010,3,1,0,0,0,0,0,-1)),
+                                              time.mktime((2010,4,1,0,0,0,0,0,-1)))
+        aggregations = ['min', 'max', 'meanmax', 'sum', 'count', 'avg', 'mintime', 'p90']
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            results = manager.getAggregates(month_span, 'outTemp', aggregations)
+            for aggregation in aggregations:
+                self.assertEqual(results[aggregation], manager.getAggregate(month_span, 'outTemp', aggregation),
+                                 msg="aggregation=%s" % aggregation)
+
+        # Prefetched aggregates are answered by the cache:
+        db_binder = weewx.manager.DBBinder(self.config_dict['DataBindings'], 
+                                           self.config_dict['Databases'])
+        db_lookup = db_binder.bind_default(cached=True)
+        tagStats = weewx.tags.TimeBinder(db_lookup, month_span.stop - 1, skin_dict=skin_dict)
+        tagStats.prefetch([('month', 'outTemp', 'max'), ('month', 'outTemp', 'avg'), ('month', 'fooTemp', 'max')])
+        cache = db_lookup().aggregate_cache
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(str(tagStats.month().outTemp.max), str(ValueHelper(results['max'])))
+        self.assertEqual(len(cache), 2)
+        self.assertRaises(AttributeError, getattr, tagStats.month().fooTemp, 'max')
+        db_binder.close()
+
+    def test_series(self):
+        """Test aggregates over a series of timespans against one timespan at a time"""
+        year_start_ts = time.mktime((2010,1,1,0,0,0,0,0,-1))
+        year_stop_ts  = time.mktime((2011,1,1,0,0,0,0,0,-1))
+        march_start_ts = time.mktime((2010,3,1,0,0,0,0,0,-1))
+        april_start_ts = time.mktime((2010,4,1,0,0,0,0,0,-1))
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            for (spans, obs_type, aggregations, val) in [
+                    (weeutil.weeutil.genMonthSpans(year_start_ts, year_stop_ts), 'outTemp', 
+                     ['min', 'mintime', 'max', 'maxtime', 'meanmin', 'meanmax', 'avg', 'count', 'max_ge'], (90, 'degree_F')),
+                    (weeutil.weeutil.genDaySpans(march_start_ts, april_start_ts), 'wind', 
+                     ['max', 'maxtime', 'gustdir', 'avg', 'rms', 'vecavg', 'vecdir'], None),
+                    (weeutil.weeutil.genMonthSpans(year_start_ts, year_stop_ts), 'rain', 
+                     ['sum', 'maxsum', 'maxsumtime', 'sum_ge'], (0.1, 'inch', 'group_rain'))]:
+                spans = list(spans)
+                series = manager.getAggregateSeries(spans, obs_type, aggregations, val=val)
+                self.assertEqual(len(series), len(spans))
+                for (span, results) in zip(spans, series):
+                    for aggregation in aggregations:
+                        expected = manager.getAggregate(span, obs_type, aggregation, val=val)
+                        self.assertEqual(results[aggregation][1:], expected[1:])
+                        if expected[0] is None:
+                            self.assertEqual(results[aggregation][0], None)
+                        else:
+                            self.assertAlmostEqual(results[aggregation][0], expected[0], 6, 
+                                                   msg="%s.%s over %s" % (obs_type, aggregation, span))
+
+        # Iterating over the months of the year fetches them all at once:
+        db_binder = weewx.manager.DBBinder(self.config_dict['DataBindings'], 
+                                           self.config_dict['Databases'])
+        db_lookup = db_binder.bind_default(cached=True)
+        yearStats = weewx.tags.TimespanBinder(weeutil.weeutil.TimeSpan(year_start_ts, year_stop_ts), db_lookup)
+        maxes = [str(monthStats.outTemp.max) for monthStats in yearStats.months()]
+        self.assertEqual(maxes[2], str(weewx.tags.TimespanBinder(weeutil.weeutil.TimeSpan(march_start_ts, april_start_ts), 
+                                                                  db_binder.bind_default()).outTemp.max))
+        # ... along with the other aggregates calculated from the same query:
+        for span in weeutil.weeutil.genMonthSpans(year_start_ts, year_stop_ts):
+            self.assertTrue((span.start, span.stop, 'outTemp', 'min', None) in db_lookup().aggregate_cache)
+        db_binder.close()
+
+    def test_record_cache(self):
+        """Test that records are fetched once per report run"""
+        db_binder = weewx.manager.DBBinder(self.config_dict['DataBindings'], 
+                                           self.config_dict['Databases'])
+        now_ts = time.mktime((2010,3,15,12,0,0,0,0,-1))
+        trend_dict = skin_dict['Units']['Trend']
+        tagStats = weewx.tags.TimeBinder(db_binder.bind_default(cached=True), now_ts, trend=trend_dict)
+        uncached = weewx.tags.TimeBinder(db_binder.bind_default(), now_ts, trend=trend_dict)
+        for obs_type in ['outTemp', 'barometer', 'windSpeed']:
+            self.assertEqual(str(getattr(tagStats.current(), obs_type)), str(getattr(uncached.current(), obs_type)))
+            self.assertEqual(str(getattr(tagStats.trend(), obs_type)), str(getattr(uncached.trend(), obs_type)))
+        # One record for $current, two for $trend:
+        self.assertEqual(len(db_binder.get_cached_manager().record_cache), 3)
+        db_binder.close()
+
+    def test_quantiles(self):
+        """Test quantiles from the sketches against quantiles from the archive table"""
+
+        month_span = weeutil.weeutil.TimeSpan(time.mktime((2010,3,1,0,0,0,0,0,-1)),
+                                              time.mktime((2010,4,1,0,0,0,0,0,-1)))
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            records = [record for record in manager.genBatchRecords(month_span.start, month_span.stop)]
+
+        # Adding a sketch changes the schema of the daily summaries, so use a
+        # scratch database. Half the records are there before the sketch is
+        # added, and half are added afterwards.
+        manager_dict = self._get_scratch_manager_dict()
+        with weewx.manager.open_manager(manager_dict, initialize=True) as manager:
+            manager.addRecord(records[:len(records) / 2])
+            manager.add_quantile_sketch('outTemp', 0.1)
+            self.assertEqual(manager.quantile_widths['outTemp'], 0.1)
+            manager.addRecord(records[len(records) / 2:])
+            for aggregation in ['p10', 'median', 'p90']:
+                table_answer = weewx.manager.Manager.getAggregate(manager, month_span, 'outTemp', aggregation)
+                daily_answer = manager.getAggregate(month_span, 'outTemp', aggregation)
+                self.assertEqual(daily_answer[1:], ('degree_F', 'group_temperature'))
+                self.assertAlmostEqual(table_answer[0], daily_answer[0], delta=0.1)
+
+            # New records must go into the sketch as well:
+            day_stats = manager._get_day_summary(weeutil.weeutil.startOfDay(records[-1]['dateTime']))
+            self.assertEqual(sum(day_stats['outTemp'].hist.values()), day_stats['outTemp'].count)
+        weewx.manager.drop_database(manager_dict)
+
+    def test_add_batch(self):
+        """Test that adding records as a batch gives the same daily summaries"""
+
+        start_ts = time.mktime((2010,3,14,18,0,0,0,0,-1))
+        stop_ts  = time.mktime((2010,3,16,6,0,0,0,0,-1))
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            records = [record for record in manager.genBatchRecords(start_ts, stop_ts)]
+            whole_day = manager._get_day_summary(weeutil.weeutil.startOfDay(start_ts) + 86400)
+
+        # Add them to a scratch database, one at a time, then as a batch:
+        manager_dict = self._get_scratch_manager_dict()
+        results = []
+        for batch in (False, True):
+            with weewx.manager.open_manager(manager_dict, initialize=True) as manager:
+                if batch:
+                    manager.addRecord(records)
+                else:
+                    for record in records:
+                        manager.addRecord(record)
+                self.assertEqual(manager.lastGoodStamp(), records[-1]['dateTime'])
+                self.assertEqual(manager._get_day_summary(weeutil.weeutil.startOfDay(start_ts) + 86400)['barometer'].getStatsTuple(),
+                                 whole_day['barometer'].getStatsTuple())
+                results.append([manager._get_day_summary(weeutil.weeutil.startOfDay(ts))['wind'].getStatsTuple()
+                                for ts in (start_ts, stop_ts)])
+            weewx.manager.drop_database(manager_dict)
+        self.assertEqual(results[0], results[1])
+
+    def test_recalculate(self):
+        """Test recalculating a derived type in the archive"""
+
+        start_ts = time.mktime((2010,3,14,18,0,0,0,0,-1))
+        stop_ts  = time.mktime((2010,3,16,6,0,0,0,0,-1))
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            records = [record for record in manager.genBatchRecords(start_ts, stop_ts)]
+
+        manager_dict = self._get_scratch_manager_dict()
+        with weewx.manager.open_manager(manager_dict, initialize=True) as manager:
+            manager.addRecord(records)
+            self.assertRaises(weewx.ViolatedPrecondition, weewx.wxservices.recalculate,
+                              manager, ['rainRate'], (700, 'foot', 'group_altitude'))
+            # Use a small chunk size, so several chunks are needed:
+            nrecs = weewx.wxservices.recalculate(manager, ['windchill'], (700, 'foot', 'group_altitude'),
+                                                 chunk_size=100)
+            self.assertEqual(nrecs, len(records))
+            windchill = [weewx.wxformulas.windchillF(r['outTemp'], r['windSpeed']) for r in records]
+            self.assertEqual([r['windchill'] for r in manager.genBatchRecords()], windchill)
+            # The daily summary must have been rebuilt as well:
+            day_stats = manager._get_day_summary(weeutil.weeutil.startOfDay(start_ts) + 86400)
+            day_windchill = [x for (r, x) in zip(records, windchill) if x is not None and
+                             day_stats.timespan.includesArchiveTime(r['dateTime'])]
+            self.assertEqual(day_stats['windchill'].count, len(day_windchill))
+            self.assertEqual(day_stats['windchill'].min, min(day_windchill))
+        weewx.manager.drop_database(manager_dict)
+
+    def _get_scratch_manager_dict(self):
+        """Return a manager dictionary for an empty scratch database"""
+        manager_dict = weewx.manager.get_manager_dict(self.config_dict['DataBindings'],
+                                                      self.config_dict['Databases'], 'wx_binding')
+        manager_dict['database_dict'] = dict(manager_dict['database_dict'])
+        manager_dict['database_dict']['database_name'] = 'test_batch.sdb' if self.database_type == 'sqlite' else 'test_batch_weewx'
+        try:
+            weewx.manager.drop_database(manager_dict)
+        except weedb.DatabaseError:
+            pass
+        return manager_dict
+
     def test_rainYear(self):
         db_binder = weewx.manager.DBBinder(self.config_dict['DataBindings'], 
                                            self.config_dict['Databases'])
@@ -330,7 +512,7 @@ class TestMySQL(Common):
     
 def suite():
     tests = ['test_create_stats', 'testScalarTally', 'testWindTally', 
-             'testTags', 'test_rainYear', 'test_agg_intervals', 'test_agg', 'test_heatcool']
+             'testTags', 'test_rainYear', 'test_agg_intervals', 'test_agg', 'test_prefetch', 'test_series', 'test_record_cache', 'test_quantiles', 'test_add_batch', 'test_recalculate', 'test_heatcool']
     
     # Test both sqlite and MySQL:
     return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests))
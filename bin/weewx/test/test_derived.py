@@ -0,0 +1,102 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Test module weewx.derived"""
+import unittest
+
+import weewx
+import weewx.derived
+import weewx.wxservices
+
+from weewx.derived import Derivation, Plan, MISSING
+
+class DerivedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        def svp(T):
+            self.calls.append('svp')
+            return T * 2
+        self.derivations = [
+            Derivation('c', ('b', 'svp'), lambda b, s : b + s),
+            Derivation('b', ('a', 'svp'), lambda a, s : a + s),
+            Derivation('svp', ('T',), svp, intermediate=True),
+            Derivation('d', ('x',), lambda x : x)]
+
+    def test_order(self):
+        plan = Plan(['c', 'b', 'd'], self.derivations)
+        self.assertEqual(plan.obs_types(), ['b', 'c', 'd'])
+
+        data = {'a' : 1, 'T' : 10}
+        plan.calculate(data)
+        self.assertEqual(data, {'a' : 1, 'T' : 10, 'b' : 21, 'c' : 41})
+        # The intermediate was calculated only once:
+        self.assertEqual(self.calls, ['svp'])
+
+        # If b is not wanted, the value in the packet is used:
+        data = {'b' : 5, 'T' : 10}
+        Plan(['c'], self.derivations).calculate(data)
+        self.assertEqual(data['c'], 25)
+
+    def test_missing(self):
+        plan = Plan(['b', 'c'], self.derivations)
+        # With no temperature, nothing is calculated:
+        data = {'a' : 1}
+        plan.calculate(data)
+        self.assertEqual(data, {'a' : 1})
+        # Nor if the intermediate gives up:
+        self.derivations[2].func = lambda T : MISSING
+        plan.calculate(data)
+        self.assertEqual(data, {'a' : 1})
+        # Nor if it is not needed:
+        data = {'a' : 1, 'b' : 2, 'T' : 10}
+        plan.calculate(data, lambda obs_type, data : obs_type not in data)
+        self.assertEqual(data, {'a' : 1, 'b' : 2, 'T' : 10})
+
+    def test_cycle(self):
+        # Quantities calculated from each other use the value in the packet:
+        derivations = [Derivation('x', ('y',), lambda y : y + 1),
+                       Derivation('y', ('x',), lambda x : x - 1)]
+        plan = Plan(['y', 'x'], derivations)
+        # The one registered first is calculated first, whatever order they
+        # were asked for in:
+        self.assertEqual(plan.obs_types(), ['x', 'y'])
+        data = {'x' : 10}
+        plan.calculate(data, lambda obs_type, data : obs_type not in data)
+        self.assertEqual(data, {'x' : 10, 'y' : 9})
+        data = {'y' : 10}
+        plan.calculate(data)
+        self.assertEqual(data, {'x' : 11, 'y' : 10})
+        # Something that depends on the cycle comes after it:
+        derivations.insert(0, Derivation('w', ('y',), lambda y : y))
+        self.assertEqual(Plan(['w', 'x', 'y'], derivations).obs_types(), ['x', 'y', 'w'])
+        # The standard pressures keep the order they are registered in, so a
+        # station with only a barometer gets pressure calculated from it:
+        plan = Plan(['altimeter', 'barometer', 'pressure'], weewx.derived.get_derivations(weewx.US))
+        self.assertEqual(plan.obs_types(), ['pressure', 'barometer', 'altimeter'])
+        # ... but intermediates cannot be:
+        derivations = [Derivation('x', ('y',), lambda y : y, intermediate=True),
+                       Derivation('y', ('x',), lambda x : x, intermediate=True),
+                       Derivation('z', ('x',), lambda x : x)]
+        self.assertRaises(weewx.ViolatedPrecondition, Plan, ['z'], derivations)
+
+    def test_register(self):
+        # Replacing a standard formula:
+        saved = weewx.derived.get_derivations(weewx.US)
+        try:
+            weewx.derived.register('dewpoint', ('outTemp',), lambda T : T - 10, (weewx.US,))
+            derivations = weewx.derived.get_derivations(weewx.US)
+            self.assertEqual(len(derivations), len(saved))
+            plan = Plan(['dewpoint'], derivations)
+            data = {'outTemp' : 70.0}
+            plan.calculate(data)
+            self.assertEqual(data['dewpoint'], 60.0)
+        finally:
+            weewx.derived._registry[weewx.US] = saved
+
+if __name__ == '__main__':
+    unittest.main()
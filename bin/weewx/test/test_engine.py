@@ -0,0 +1,244 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Test reloading the services of weewx.engine.StdEngine"""
+import shutil
+import tempfile
+import time
+import unittest
+
+import configobj
+
+import weewx
+import weewx.engine
+import weewx.manager
+import weeutil.weeutil
+
+# The services that are running, in the order they were started:
+running = []
+
+class ServiceA(weewx.engine.StdService):
+    config_sections = ['ServiceA']
+    def __init__(self, engine, config_dict):
+        super(ServiceA, self).__init__(engine, config_dict)
+        self.count = 0
+        self.bind(weewx.NEW_LOOP_PACKET, self.new_loop_packet)
+        running.append(self)
+    def new_loop_packet(self, event):
+        self.count += 1
+        event.packet.setdefault('order', []).append(self.__class__.__name__)
+    def carry_over(self, old_service):
+        self.count = old_service.count
+    def shutDown(self):
+        running.remove(self)
+
+class ServiceB(ServiceA):
+    config_sections = ['ServiceB']
+
+class ServiceC(ServiceA):
+    # Declares no sections, so any change restarts it
+    config_sections = None
+
+class ServiceBroken(weewx.engine.StdService):
+    def __init__(self, engine, config_dict):
+        raise ValueError("broken")
+
+class FakeEngine(weewx.engine.StdEngine):
+    """An engine without a station or databases."""
+    def setupStation(self, config_dict):
+        self.console = None
+    def preLoadServices(self, config_dict):
+        pass
+
+def make_config(services, **sections):
+    config_dict = configobj.ConfigObj()
+    config_dict['Station'] = {'station_type' : 'Fake'}
+    config_dict['Fake'] = {}
+    config_dict['Engine'] = {'Services' : {'process_services' : services}}
+    config_dict['ServiceA'] = {'x' : '1'}
+    config_dict['ServiceB'] = {'x' : '1'}
+    config_dict.update(sections)
+    return config_dict
+
+def names(services):
+    return [__name__ + '.' + svc for svc in services]
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        del running[:]
+        self.engine = FakeEngine(make_config(names(['ServiceA', 'ServiceB'])))
+        self.a, self.b = self.engine.service_obj
+
+    def tearDown(self):
+        self.engine.shutDown()
+        self.assertEqual(running, [])
+
+    def dispatch(self):
+        packet = {}
+        self.engine.dispatchEvent(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
+        return packet['order']
+
+    def test_unchanged(self):
+        self.dispatch()
+        self.engine.reloadServices(make_config(names(['ServiceA', 'ServiceB']), Other={'y' : '2'}))
+        self.assertEqual(self.engine.service_obj, [self.a, self.b])
+        self.assertEqual(running, [self.a, self.b])
+        self.assertEqual(self.dispatch(), ['ServiceA', 'ServiceB'])
+        self.assertEqual(self.a.count, 2)
+
+    def test_changed(self):
+        def other(event):
+            event.packet.setdefault('order', []).append('other')
+        self.engine.bind(weewx.NEW_LOOP_PACKET, other)
+        self.dispatch()
+        self.engine.reloadServices(make_config(names(['ServiceA', 'ServiceB']), ServiceA={'x' : '2'}))
+        a, b = self.engine.service_obj
+        self.assertFalse(a is self.a)
+        self.assertTrue(b is self.b)
+        self.assertEqual(running, [self.b, a])
+        self.assertEqual(a.config_dict['ServiceA']['x'], '2')
+        # The count was carried over, and the callbacks are in service order:
+        self.assertEqual(self.dispatch(), ['ServiceA', 'ServiceB', 'other'])
+        self.assertEqual(a.count, 2)
+
+    def test_add_remove(self):
+        def other(event):
+            event.packet.setdefault('order', []).append('other')
+        self.engine.bind(weewx.NEW_LOOP_PACKET, other)
+        self.engine.reloadServices(make_config(names(['ServiceC', 'ServiceB'])))
+        c, b = self.engine.service_obj
+        self.assertTrue(isinstance(c, ServiceC))
+        self.assertTrue(b is self.b)
+        self.assertEqual(self.engine.service_names, names(['ServiceC', 'ServiceB']))
+        self.assertEqual(running, [self.b, c])
+        # A callback that does not belong to a service keeps its place:
+        self.assertEqual(self.dispatch(), ['ServiceC', 'ServiceB', 'other'])
+        # ServiceC declares no sections, so it restarts on any change:
+        self.engine.reloadServices(make_config(names(['ServiceC', 'ServiceB']), Other={'y' : '2'}))
+        self.assertFalse(self.engine.service_obj[0] is c)
+        self.assertTrue(self.engine.service_obj[1] is b)
+
+    def test_load_failure(self):
+        self.assertRaises(weewx.engine.Restart, self.engine.reloadServices,
+                          make_config(names(['ServiceB', 'ServiceBroken', 'ServiceA']), ServiceB={'x' : '2'}))
+        # The engine lists exactly the services that are still running, so
+        # tearDown() shuts each of them down once:
+        self.assertEqual(sorted(self.engine.service_obj), sorted(running))
+        self.assertEqual(len(running), 2)
+        self.assertTrue(self.a in running)
+        self.assertFalse(self.b in running)
+
+    def test_restart(self):
+        self.assertRaises(weewx.engine.Restart, self.engine.reloadServices,
+                          make_config(names(['ServiceA', 'ServiceB']), Station={'station_type' : 'Fake', 'altitude' : '1'}))
+        self.assertEqual(self.engine.service_obj, [self.a, self.b])
+
+class FakeConsole(object):
+    """A console without an archive of its own."""
+    def __init__(self):
+        self.time = None
+    @property
+    def archive_interval(self):
+        raise NotImplementedError("No hardware archive interval")
+    def getTime(self):
+        return self.time
+
+class ArchiveEngine(weewx.engine.StdEngine):
+    """An engine with a fake console, and real databases."""
+    def setupStation(self, config_dict):
+        self.console = FakeConsole()
+    def preLoadServices(self, config_dict):
+        self.db_binder = weewx.manager.DBBinder(config_dict['DataBindings'],
+                                                config_dict['Databases'])
+
+class ArchiveTestCase(unittest.TestCase):
+    """Starts StdArchive in an engine, partway through an archive period."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.engine = ArchiveEngine(self.make_config(300))
+        self.sod_ts = weeutil.weeutil.startOfDay(time.mktime((2015,3,1,12,0,0,0,0,-1)))
+        self.engine.console.time = self.sod_ts + 36100
+        self.engine.dispatchEvent(weewx.Event(weewx.PRE_LOOP))
+        self.engine.dispatchEvent(weewx.Event(weewx.NEW_LOOP_PACKET,
+                                              packet={'dateTime' : self.sod_ts + 36100,
+                                                      'usUnits'  : weewx.US,
+                                                      'outTemp'  : 70.0}))
+        self.archive = self.engine.service_obj[0]
+
+    def tearDown(self):
+        self.engine.shutDown()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_config(self, archive_interval, archive_delay=15):
+        config_dict = make_config([])
+        config_dict['Engine']['Services'] = {'archive_services' : 'weewx.engine.StdArchive'}
+        config_dict['StdArchive'] = {'archive_interval'   : str(archive_interval),
+                                     'archive_delay'      : str(archive_delay),
+                                     'record_generation'  : 'software',
+                                     'loop_buffer_length' : '0',
+                                     'catchup_batch_size' : '2'}
+        config_dict['DataBindings'] = {'wx_binding' : {'database'   : 'archive_sqlite',
+                                                       'table_name' : 'archive',
+                                                       'manager'    : 'weewx.manager.DaySummaryManager',
+                                                       'schema'     : 'schemas.wview.schema'}}
+        config_dict['Databases'] = {'archive_sqlite' : {'root'          : self.tmp_dir,
+                                                        'database_name' : 'weewx.sdb',
+                                                        'driver'        : 'weedb.sqlite'}}
+        return config_dict
+
+class ArchiveReloadTest(ArchiveTestCase):
+
+    def test_same_interval(self):
+        self.engine.reloadServices(self.make_config(300, archive_delay=20))
+        archive = self.engine.service_obj[0]
+        self.assertFalse(archive is self.archive)
+        self.assertTrue(archive.accumulator is self.archive.accumulator)
+        self.assertEqual(archive.end_archive_period_ts, self.sod_ts + 36300)
+        self.assertEqual(archive.end_archive_delay_ts, self.sod_ts + 36315)
+
+    def test_new_interval(self):
+        self.engine.reloadServices(self.make_config(600))
+        archive = self.engine.service_obj[0]
+        self.assertEqual(archive.archive_interval, 600)
+        # The new archive period is on the grid of the new interval:
+        self.assertEqual(archive.accumulator.timespan, weeutil.weeutil.TimeSpan(self.sod_ts + 36000, self.sod_ts + 36600))
+        self.assertEqual(archive.end_archive_period_ts, self.sod_ts + 36600)
+        self.assertEqual(archive.end_archive_delay_ts, self.sod_ts + 36615)
+        # The highs and lows seen so far were saved:
+        dbmanager = self.engine.db_binder.get_manager('wx_binding')
+        self.assertEqual(dbmanager._get_day_summary(self.sod_ts)['outTemp'].max, 70.0)
+
+class ArchiveCatchupTest(ArchiveTestCase):
+
+    def test_batch_failure(self):
+        def genArchiveRecords(lastgood_ts):
+            for i in range(1, 4):
+                yield {'dateTime' : self.sod_ts + i * 300,
+                       'usUnits'  : weewx.US,
+                       'interval' : 5,
+                       'outTemp'  : 70.0}
+        batches = []
+        def addRecord(records):
+            batches.append(records)
+            raise ValueError("batch %d" % len(batches))
+        self.engine.db_binder.get_manager('wx_binding').addRecord = addRecord
+        # The batch that failed is not tried again, so the error is the
+        # original one:
+        try:
+            self.archive._catchup(genArchiveRecords)
+        except ValueError, e:
+            self.assertEqual(str(e), "batch 1")
+        else:
+            self.fail("No exception")
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(len(batches[0]), 2)
+        self.assertTrue(self.archive.catchup_records is None)
+
+if __name__ == '__main__':
+    unittest.main()
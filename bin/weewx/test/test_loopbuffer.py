@@ -0,0 +1,128 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Test module weewx.loopbuffer"""
+import threading
+import time
+import unittest
+
+import weewx
+import weewx.cheetahgenerator
+import weewx.loopbuffer
+import weewx.reportengine
+import weewx.tags
+import weewx.units
+import weewx.drivers.simulator
+
+start_ts = time.mktime((2014,6,1,0,0,0,0,0,-1))
+
+class LoopBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        station = weewx.drivers.simulator.Simulator(mode='generator', loop_interval=2, start_time=start_ts)
+        self.packets = []
+        for packet in station.genLoopPackets():
+            # Knock some values out, so missing data gets tested:
+            if len(self.packets) % 7 == 0:
+                packet['outTemp'] = None
+            self.packets.append(packet)
+            if len(self.packets) >= 3000:
+                break
+        self.buffer = weewx.loopbuffer.LoopBuffer(max_age=3600)
+        for packet in self.packets:
+            self.buffer.add_packet(packet)
+
+    def test_expire(self):
+        # 3000 packets at 2 seconds is 100 minutes. Only the last hour is kept.
+        self.assertEqual(len(self.buffer), 1800)
+        self.assertEqual(self.buffer.last_ts, self.packets[-1]['dateTime'])
+        self.assertEqual(self.buffer.first_ts, self.packets[-1800]['dateTime'])
+
+    def test_aggregate(self):
+        window = self.packets[-300:]
+        start = window[0]['dateTime'] - 1
+        temps = [p['outTemp'] for p in window if p['outTemp'] is not None]
+
+        vt = self.buffer.aggregate('outTemp', 'max', start)
+        self.assertEqual(vt, (max(temps), 'degree_F', 'group_temperature'))
+        self.assertAlmostEqual(self.buffer.aggregate('outTemp', 'avg', start)[0], sum(temps) / len(temps))
+        self.assertEqual(self.buffer.aggregate('outTemp', 'count', start)[0], len(temps))
+        maxtime = [p['dateTime'] for p in window if p['outTemp'] == max(temps)][0]
+        self.assertEqual(self.buffer.aggregate('outTemp', 'maxtime', start)[0], maxtime)
+        self.assertEqual(self.buffer.aggregate('outTemp', 'last')[0], temps[-1])
+        self.assertEqual(self.buffer.aggregate('fooTemp', 'max')[0], None)
+        self.assertRaises(weewx.ViolatedPrecondition, self.buffer.aggregate, 'outTemp', 'foo')
+
+    def test_tags(self):
+        loop = weewx.tags.LoopBinder(self.buffer, weewx.units.Formatter(), weewx.units.Converter())
+        temps = [p['outTemp'] for p in self.packets[-300:] if p['outTemp'] is not None]
+        self.assertEqual(loop.minutes(10).outTemp.min.raw, min(temps))
+        self.assertEqual(loop.latest.outTemp.raw, temps[-1])
+        self.assertTrue(loop.hours(1).windSpeed.has_data)
+
+        # With no buffer, everything is None:
+        loop = weewx.tags.LoopBinder(None, weewx.units.Formatter(), weewx.units.Converter())
+        self.assertEqual(loop.minutes(10).outTemp.min.raw, None)
+        self.assertEqual(str(loop.latest.outTemp), "   N/A")
+
+class HeldLoopBuffer(weewx.loopbuffer.LoopBuffer):
+    """A buffer whose lock is taken by another thread, and held, as soon as
+    a copy has been made, as if the engine thread were adding a packet."""
+
+    def copy(self):
+        other = weewx.loopbuffer.LoopBuffer.copy(self)
+        self.holder = threading.Thread(target=self._hold)
+        self.holder.start()
+        self.held.wait()
+        return other
+
+    def _hold(self):
+        with self.lock:
+            self.held.set()
+            self.release.wait()
+
+class FakeGenerator(object):
+    """Enough of a report generator to render $loop tags in worker processes."""
+
+    def __init__(self):
+        self.config_dict = {'DataBindings' : {}, 'Databases' : {}}
+        self.formatter = weewx.units.Formatter()
+        self.converter = weewx.units.Converter()
+        # The search list is made before the workers are forked:
+        self.loop_extension = weewx.cheetahgenerator.Loop(self)
+
+    def render(self, obs_type):
+        return getattr(self.loop_extension.loop.latest, obs_type).raw
+
+class ForkTest(unittest.TestCase):
+
+    def test_fork_with_lock_held(self):
+        buffer = HeldLoopBuffer(max_age=3600)
+        buffer.held = threading.Event()
+        buffer.release = threading.Event()
+        buffer.add_packet({'dateTime' : start_ts, 'usUnits' : weewx.US, 'outTemp' : 70.0})
+        saved = weewx.loopbuffer.loop_buffer
+        weewx.loopbuffer.loop_buffer = buffer
+        results = []
+        def run():
+            results.extend(weewx.reportengine.run_jobs(FakeGenerator(), 'render',
+                                                       [('outTemp',), ('outTemp',)], worker_count=2))
+        try:
+            runner = threading.Thread(target=run)
+            runner.setDaemon(True)
+            runner.start()
+            # If the workers inherited the held lock, they would never finish:
+            runner.join(30.0)
+            self.assertFalse(runner.isAlive())
+            self.assertTrue(buffer.lock.locked())
+            self.assertEqual(results, [70.0, 70.0])
+        finally:
+            buffer.release.set()
+            weewx.loopbuffer.loop_buffer = saved
+
+if __name__ == '__main__':
+    unittest.main()
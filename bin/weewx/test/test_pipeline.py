@@ -0,0 +1,145 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Test module weewx.pipeline"""
+import copy
+import time
+import unittest
+
+import configobj
+
+import weewx
+import weewx.engine
+import weewx.pipeline
+import weewx.units
+import weewx.wxservices
+import weewx.drivers.simulator
+
+start_ts = time.mktime((2014,6,1,0,0,0,0,0,-1))
+
+class FakeStationInfo(object):
+    altitude_vt = (700, 'foot', 'group_altitude')
+
+class FakeEngine(object):
+    """Enough of an engine to host the services."""
+    def __init__(self):
+        self.callbacks = {}
+        self.stn_info = FakeStationInfo()
+    def bind(self, event_type, callback):
+        self.callbacks.setdefault(event_type, []).append(callback)
+    def dispatchEvent(self, event):
+        for callback in self.callbacks.get(event.event_type, []):
+            callback(event)
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dict = configobj.ConfigObj()
+        self.config_dict['StdConvert'] = {'target_unit' : 'US'}
+        self.config_dict['StdCalibrate'] = {'Corrections' : {'outTemp' : 'outTemp - 0.2',
+                                                             'inTemp' : 'inTemp + foo'}}
+        self.config_dict['StdQC'] = {'MinMax' : {'barometer' : ['26', '32.5', 'inHg'],
+                                                 'outTemp'   : ['-40', '32', 'degree_F']}}
+        self.config_dict['StdWXCalculate'] = {'pressure' : 'hardware'}
+
+        station = weewx.drivers.simulator.Simulator(mode='generator', loop_interval=10, start_time=start_ts)
+        self.packets = []
+        for packet in station.genLoopPackets():
+            # Start from metric packets, so the conversion step does something
+            self.packets.append(weewx.units.to_METRIC(packet))
+            if len(self.packets) >= 500:
+                break
+
+    def _run(self, engine, event_type, origin='hardware'):
+        results = []
+        for packet in copy.deepcopy(self.packets):
+            if event_type == weewx.NEW_LOOP_PACKET:
+                event = weewx.Event(event_type, packet=packet)
+                engine.dispatchEvent(event)
+                results.append(event.packet)
+            else:
+                packet['interval'] = 5
+                event = weewx.Event(event_type, record=packet, origin=origin)
+                engine.dispatchEvent(event)
+                results.append(event.record)
+        return results
+
+    def _compare(self, event_type, origin='hardware'):
+        standard = FakeEngine()
+        for svc in (weewx.engine.StdConvert, weewx.engine.StdCalibrate,
+                    weewx.engine.StdQC, weewx.wxservices.StdWXCalculate):
+            svc(standard, self.config_dict)
+        fused = FakeEngine()
+        weewx.pipeline.StdPipeline(fused, self.config_dict)
+
+        expected = self._run(standard, event_type, origin)
+        self.assertEqual(self._run(fused, event_type, origin), expected)
+        return expected
+
+    def test_loop_US(self):
+        results = self._compare(weewx.NEW_LOOP_PACKET)
+        # Make sure all the stages actually did something:
+        self.assertTrue(all(p['usUnits'] == weewx.US for p in results))
+        self.assertTrue(any(p['outTemp'] is None for p in results))
+        self.assertTrue(any(p['windchill'] is not None for p in results))
+
+    def test_loop_METRIC(self):
+        self.config_dict['StdConvert']['target_unit'] = 'METRIC'
+        self.packets = [weewx.units.to_US(packet) for packet in self.packets]
+        results = self._compare(weewx.NEW_LOOP_PACKET)
+        self.assertTrue(all(p['usUnits'] == weewx.METRIC for p in results))
+
+    def test_archive(self):
+        self._compare(weewx.NEW_ARCHIVE_RECORD, 'hardware')
+        self._compare(weewx.NEW_ARCHIVE_RECORD, 'software')
+
+    def test_metric_calculations(self):
+        # Derived quantities calculated in metric units must agree with the
+        # ones calculated in US units:
+        derived = ['dewpoint', 'inDewpoint', 'windchill', 'heatindex', 'barometer', 'altimeter']
+        wxcalc = weewx.wxservices.StdWXCalculate(FakeEngine(), self.config_dict)
+        for unit_system in (weewx.METRIC, weewx.METRICWX):
+            for packet in self.packets[:100]:
+                packet_x = weewx.units.to_std_system(packet, unit_system)
+                packet_US = weewx.units.to_US(packet)
+                for obs_type in derived:
+                    packet_x.pop(obs_type, None)
+                    packet_US.pop(obs_type, None)
+                wxcalc.do_calculations(packet_x)
+                wxcalc.do_calculations(packet_US)
+                expected = weewx.units.to_std_system(packet_US, unit_system)
+                for obs_type in derived:
+                    if expected[obs_type] is None:
+                        self.assertEqual(packet_x[obs_type], None)
+                    else:
+                        self.assertAlmostEqual(packet_x[obs_type], expected[obs_type], 2, msg=obs_type)
+
+    def test_rainRate(self):
+        wxcalc = weewx.wxservices.StdWXCalculate(FakeEngine(), self.config_dict)
+        for (i, packet) in enumerate(self.packets):
+            packet['rain'] = 0.1 if i % 13 < 4 else None
+            wxcalc.do_calculations(packet, 'loop')
+            # The rain in the last rain_period seconds, the long way:
+            window = [p['rain'] for p in self.packets[:i + 1]
+                      if p['rain'] and p['dateTime'] > packet['dateTime'] - wxcalc.rain_period]
+            self.assertAlmostEqual(packet['rainRate'], 3600 * sum(window) / wxcalc.rain_period)
+
+    def test_history(self):
+        history = weewx.wxservices.ArchiveHistory(max_age=3600)
+        for i in range(24):
+            history.add_record({'dateTime' : start_ts + i * 300, 'usUnits' : weewx.METRIC,
+                                'outTemp' : 10.0, 'rain' : 0.254 if i % 2 else None})
+        # Only the last hour is kept, in US units:
+        self.assertEqual(len(history), 12)
+        self.assertEqual(history.get(start_ts + 23 * 300, 'outTemp'), 50.0)
+        self.assertEqual(history.get(start_ts, 'outTemp'), None)
+        # The ends of the span are not included:
+        self.assertAlmostEqual(history.sum('rain', start_ts + 19 * 300, start_ts + 23 * 300), 0.1)
+        self.assertEqual(history.sum('rain', start_ts + 21 * 300, start_ts + 23 * 300), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#
+#    Copyright (c) 2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+#    $Id$
+#
+"""Test module weewx.resmon"""
+import shutil
+import tempfile
+import time
+import unittest
+
+import configobj
+
+import weewx
+import weewx.manager
+import weewx.resmon
+import weeutil.weeutil
+
+class FakeEngine(object):
+    """Enough of an engine to host the service."""
+    def __init__(self, db_binder):
+        self.callbacks = {}
+        self.service_obj = []
+        self.db_binder = db_binder
+    def bind(self, event_type, callback):
+        self.callbacks.setdefault(event_type, []).append(callback)
+
+class ResourceMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config_dict = configobj.ConfigObj()
+        self.config_dict['StdResourceMonitor'] = {'sample_interval' : '60',
+                                                  'max_age' : str(2 * 86400)}
+        self.config_dict['DataBindings'] = {'resmon_binding' : {'database'   : 'resmon_sqlite',
+                                                                'table_name' : 'archive',
+                                                                'manager'    : 'weewx.manager.DaySummaryManager',
+                                                                'schema'     : 'schemas.resmon.schema'}}
+        self.config_dict['Databases'] = {'resmon_sqlite' : {'root'          : self.tmp_dir,
+                                                            'database_name' : 'resmon.sdb',
+                                                            'driver'        : 'weedb.sqlite'}}
+        self.db_binder = weewx.manager.DBBinder(self.config_dict['DataBindings'],
+                                                self.config_dict['Databases'])
+        self.engine = FakeEngine(self.db_binder)
+        self.service = weewx.resmon.StdResourceMonitor(self.engine, self.config_dict)
+        self.manager = self.db_binder.get_manager('resmon_binding')
+
+    def tearDown(self):
+        self.service.shutDown()
+        self.db_binder.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def count(self, table='archive'):
+        return self.manager.getSql("SELECT COUNT(*) FROM %s" % table)[0]
+
+    def test_sample(self):
+        first = self.service.take_sample(1000.0)
+        self.assertEqual(first['dateTime'], 1000)
+        self.assertEqual(first['interval'], 1)
+        self.assertTrue(first['threads'] >= 1)
+        self.assertTrue('cpu_user' not in first)
+        if self.service.has_proc:
+            self.assertTrue(first['mem_rss'] > 0)
+            self.assertTrue(first['open_fds'] > 0)
+        second = self.service.take_sample(1060.0)
+        self.assertTrue(second['cpu_user'] >= 0)
+        self.assertEqual(second['restful_loop_queue'], 0)
+        self.assertEqual(second['report_running'], 0)
+
+    def test_batch(self):
+        # LOOP packets sooner than the sample interval do not take a sample:
+        for _ in range(3):
+            self.service.new_loop_packet(weewx.Event(weewx.NEW_LOOP_PACKET, packet={}))
+        self.assertEqual(len(self.service.samples), 1)
+        self.service.take_sample(time.time() + 60)
+        self.assertEqual(self.count(), 0)
+
+        # The samples are written when an archive record arrives:
+        now = int(time.time())
+        self.service.new_archive_record(weewx.Event(weewx.NEW_ARCHIVE_RECORD, record={'dateTime' : now}))
+        self.assertEqual(self.service.samples, [])
+        self.assertEqual(self.count(), 2)
+        self.assertTrue(self.manager.lastGoodStamp() >= now + 60)
+
+    def test_prune(self):
+        start_ts = weeutil.weeutil.startOfDay(time.mktime((2015,3,1,12,0,0,0,0,-1)))
+        self.service.samples = [{'dateTime' : int(start_ts + i * 3600 + 1800),
+                                 'usUnits'  : weewx.METRIC,
+                                 'interval' : 60,
+                                 'mem_rss'  : 10.0 + i} for i in range(4 * 24)]
+        self.service.flush()
+        self.assertEqual(self.count('archive_day_mem_rss'), 4)
+
+        # Only whole days before the cutoff are deleted, from both the archive
+        # and the daily summaries:
+        prune_ts = start_ts + 2 * 86400 + 6 * 3600
+        self.service.new_archive_record(weewx.Event(weewx.NEW_ARCHIVE_RECORD,
+                                                    record={'dateTime' : prune_ts + 2 * 86400}))
+        self.assertEqual(self.count(), 2 * 24)
+        self.assertEqual(self.count('archive_day_mem_rss'), 2)
+        self.assertEqual(self.manager.getSql("SELECT MIN(dateTime) FROM archive_day_mem_rss")[0],
+                         start_ts + 2 * 86400)
+        self.assertEqual(self.manager.first_timestamp, start_ts + 2 * 86400 + 1800)
+
+        # Pruning is done at most once a day:
+        self.service.new_archive_record(weewx.Event(weewx.NEW_ARCHIVE_RECORD,
+                                                    record={'dateTime' : prune_ts + 3 * 86400 - 300}))
+        self.assertEqual(self.count(), 2 * 24)
+
+if __name__ == '__main__':
+    unittest.main()
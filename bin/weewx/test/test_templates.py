@@ -12,14 +12,19 @@ import os.path
 import shutil
 import sys
 import syslog
+import tempfile
+import time
 import unittest
 
 import configobj
 
 os.environ['TZ'] = 'America/Los_Angeles'
 
+import weewx.cheetahgenerator
 import weewx.reportengine
 import weewx.station
+import weewx.units
+import weeutil.manifest
 import weeutil.weeutil
 
 import gen_fake_data
@@ -98,6 +103,55 @@ class Common(unittest.TestCase):
         pass
     
     def test_report_engine(self):
+        self._run_report_engine()
+
+    def test_report_engine_workers(self):
+        # Rendering in worker processes must give the same results:
+        test_html_dir = self._run_report_engine()
+        images = {}
+        for file_name in os.listdir(test_html_dir):
+            if file_name.endswith('.png'):
+                images[file_name] = open(os.path.join(test_html_dir, file_name), 'rb').read()
+        self.assertTrue(images)
+        shutil.rmtree(test_html_dir)
+        self._run_report_engine(worker_count=3)
+        for file_name in images:
+            self.assertEqual(open(os.path.join(test_html_dir, file_name), 'rb').read(), images[file_name],
+                             msg=file_name)
+
+    def test_report_engine_incremental(self):
+        test_html_dir = self._run_report_engine(incremental=True)
+        index_file = os.path.join(test_html_dir, 'index.html')
+        self.assertTrue(os.path.exists(os.path.join(test_html_dir, '#StandardTest.watermarks')))
+        
+        # Nothing has changed, so nothing is rendered the second time:
+        os.utime(index_file, (0, 0))
+        self._run_report_engine(incremental=True)
+        self.assertEqual(os.path.getmtime(index_file), 0)
+        
+        # ... unless a file is missing:
+        os.unlink(index_file)
+        self._run_report_engine(incremental=True)
+        self.assertTrue(os.path.exists(index_file))
+
+    def test_report_engine_stale(self):
+        test_html_dir = self._run_report_engine()
+        index_file = os.path.join(test_html_dir, 'index.html')
+
+        # The file was made 10 seconds ago, but has not changed for a long
+        # time, so its modification time is old:
+        os.utime(index_file, (0, 0))
+        hashes = weeutil.manifest.HashManifest(test_html_dir)
+        (digest, mtime, checked_ts) = hashes['index.html']
+        checked_ts = time.time() - 10
+        hashes['index.html'] = (digest, 0, checked_ts)
+        hashes.save()
+
+        # It is still fresh, so it is not made again:
+        self._run_report_engine(stale_age='3600')
+        self.assertEqual(weeutil.manifest.HashManifest(test_html_dir)['index.html'][2], checked_ts)
+
+    def _run_report_engine(self, **options):
         
         # The generation time should be the same as the last record in the test database:
         testtime_ts = gen_fake_data.stop_ts
@@ -110,6 +164,11 @@ class Common(unittest.TestCase):
         # Find the test skins and then have SKIN_ROOT point to it:
         test_dir = sys.path[0]
         t.config_dict['StdReport']['SKIN_ROOT'] = os.path.join(test_dir, 'test_skins')
+        if options:
+            for report in t.config_dict['StdReport'].sections:
+                # (The test skin uses the old name for the generator section)
+                t.config_dict['StdReport'][report]['FileGenerator'] = options
+                t.config_dict['StdReport'][report]['ImageGenerator'] = options
         
         # Although the report engine inherits from Thread, we can just run it in the main thread:
         print "Starting report engine test"
@@ -138,6 +197,92 @@ class Common(unittest.TestCase):
                 self.assertEqual(actual_line, expected_line, msg="%s[%d]:\n%r vs\n%r" % (actual_file, n, actual_line, expected_line))
             
             print "Checked %d lines" % (n,)
+        
+        return test_html_dir
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.template = os.path.join(self.tmp_dir, 'test.txt.tmpl')
+        with open(self.template, 'w') as f:
+            f.write("Hello $name\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache(self):
+        template_class = weewx.cheetahgenerator.get_template_class(self.template, self.cache_dir)
+        self.assertEqual(str(template_class(searchList=[{'name' : 'world'}])), "Hello world\n")
+        self.assertTrue(weewx.cheetahgenerator.get_template_class(self.template, self.cache_dir) is template_class)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # After a restart, the saved code is used:
+        weewx.cheetahgenerator._template_classes.clear()
+        cache_file = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        code = open(cache_file).read()
+        with open(cache_file, 'w') as f:
+            f.write(code.replace('Hello ', 'Saved '))
+        template_class = weewx.cheetahgenerator.get_template_class(self.template, self.cache_dir)
+        self.assertEqual(str(template_class(searchList=[{'name' : 'world'}])), "Saved world\n")
+
+        # A change to the template is picked up:
+        with open(self.template, 'w') as f:
+            f.write("Goodbye $name\n")
+        os.utime(self.template, (time.time(), time.time() + 10))
+        template_class = weewx.cheetahgenerator.get_template_class(self.template, self.cache_dir)
+        self.assertEqual(str(template_class(searchList=[{'name' : 'world'}])), "Goodbye world\n")
+
+class FakeBinder(object):
+    def get_cached_manager(self):
+        raise KeyError('wx_binding')
+
+class FakeGenerator(object):
+    def __init__(self, gen_ts, skin_dict):
+        self.gen_ts = gen_ts
+        self.skin_dict = skin_dict
+        self.stn_info = weewx.station.StationInfo(latitude=46.0, longitude=-122.0,
+                                                  altitude=['700', 'foot'])
+        self.formatter = weewx.units.Formatter.fromSkinDict(skin_dict)
+        self.db_binder = FakeBinder()
+
+class ExtensionCacheTest(unittest.TestCase):
+
+    def tearDown(self):
+        weewx.cheetahgenerator._extension_cache.clear()
+
+    def test_almanac(self):
+        ts = time.mktime((2015, 3, 20, 12, 0, 0, 0, 0, -1))
+        almanac = weewx.cheetahgenerator.get_extension(weewx.cheetahgenerator.Almanac,
+                                                       FakeGenerator(ts, {}))
+        # Another report, run at the same time, shares the almanac:
+        self.assertTrue(weewx.cheetahgenerator.get_extension(weewx.cheetahgenerator.Almanac,
+                                                             FakeGenerator(ts, {})) is almanac)
+        # ... but not if the time, or the way times are formatted, differ:
+        self.assertFalse(weewx.cheetahgenerator.get_extension(weewx.cheetahgenerator.Almanac,
+                                                              FakeGenerator(ts + 300, {})) is almanac)
+        skin_dict = {'Units' : {'TimeFormats' : {'ephem_day' : '%H:%M:%S'}}}
+        self.assertFalse(weewx.cheetahgenerator.get_extension(weewx.cheetahgenerator.Almanac,
+                                                              FakeGenerator(ts, skin_dict)) is almanac)
+        # Nor once it has expired:
+        weewx.cheetahgenerator._extension_cache[(weewx.cheetahgenerator.Almanac,
+                                                 weewx.cheetahgenerator.Almanac.cache_key(FakeGenerator(ts, {})))] = (0, almanac)
+        self.assertFalse(weewx.cheetahgenerator.get_extension(weewx.cheetahgenerator.Almanac,
+                                                              FakeGenerator(ts, {})) is almanac)
+        # Other extensions are made anew every time:
+        self.assertFalse(weewx.cheetahgenerator.get_extension(weewx.cheetahgenerator.Extras,
+                                                              FakeGenerator(ts, {})) is
+                         weewx.cheetahgenerator.get_extension(weewx.cheetahgenerator.Extras,
+                                                              FakeGenerator(ts, {})))
+
+        # The almanac remembers what it calculates, but the position of the
+        # center of the sun is not that of its upper limb:
+        self.assertTrue(almanac.almanac.sun is almanac.almanac.sun)
+        self.assertEqual(str(almanac.almanac.sun.rise), str(almanac.almanac.sunrise))
+        self.assertNotEqual(almanac.almanac.sun(use_center=True).next_rising.raw,
+                            almanac.almanac.sun.next_rising.raw)
+        self.assertFalse(almanac.almanac.sun.use_center)
 
 class TestSqlite(Common):
 
@@ -154,8 +299,9 @@ class TestMySQL(Common):
         
     
 def suite():
-    tests = ['test_report_engine']
-    return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests))
+    tests = ['test_report_engine', 'test_report_engine_workers', 'test_report_engine_incremental',
+             'test_report_engine_stale']
+    return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests) + [TemplateCacheTest('test_cache'), ExtensionCacheTest('test_almanac')])
 
 if __name__ == '__main__':
     unittest.TextTestRunner(verbosity=2).run(suite())
@@ -8,8 +8,9 @@
 #
 """Test module weewx.units"""
 
-import unittest
+import locale
 import operator
+import unittest
 
 import weewx.units
 from weewx.units import ValueTuple
@@ -87,7 +88,41 @@ class ConverterTest(unittest.TestCase):
         self.assertRaises(KeyError, c.convert, d_m)
         d_m['outTemp'] = (20.01, 'degree_C', 'group_foo')
         self.assertRaises(KeyError, c.convert, d_m)
-        
+
+    def testConversionPlan(self):
+        d_m = {'outTemp'   : 20.0,
+               'rain'      : [0.0, None, 1.0],
+               'windSpeed' : None,
+               'fooTemp'   : 'bar',
+               'dateTime'  : 194758100,
+               'usUnits'   : weewx.METRIC}
+        cm = weewx.units.Converter(weewx.units.MetricWXUnits)
+        plan = cm.get_plan(weewx.METRIC)
+        self.assertTrue(cm.get_plan(weewx.METRIC) is plan)
+        # The plan gives the same results as converting one type at a time:
+        d_test = plan.convert_dict(d_m)
+        for obs_type in d_test:
+            self.assertEqual(d_test[obs_type], cm.convert(weewx.units.as_value_tuple(d_m, obs_type))[0])
+        self.assertEqual(d_test['rain'], [0.0, None, 10.0])
+        self.assertFalse('usUnits' in d_test)
+        # Converting in place leaves the unit system alone:
+        plan.convert_in_place(d_m)
+        self.assertEqual(d_m['rain'], [0.0, None, 10.0])
+        self.assertEqual(d_m['usUnits'], weewx.METRIC)
+
+    def testConversionPlanNewType(self):
+        c = weewx.units.Converter()
+        d_m = {'fooTemp' : 20.0, 'usUnits' : weewx.METRIC}
+        # A type with no unit group is not converted...
+        self.assertEqual(c.convertDict(d_m), {'fooTemp' : 20.0})
+        # ... until it is given one:
+        weewx.units.obs_group_dict['fooTemp'] = 'group_temperature'
+        try:
+            self.assertEqual(c.convertDict(d_m), {'fooTemp' : 68.0})
+        finally:
+            del weewx.units.obs_group_dict['fooTemp']
+        self.assertEqual(c.convertDict(d_m), {'fooTemp' : 20.0})
+
     def testTargetUnits(self):
         c = weewx.units.Converter()
         self.assertEqual(c.getTargetUnit('outTemp'),            ('degree_F', 'group_temperature'))
@@ -110,7 +145,19 @@ class ValueHelperTest(unittest.TestCase):
         self.assertEqual(str(vh), "68.0°F")
         self.assertEqual(str(vh.degree_F), "68.0°F")
         self.assertEqual(str(vh.degree_C), "20.0°C")
-        
+
+    def testFormatValue(self):
+        # The fast path must agree with locale.format_string(), including for
+        # the format strings it does not handle itself:
+        f = weewx.units.Formatter()
+        for format_string in ("%.1f", "T=%.3f C", "%+05d", "%.0f%%", "%s", "%5.2e", "%g"):
+            for val in (68.01, -0.5, 3, 0):
+                self.assertEqual(f.format_value(format_string, val), locale.format_string(format_string, val))
+        self.assertEqual(f.get_label_string('day', plural=False), " day")
+        self.assertEqual(f.get_label_string('day'), " days")
+        self.assertEqual(f.get_label_string('foot', plural=False), " feet")
+        self.assertEqual(f.get_format_string('foo'), "%f")
+
     def testFormattingWithConversion(self):
         value_t = (68.01, "degree_F", "group_temperature")
         c_m = weewx.units.Converter(weewx.units.MetricUnits)
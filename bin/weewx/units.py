@@ -9,6 +9,7 @@
 """Data structures and functions for dealing with units."""
 
 import locale
+import re
 import time
 import syslog
 
@@ -16,6 +17,37 @@ import weewx
 import weeutil.weeutil
 from weeutil.weeutil import ListOfDicts
 
+# The ConversionPlan objects made before this generation are out of date:
+_plan_generation = 0
+
+def clear_plans():
+    """Throw away the cached conversion plans. This is done automatically
+    when obs_group_dict or one of the standard unit dictionaries is changed,
+    but an extension that changes a dictionary it has already passed to
+    extend() must call it."""
+    global _plan_generation
+    _plan_generation += 1
+
+class _PlannedDict(ListOfDicts):
+    """A unit dictionary that throws away the cached conversion plans
+    whenever it is changed."""
+
+    def __setitem__(self, key, value):
+        ListOfDicts.__setitem__(self, key, value)
+        clear_plans()
+
+    def __delitem__(self, key):
+        ListOfDicts.__delitem__(self, key)
+        clear_plans()
+
+    def update(self, *args, **kwargs):
+        ListOfDicts.update(self, *args, **kwargs)
+        clear_plans()
+
+    def extend(self, new_dict):
+        ListOfDicts.extend(self, new_dict)
+        clear_plans()
+
 class UnknownType(object):
     """Indicates that the observation type is unknown."""
     def __init__(self, obs_type):
@@ -32,82 +64,83 @@ unit_nicknames = {weewx.US       : 'US',
 # This data structure maps observation types to a "unit group"
 # We start with a standard object group dictionary, but users are
 # free to extend it:
-obs_group_dict = ListOfDicts({"altitude"           : "group_altitude",
-                              "cooldeg"            : "group_degree_day",
-                              "heatdeg"            : "group_degree_day",
-                              "gustdir"            : "group_direction",
-                              "vecdir"             : "group_direction",
-                              "windDir"            : "group_direction",
-                              "windGustDir"        : "group_direction",
-                              "interval"           : "group_interval",
-                              "soilMoist1"         : "group_moisture",
-                              "soilMoist2"         : "group_moisture",
-                              "soilMoist3"         : "group_moisture",
-                              "soilMoist4"         : "group_moisture",
-                              "extraHumid1"        : "group_percent",
-                              "extraHumid2"        : "group_percent",
-                              "extraHumid3"        : "group_percent",
-                              "extraHumid4"        : "group_percent",
-                              "extraHumid5"        : "group_percent",
-                              "extraHumid6"        : "group_percent",
-                              "extraHumid7"        : "group_percent",
-                              "inHumidity"         : "group_percent",
-                              "outHumidity"        : "group_percent",
-                              "rxCheckPercent"     : "group_percent",
-                              "altimeter"          : "group_pressure",
-                              "barometer"          : "group_pressure",
-                              "pressure"           : "group_pressure",
-                              "radiation"          : "group_radiation",
-                              "ET"                 : "group_rain",
-                              "dayRain"            : "group_rain",
-                              "hail"               : "group_rain",
-                              "hourRain"           : "group_rain",
-                              "monthRain"          : "group_rain",
-                              "rain"               : "group_rain",
-                              "snow"               : "group_rain",
-                              "rain24"             : "group_rain",
-                              "totalRain"          : "group_rain",
-                              "stormRain"          : "group_rain",
-                              "yearRain"           : "group_rain",
-                              "hailRate"           : "group_rainrate",
-                              "rainRate"           : "group_rainrate",
-                              "wind"               : "group_speed",
-                              "windGust"           : "group_speed",
-                              "windSpeed"          : "group_speed",
-                              "windSpeed10"        : "group_speed",
-                              "windgustvec"        : "group_speed",
-                              "windvec"            : "group_speed",
-                              "rms"                : "group_speed2",
-                              "vecavg"             : "group_speed2",
-                              "dewpoint"           : "group_temperature",
-                              "extraTemp1"         : "group_temperature",
-                              "extraTemp2"         : "group_temperature",
-                              "extraTemp3"         : "group_temperature",
-                              "extraTemp4"         : "group_temperature",
-                              "extraTemp5"         : "group_temperature",
-                              "extraTemp6"         : "group_temperature",
-                              "extraTemp7"         : "group_temperature",
-                              "heatindex"          : "group_temperature",
-                              "heatingTemp"        : "group_temperature",
-                              "inTemp"             : "group_temperature",
-                              "leafTemp1"          : "group_temperature",
-                              "leafTemp2"          : "group_temperature",
-                              "leafTemp3"          : "group_temperature",
-                              "leafTemp4"          : "group_temperature",
-                              "outTemp"            : "group_temperature",
-                              "soilTemp1"          : "group_temperature",
-                              "soilTemp2"          : "group_temperature",
-                              "soilTemp3"          : "group_temperature",
-                              "soilTemp4"          : "group_temperature",
-                              "windchill"          : "group_temperature",
-                              "dateTime"           : "group_time",
-                              "leafWet1"           : "group_count",
-                              "leafWet2"           : "group_count",
-                              "UV"                 : "group_uv",
-                              "consBatteryVoltage" : "group_volt",
-                              "heatingVoltage"     : "group_volt",
-                              "referenceVoltage"   : "group_volt",
-                              "supplyVoltage"      : "group_volt"})
+obs_group_dict = _PlannedDict({"altitude"           : "group_altitude",
+                               "cooldeg"            : "group_degree_day",
+                               "heatdeg"            : "group_degree_day",
+                               "gustdir"            : "group_direction",
+                               "vecdir"             : "group_direction",
+                               "windDir"            : "group_direction",
+                               "windGustDir"        : "group_direction",
+                               "interval"           : "group_interval",
+                               "soilMoist1"         : "group_moisture",
+                               "soilMoist2"         : "group_moisture",
+                               "soilMoist3"         : "group_moisture",
+                               "soilMoist4"         : "group_moisture",
+                               "extraHumid1"        : "group_percent",
+                               "extraHumid2"        : "group_percent",
+                               "extraHumid3"        : "group_percent",
+                               "extraHumid4"        : "group_percent",
+                               "extraHumid5"        : "group_percent",
+                               "extraHumid6"        : "group_percent",
+                               "extraHumid7"        : "group_percent",
+                               "inHumidity"         : "group_percent",
+                               "outHumidity"        : "group_percent",
+                               "rxCheckPercent"     : "group_percent",
+                               "altimeter"          : "group_pressure",
+                               "barometer"          : "group_pressure",
+                               "pressure"           : "group_pressure",
+                               "radiation"          : "group_radiation",
+                               "ET"                 : "group_rain",
+                               "dayRain"            : "group_rain",
+                               "hail"               : "group_rain",
+                               "hourRain"           : "group_rain",
+                               "monthRain"          : "group_rain",
+                               "rain"               : "group_rain",
+                               "snow"               : "group_rain",
+                               "rain24"             : "group_rain",
+                               "totalRain"          : "group_rain",
+                               "stormRain"          : "group_rain",
+                               "yearRain"           : "group_rain",
+                               "hailRate"           : "group_rainrate",
+                               "rainRate"           : "group_rainrate",
+                               "wind"               : "group_speed",
+                               "windGust"           : "group_speed",
+                               "windSpeed"          : "group_speed",
+                               "windSpeed10"        : "group_speed",
+                               "windgustvec"        : "group_speed",
+                               "windvec"            : "group_speed",
+                               "rms"                : "group_speed2",
+                               "vecavg"             : "group_speed2",
+                               "dewpoint"           : "group_temperature",
+                               "extraTemp1"         : "group_temperature",
+                               "extraTemp2"         : "group_temperature",
+                               "extraTemp3"         : "group_temperature",
+                               "extraTemp4"         : "group_temperature",
+                               "extraTemp5"         : "group_temperature",
+                               "extraTemp6"         : "group_temperature",
+                               "extraTemp7"         : "group_temperature",
+                               "heatindex"          : "group_temperature",
+                               "heatingTemp"        : "group_temperature",
+                               "inDewpoint"         : "group_temperature",
+                               "inTemp"             : "group_temperature",
+                               "leafTemp1"          : "group_temperature",
+                               "leafTemp2"          : "group_temperature",
+                               "leafTemp3"          : "group_temperature",
+                               "leafTemp4"          : "group_temperature",
+                               "outTemp"            : "group_temperature",
+                               "soilTemp1"          : "group_temperature",
+                               "soilTemp2"          : "group_temperature",
+                               "soilTemp3"          : "group_temperature",
+                               "soilTemp4"          : "group_temperature",
+                               "windchill"          : "group_temperature",
+                               "dateTime"           : "group_time",
+                               "leafWet1"           : "group_count",
+                               "leafWet2"           : "group_count",
+                               "UV"                 : "group_uv",
+                               "consBatteryVoltage" : "group_volt",
+                               "heatingVoltage"     : "group_volt",
+                               "referenceVoltage"   : "group_volt",
+                               "supplyVoltage"      : "group_volt"})
 
 # Some aggregations when applied to a type result in a different unit
 # group. This data structure maps aggregation type to the group:
@@ -117,6 +150,7 @@ agg_group = {'mintime'    : "group_time",
              'minmaxtime' : "group_time",
              "maxsumtime" : "group_time",
              "lasttime"   : "group_time",
+             "firsttime"  : "group_time",
              'count'      : "group_count",
              'max_ge'     : "group_count",
              'max_le'     : "group_count",
@@ -127,62 +161,62 @@ agg_group = {'mintime'    : "group_time",
 
 # This dictionary maps unit groups to a standard unit type in the 
 # US customary unit system:
-USUnits = ListOfDicts({"group_altitude"    : "foot",
-                       "group_count"       : "count",
-                       "group_degree_day"  : "degree_F_day",
-                       "group_direction"   : "degree_compass",
-                       "group_elapsed"     : "second",
-                       "group_interval"    : "minute",
-                       "group_moisture"    : "centibar",
-                       "group_percent"     : "percent",
-                       "group_pressure"    : "inHg",
-                       "group_radiation"   : "watt_per_meter_squared",
-                       "group_rain"        : "inch",
-                       "group_rainrate"    : "inch_per_hour",
-                       "group_speed"       : "mile_per_hour",
-                       "group_speed2"      : "mile_per_hour2",
-                       "group_temperature" : "degree_F",
-                       "group_time"        : "unix_epoch",
-                       "group_deltatime"   : "second",
-                       "group_uv"          : "uv_index",
-                       "group_volt"        : "volt",
-                       "group_amp"         : "amp",
-                       "group_power"       : "watt",
-                       "group_energy"      : "watt_hour",
-                       "group_volume"      : "gallon",
-                       "group_data"        : "byte"})
+USUnits = _PlannedDict({"group_altitude"    : "foot",
+                        "group_count"       : "count",
+                        "group_degree_day"  : "degree_F_day",
+                        "group_direction"   : "degree_compass",
+                        "group_elapsed"     : "second",
+                        "group_interval"    : "minute",
+                        "group_moisture"    : "centibar",
+                        "group_percent"     : "percent",
+                        "group_pressure"    : "inHg",
+                        "group_radiation"   : "watt_per_meter_squared",
+                        "group_rain"        : "inch",
+                        "group_rainrate"    : "inch_per_hour",
+                        "group_speed"       : "mile_per_hour",
+                        "group_speed2"      : "mile_per_hour2",
+                        "group_temperature" : "degree_F",
+                        "group_time"        : "unix_epoch",
+                        "group_deltatime"   : "second",
+                        "group_uv"          : "uv_index",
+                        "group_volt"        : "volt",
+                        "group_amp"         : "amp",
+                        "group_power"       : "watt",
+                        "group_energy"      : "watt_hour",
+                        "group_volume"      : "gallon",
+                        "group_data"        : "byte"})
 
 # This dictionary maps unit groups to a standard unit type in the 
 # metric unit system:
-MetricUnits = ListOfDicts({"group_altitude"    : "meter",
-                           "group_count"       : "count",
-                           "group_degree_day"  : "degree_C_day",
-                           "group_direction"   : "degree_compass",
-                           "group_elapsed"     : "second",
-                           "group_interval"    : "minute",
-                           "group_moisture"    : "centibar",
-                           "group_percent"     : "percent",
-                           "group_pressure"    : "mbar",
-                           "group_radiation"   : "watt_per_meter_squared",
-                           "group_rain"        : "cm",
-                           "group_rainrate"    : "cm_per_hour",
-                           "group_speed"       : "km_per_hour",
-                           "group_speed2"      : "km_per_hour2",
-                           "group_temperature" : "degree_C",
-                           "group_time"        : "unix_epoch",
-                           "group_deltatime"   : "second",
-                           "group_uv"          : "uv_index",
-                           "group_volt"        : "volt",
-                           "group_amp"         : "amp",
-                           "group_power"       : "watt",
-                           "group_energy"      : "watt_hour",
-                           "group_volume"      : "litre",
-                           "group_data"        : "byte"})
+MetricUnits = _PlannedDict({"group_altitude"    : "meter",
+                            "group_count"       : "count",
+                            "group_degree_day"  : "degree_C_day",
+                            "group_direction"   : "degree_compass",
+                            "group_elapsed"     : "second",
+                            "group_interval"    : "minute",
+                            "group_moisture"    : "centibar",
+                            "group_percent"     : "percent",
+                            "group_pressure"    : "mbar",
+                            "group_radiation"   : "watt_per_meter_squared",
+                            "group_rain"        : "cm",
+                            "group_rainrate"    : "cm_per_hour",
+                            "group_speed"       : "km_per_hour",
+                            "group_speed2"      : "km_per_hour2",
+                            "group_temperature" : "degree_C",
+                            "group_time"        : "unix_epoch",
+                            "group_deltatime"   : "second",
+                            "group_uv"          : "uv_index",
+                            "group_volt"        : "volt",
+                            "group_amp"         : "amp",
+                            "group_power"       : "watt",
+                            "group_energy"      : "watt_hour",
+                            "group_volume"      : "litre",
+                            "group_data"        : "byte"})
 
 # This dictionary maps unit groups to a standard unit type in the 
 # "Metric WX" unit system. It's the same as the "Metric" system,
 # except for rain and speed:
-MetricWXUnits = ListOfDicts(MetricUnits)
+MetricWXUnits = _PlannedDict(MetricUnits)
 MetricWXUnits['group_rain']     = "mm"
 MetricWXUnits['group_rainrate'] = "mm_per_hour"
 MetricWXUnits['group_speed']    = "meter_per_second"
@@ -466,6 +500,15 @@ class Formatter(object):
         # Add new keys for backwards compatibility on old skin dictionaries:
         self.time_format_dict.setdefault('ephem_day', "%H:%M")
         self.time_format_dict.setdefault('ephem_year', "%d-%b-%Y %H:%M")
+        # The dictionaries are not expected to change once the formatter has
+        # been made, so anything looked up in them is cached for the life of
+        # the formatter. Key is a unit type, value is the tuple (format
+        # string, singular label, plural label):
+        self.unit_cache = {}
+        # Key is a format string, value is what _compile_format() returns:
+        self.format_cache = {}
+        self.none_string = self.unit_format_dict.get('NONE', 'N/A')
+        self.sector_size = 360.0 / (len(self.ordinate_names)-1)
         
     @staticmethod
     def fromSkinDict(skin_dict):
@@ -497,16 +540,7 @@ class Formatter(object):
 
     def get_format_string(self, unit):
         """Return a suitable format string."""
-
-        # First, try my internal format dict
-        if unit in self.unit_format_dict:
-            return self.unit_format_dict[unit]
-        # If that didn't work, try the default dict:
-        elif unit in default_unit_format_dict:
-            return default_unit_format_dict[unit]
-        else:
-            # Can't find one. Return a generic formatter:
-            return '%f'
+        return self._get_unit_info(unit)[0]
 
     def get_label_string(self, unit, plural=True):
         """Return a suitable label.
@@ -518,6 +552,25 @@ class Formatter(object):
         plural=False, then the singular version is returned. Otherwise, the
         plural version.
         """
+        return self._get_unit_info(unit)[2 if plural else 1]
+
+    def _get_unit_info(self, unit):
+        """Return the tuple (format string, singular label, plural label) for
+        a unit type."""
+        try:
+            return self.unit_cache[unit]
+        except KeyError:
+            pass
+
+        # First, try my internal format dict
+        if unit in self.unit_format_dict:
+            format_string = self.unit_format_dict[unit]
+        # If that didn't work, try the default dict:
+        elif unit in default_unit_format_dict:
+            format_string = default_unit_format_dict[unit]
+        else:
+            # Can't find one. Use a generic formatter:
+            format_string = '%f'
 
         # First, try my internal label dictionary:
         if unit in self.unit_label_dict:
@@ -526,16 +579,19 @@ class Formatter(object):
         elif unit in default_unit_label_dict:
             label = default_unit_label_dict[unit]
         else:
-            # Can't find a label. Just return an empty string:
-            return ''
+            # Can't find a label. Use an empty string:
+            label = ''
 
-        # Is the label a simple string? If so, return it
+        # Is the label a simple string? If so, use it for both
         if isinstance(label, str):
-            return label
+            labels = (label, label)
         else:
-            # It is not a simple string. Assume it is a tuple or list
-            # Return the singular, or plural, version as requested.
-            return label[plural]
+            # It is not a simple string. Assume it is a tuple or list, with
+            # the singular, then the plural, version.
+            labels = (label[False], label[True])
+
+        info = self.unit_cache[unit] = (format_string,) + labels
+        return info
 
     def toString(self, val_t, context='current', addLabel=True, useThisFormat=None, NONE_string=None):
         """Format the value as a string.
@@ -560,7 +616,7 @@ class Formatter(object):
             if NONE_string is not None: 
                 return NONE_string
             else:
-                return self.unit_format_dict.get('NONE', 'N/A')
+                return self.none_string
             
         if val_t[1] == "unix_epoch":
             # Different formatting routines are used if the value is a time.
@@ -588,7 +644,7 @@ class Formatter(object):
                 # User has specified a string. Use it.
                 format_string = useThisFormat
             # Now use the format string to format the value:
-            val_str = locale.format_string(format_string, val_t[0])
+            val_str = self.format_value(format_string, val_t[0])
 
         # Add a label, if requested:
         if addLabel:
@@ -596,12 +652,26 @@ class Formatter(object):
 
         return val_str
 
+    def format_value(self, format_string, val):
+        """Format a value, just as locale.format_string() would, but faster
+        for the usual format strings with a single numeric conversion."""
+        try:
+            compiled = self.format_cache[format_string]
+        except KeyError:
+            compiled = self.format_cache[format_string] = _compile_format(format_string)
+        if compiled is None or isinstance(val, tuple):
+            return locale.format_string(format_string, val)
+        (prefix, spec, suffix, decimal_point) = compiled
+        val_str = spec % val
+        if decimal_point is not None:
+            val_str = val_str.replace('.', decimal_point)
+        return prefix + val_str + suffix
+
     def to_ordinal_compass(self, val_t):
         if val_t[0] is None:
             return self.ordinate_names[-1]
-        _sector_size = 360.0 / (len(self.ordinate_names)-1)
-        _degree = (val_t[0] + _sector_size/2.0) % 360.0
-        _sector = int(_degree / _sector_size)
+        _degree = (val_t[0] + self.sector_size/2.0) % 360.0
+        _sector = int(_degree / self.sector_size)
         return self.ordinate_names[_sector]
     
     def delta_secs_to_string(self, secs, label_format):
@@ -626,6 +696,29 @@ class Formatter(object):
             ans = label_format % etime_dict
         return ans
 
+# The conversion specifiers recognized by locale.format_string():
+_percent_re = re.compile(r'%(?:\((?P<key>.*?)\))?(?P<modifiers>[-#0-9 +*.hlL]*?)[eEfFgGdiouxXcrs%]')
+
+def _compile_format(format_string):
+    """Split a format string with a single numeric conversion into the tuple
+    (prefix, conversion, suffix, decimal point), where the decimal point is
+    None for integer conversions. Return None for anything else, which must be
+    left to locale.format_string()."""
+    matches = list(_percent_re.finditer(format_string))
+    if len(matches) != 1:
+        return None
+    match = matches[0]
+    spec = match.group()
+    if match.group('key') is not None or '*' in spec or spec[-1] not in 'eEfFgGdiu':
+        return None
+    (prefix, suffix) = (format_string[:match.start()], format_string[match.end():])
+    if '%' in prefix or '%' in suffix:
+        return None
+    decimal_point = locale.localeconv()['decimal_point'] if spec[-1] in 'eEfFgG' else None
+    if decimal_point == '.':
+        decimal_point = None
+    return (prefix, spec, suffix, decimal_point)
+
 #==============================================================================
 #                        class Converter
 #==============================================================================
@@ -641,6 +734,8 @@ class Converter(object):
         unit type ('mbar')"""
 
         self.group_unit_dict  = group_unit_dict
+        # Key is a source unit system, value is the ConversionPlan from it:
+        self.plans = {}
         
     @staticmethod
     def fromSkinDict(skin_dict):
@@ -723,15 +818,16 @@ class Converter(object):
         >>> print target_dict
         {'outTemp': 68.0, 'interval': 15, 'barometer': 30.0, 'dateTime': 194758100}
         """
-        target_dict = {}
-        for obs_type in obs_dict:
-            if obs_type == 'usUnits': continue
-            # Do the conversion, but keep only the first value in
-            # the ValueTuple:
-            target_dict[obs_type] = self.convert(as_value_tuple(obs_dict, obs_type))[0]
-        return target_dict
-            
-            
+        return self.get_plan(obs_dict['usUnits']).convert_dict(obs_dict)
+
+    def get_plan(self, unit_system):
+        """Return the ConversionPlan from a standard unit system to the
+        target units of this converter."""
+        plan = self.plans.get(unit_system)
+        if plan is None or plan.generation != _plan_generation:
+            plan = self.plans[unit_system] = ConversionPlan(unit_system, self)
+        return plan
+
     def getTargetUnit(self, obs_type, agg_type=None):
         """Given an observation type and an aggregation type, return the 
         target unit type and group, or (None, None) if they cannot be determined.
@@ -751,6 +847,75 @@ class Converter(object):
             unit_type = USUnits.get(unit_group)
         return (unit_type, unit_group)
 
+#==============================================================================
+#                         class ConversionPlan
+#==============================================================================
+
+class ConversionPlan(object):
+    """Converts dictionaries in a standard unit system to the target units of
+    a Converter.
+
+    The conversion function for each observation type is looked up the first
+    time the type is seen, then reused for every dictionary after that, so
+    converting a stream of records costs one function call per value.
+    Changing obs_group_dict or a standard unit dictionary makes the plan
+    out of date, and Converter.get_plan() makes a new one.
+
+    Example:
+    >>> plan = StdUnitConverters[weewx.US].get_plan(weewx.METRIC)
+    >>> print plan.convert_dict({'usUnits' : weewx.METRIC, 'outTemp' : 20.0, 'inTemp' : [25.0, None]})
+    {'outTemp': 68.0, 'inTemp': [77.0, None]}
+    """
+
+    def __init__(self, from_unit_system, converter):
+        self.generation = _plan_generation
+        self.from_converter = StdUnitConverters[from_unit_system]
+        self.converter = converter
+        # Key is an observation type, value is its conversion function, or
+        # None if no conversion is needed:
+        self.funcs = {'usUnits' : None}
+
+    def convert_dict(self, obs_dict):
+        """Return a new dictionary with the values of obs_dict converted. The
+        new dictionary does not have a 'usUnits' entry."""
+        target_dict = dict(obs_dict)
+        self.convert_in_place(target_dict)
+        del target_dict['usUnits']
+        return target_dict
+
+    def convert_in_place(self, obs_dict):
+        """Convert the values of a dictionary, in place. The 'usUnits' entry
+        is left alone."""
+        funcs = self.funcs
+        for obs_type in obs_dict:
+            try:
+                func = funcs[obs_type]
+            except KeyError:
+                func = funcs[obs_type] = self.get_func(obs_type)
+            if func is not None:
+                val = obs_dict[obs_type]
+                if val is not None:
+                    obs_dict[obs_type] = _apply_conversion(func, val)
+
+    def get_func(self, obs_type):
+        """Return the function that converts obs_type, or None if no
+        conversion is necessary. Raises KeyError if no conversion is
+        possible, just as Converter.convert() does."""
+        (from_unit, group) = self.from_converter.getTargetUnit(obs_type)
+        if from_unit is None and group is None:
+            return None
+        to_unit = self.converter.group_unit_dict.get(group, USUnits[group])
+        if from_unit == to_unit:
+            return None
+        return conversionDict[from_unit][to_unit]
+
+def _apply_conversion(func, val):
+    """Apply a conversion function to a value that is not None, or to each
+    element of a sequence of values."""
+    if isinstance(val, (list, tuple)):
+        return [func(x) if x is not None else None for x in val]
+    return func(val)
+
 #==============================================================================
 #                         Standard Converters
 #==============================================================================
@@ -1010,7 +1175,7 @@ def convert(val_t, target_unit_type):
     # Try converting a sequence first. A TypeError exception will occur if
     # the value is actually a scalar:
     try:
-        new_val = map(lambda x : conversion_func(x) if x is not None else None, val_t[0])
+        new_val = [conversion_func(x) if x is not None else None for x in val_t[0]]
     except TypeError:
         new_val = conversion_func(val_t[0]) if val_t[0] is not None else None
     # Add on the unit type and the group type and return the results:
@@ -1109,6 +1274,8 @@ class GenWithConvert(object):
         use, or 'None' if it should leave the output unchanged."""
         self.input_generator = input_generator
         self.target_unit_system = target_unit_system
+        if target_unit_system is not None:
+            self.converter = StdUnitConverters[target_unit_system]
         
     def __iter__(self):
         return self
@@ -1117,7 +1284,7 @@ class GenWithConvert(object):
         _record = self.input_generator.next()
         if self.target_unit_system is None or _record['usUnits'] == self.target_unit_system:
             return _record
-        _record_c = StdUnitConverters[self.target_unit_system].convertDict(_record)
+        _record_c = self.converter.get_plan(_record['usUnits']).convert_dict(_record)
         _record_c['usUnits'] = self.target_unit_system
         return _record_c
 
@@ -1170,8 +1337,77 @@ def as_value_tuple(record_dict, obs_type):
     return ValueTuple(val, unit_type, unit_group)
 
 if __name__ == "__main__":
-    
-    import doctest
 
-    if not doctest.testmod().failed:
-        print("PASSED")
+    import optparse
+
+    usage = """%prog [--benchmark] [--renders=N]
+
+Run the doctests. With --benchmark, time the rendering of a template full of
+formatted values instead, with a formatter that caches nothing, then with the
+usual formatter."""
+
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option("--benchmark", action="store_true",
+                      help="Time template rendering, rather than running the doctests.")
+    parser.add_option("--renders", type="int", default=200,
+                      help="How many times to render the template. Default is 200.")
+    (options, args) = parser.parse_args()
+
+    if not options.benchmark:
+        import doctest
+
+        if not doctest.testmod().failed:
+            print("PASSED")
+    else:
+        import Cheetah.Template
+
+        # A template with the sort of tags found in the Standard skin, about
+        # 1000 of them, half of them with explicit formats or conversions:
+        source = """#for $i in $range(50)
+$outTemp $outTemp.degree_C $outTemp.format("%.2f") $outTemp.nolabel("%.0f")
+$barometer $barometer.mbar $windSpeed $windSpeed.formatted
+$windDir $windDir.ordinal_compass $rain $rain.mm $outHumidity $missing
+$missing.string("--") $sunrise $uptime $dewpoint $heatindex $windchill $rainRate $UV
+#end for
+"""
+        now = time.time()
+        search_list = {'outTemp'     : (68.01, 'degree_F', 'group_temperature'),
+                       'barometer'   : (30.12, 'inHg', 'group_pressure'),
+                       'windSpeed'   : (12.3, 'mile_per_hour', 'group_speed'),
+                       'windDir'     : (237.0, 'degree_compass', 'group_direction'),
+                       'rain'        : (0.12, 'inch', 'group_rain'),
+                       'outHumidity' : (55.0, 'percent', 'group_percent'),
+                       'missing'     : (None, 'degree_F', 'group_temperature'),
+                       'sunrise'     : (now, 'unix_epoch', 'group_time'),
+                       'uptime'      : (3*86400 + 7200, 'second', 'group_deltatime'),
+                       'dewpoint'    : (51.2, 'degree_F', 'group_temperature'),
+                       'heatindex'   : (68.0, 'degree_F', 'group_temperature'),
+                       'windchill'   : (68.0, 'degree_F', 'group_temperature'),
+                       'rainRate'    : (0.0, 'inch_per_hour', 'group_rainrate'),
+                       'UV'          : (3.2, 'uv_index', 'group_uv')}
+        template_class = Cheetah.Template.Template.compile(source)
+        values = 50 * (source.count('$') - 2)
+
+        class ReferenceFormatter(Formatter):
+            """Formats the way Formatter did before it cached anything, to
+            have something to measure against."""
+            def _get_unit_info(self, unit):
+                self.unit_cache.clear()
+                return Formatter._get_unit_info(self, unit)
+            def format_value(self, format_string, val):
+                return locale.format_string(format_string, val)
+
+        for formatter_class in (ReferenceFormatter, Formatter):
+            # A new formatter and converter for each render, as a report
+            # would have:
+            t0 = time.time()
+            for i in range(options.renders):
+                formatter = formatter_class()
+                converter = Converter(MetricUnits)
+                helpers = dict((k, ValueHelper(v, 'current', formatter, converter))
+                               for (k, v) in search_list.items())
+                str(template_class(searchList=[helpers]))
+            elapsed = time.time() - t0
+            print "%-19s %d values per render: %.2f ms per render, %.1f us per value" % \
+                (formatter_class.__name__ + ':', values, elapsed * 1000.0 / options.renders,
+                 elapsed * 1.0e6 / options.renders / values)
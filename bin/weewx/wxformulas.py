@@ -8,9 +8,17 @@
 
 """Various weather related formulas and utilities."""
 
+import itertools
 import math
 import weewx.uwxutils
 
+# NumPy is optional. If it is missing, the array versions of the formulas fall
+# back to calling the scalar versions on each value.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 INHG_PER_MBAR = 0.0295333727
 METER_PER_FOOT = 0.3048
 
@@ -224,6 +232,128 @@ def calculate_rain(newtotal, oldtotal):
         delta = None
     return delta
 
+#==============================================================================
+#                    Array versions
+#==============================================================================
+#
+# The following functions do the same calculations as the ones above, but on a
+# whole sequence of values at once, such as a column of the archive. An
+# argument can be a list, an array.array, or a NumPy array, with None or NaN
+# for a missing value. Arguments such as the altitude can also be a single
+# number. A NumPy array is returned if any argument was a NumPy array, with
+# NaN for missing values. Otherwise, a list is returned, with None for missing
+# values.
+
+def dewpointF_array(T, R):
+    """Calculate the dew point of sequences of temperatures (in Fahrenheit)
+    and humidities (in percent).
+    
+    Examples:
+    
+    >>> print ["%.1f" % x for x in dewpointF_array([68, 32, -10], [50, 50, 50])]
+    ['48.7', '15.5', '-23.5']
+    >>> print dewpointF_array([None, 68], [50, 0])
+    [None, None]
+    """
+    return _apply(dewpointF, _dewpointF_numpy, T, R)
+
+def windchillF_array(T_F, V_mph):
+    """Calculate the wind chill (in Fahrenheit) of sequences of temperatures
+    (in Fahrenheit) and wind speeds (in mph).
+    
+    Examples:
+    
+    >>> print ["%.1f" % x for x in windchillF_array([20.0, 20.0, 60.0], [10.0, 2.0, 10.0])]
+    ['8.9', '20.0', '60.0']
+    """
+    return _apply(windchillF, _windchillF_numpy, T_F, V_mph)
+
+def heatindexF_array(T, R):
+    """Calculate the heat index (in Fahrenheit) of sequences of temperatures
+    (in Fahrenheit) and humidities (in percent).
+    
+    Examples:
+    
+    >>> print ["%.1f" % x for x in heatindexF_array([75.0, 80.0, 90.0], [50.0, 95.0, 95.0])]
+    ['75.0', '86.4', '126.6']
+    """
+    return _apply(heatindexF, _heatindexF_numpy, T, R)
+
+def altimeter_pressure_US_array(SP_inHg, Z_foot, algorithm='aaASOS'):
+    """Calculate the altimeter pressure of a sequence of station pressures (in
+    inHg), given the altitude in feet.
+    
+    Examples:
+    
+    >>> print ["%.2f" % x for x in altimeter_pressure_US_array([28.0, 28.5], 1000.0)]
+    ['29.04', '29.56']
+    """
+    return _apply(lambda p, z : altimeter_pressure_US(p, z, algorithm),
+                  lambda p, z : _altimeter_pressure_US_numpy(p, z, algorithm),
+                  SP_inHg, Z_foot)
+
+def sealevel_pressure_US_array(sp_inHg, elev_foot, t_F):
+    """Calculate the sea level pressure (in inHg) of sequences of station
+    pressures (in inHg) and temperatures (in Fahrenheit), given the altitude in
+    feet.
+    
+    Examples:
+    
+    >>> print ["%.3f" % x for x in sealevel_pressure_US_array([28.0, 29.0], 1000.0, [50.0, 50.0])]
+    ['29.049', '30.087']
+    """
+    return _apply(sealevel_pressure_US, _sealevel_pressure_US_numpy, sp_inHg, elev_foot, t_F)
+
+def _apply(scalar_func, numpy_func, *args):
+    """Apply a formula to sequences of values, using NumPy if possible."""
+    if numpy is not None:
+        return_array = any(isinstance(arg, numpy.ndarray) for arg in args)
+        # Converting to floats turns any None into NaN:
+        arrays = [numpy.asarray(arg, dtype=float) for arg in args]
+        # Values that cannot be calculated come out as NaN or infinity, so
+        # ignore the warnings.
+        with numpy.errstate(all='ignore'):
+            result = numpy_func(*arrays)
+            missing = ~numpy.isfinite(result)
+            for arg in arrays:
+                missing |= numpy.isnan(arg)
+        result = numpy.where(missing, numpy.nan, result)
+        if return_array:
+            return result
+        return [None if m else x for (m, x) in itertools.izip(missing.tolist(), result.tolist())]
+
+    # No NumPy. Call the scalar version on each set of values.
+    columns = [arg if hasattr(arg, '__len__') else itertools.repeat(arg) for arg in args]
+    return [scalar_func(*[_none_if_nan(x) for x in vals]) for vals in itertools.izip(*columns)]
+
+def _none_if_nan(x):
+    return None if x is None or x != x else x
+
+def _dewpointF_numpy(T, R):
+    TC = (T - 32.0) * 5.0 / 9.0
+    _gamma = 17.27 * TC / (237.7 + TC) + numpy.log(R / 100.0)
+    TdC = 237.7 * _gamma / (17.27 - _gamma)
+    return TdC * 9.0 / 5.0 + 32.0
+
+def _windchillF_numpy(T_F, V_mph):
+    WcF = 35.74 + 0.6215 * T_F + (-35.75  + 0.4275 * T_F) * numpy.power(V_mph, 0.16)
+    return numpy.where((T_F >= 50.0) | (V_mph <= 3.0), T_F, WcF)
+
+def _heatindexF_numpy(T, R):
+    hiF = -42.379 + 2.04901523 * T + 10.14333127 * R - 0.22475541 * T * R - 6.83783e-3 * T**2\
+    -5.481717e-2 * R**2 + 1.22874e-3 * T**2 * R + 8.5282e-4 * T * R**2 - 1.99e-6 * T**2 * R**2
+    return numpy.where((T < 80.0) | (R < 40.0), T, numpy.maximum(hiF, T))
+
+def _altimeter_pressure_US_numpy(SP_inHg, Z_foot, algorithm):
+    # The functions in uwxutils use only arithmetic, so they work on arrays:
+    result = weewx.uwxutils.TWxUtilsUS.StationToAltimeter(SP_inHg, Z_foot, algorithm=algorithm)
+    return numpy.where(SP_inHg <= 0.008859, numpy.nan, result)
+
+def _sealevel_pressure_US_numpy(sp_inHg, elev_foot, t_F):
+    t_K = (t_F - 32.0) * 5.0 / 9.0 + 273.15
+    pt = numpy.exp(- elev_foot * METER_PER_FOOT / (t_K * 29.263))
+    return sp_inHg / INHG_PER_MBAR / pt * INHG_PER_MBAR
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -4,9 +4,13 @@
 
 """Services specific to weather."""
 
+import bisect
+import collections
 import syslog
 
+import weedb
 import weewx.units
+import weewx.derived
 import weewx.engine
 import weewx.wxformulas
 import weeutil.weeutil
@@ -14,8 +18,10 @@ import weeutil.weeutil
 class StdWXCalculate(weewx.engine.StdService):
     """Add derived quantities to a record.
 
-    Derived quantities should depend only on independent observations.
-    They should not depend on other derived quantities.
+    The quantities, and the formulas that calculate them, are declared in the
+    module weewx.derived. The service calculates every quantity registered
+    there, unless its option in [StdWXCalculate] is 'hardware', in an order
+    worked out from what each quantity depends on.
 
     There is one situation where dependencies matter: pressure.  In the case
     where the hardware reports barometer, we must calculate pressure and
@@ -24,19 +30,12 @@ class StdWXCalculate(weewx.engine.StdService):
 
     We do not handle the situation where hardware reports altimeter and
     we must calculate barometer and pressure.
+
+    rainRate is not a formula of the other observations in a packet, but of
+    the rain over a period of time, so it is calculated separately.
     """
 
-    # these are the quantities that this service knows how to calculate
-    _dispatch_list = [
-        'pressure', # pressure must be before altimeter
-        'barometer',
-        'altimeter',
-        'windchill',
-        'heatindex',
-        'dewpoint',
-        'inDewpoint',
-        'rainRate',
-        ]
+    config_sections = ['StdWXCalculate']
 
     def __init__(self, engine, config_dict):
         super(StdWXCalculate, self).__init__(engine, config_dict)
@@ -46,39 +45,76 @@ class StdWXCalculate(weewx.engine.StdService):
 
         # various bits we need for internal housekeeping
         self.altitude_ft = weewx.units.convert(engine.stn_info.altitude_vt, "foot")[0]
-        self.t12 = None
-        self.last_ts12 = None
+        self.altitude_m = weewx.units.convert(engine.stn_info.altitude_vt, "meter")[0]
         self.arcint = None
         self.rain_period = 900 # in seconds
-        self.rain_events = []
+        self.rain_events = collections.deque()
+        self.rain_sum = 0
+        # recent archive records, so lookups back in time do not have to go
+        # to the database.  it is primed from the database on first use.
+        self.history = ArchiveHistory()
+        self.history_primed = False
+
+        # the intermediates that depend on the station, rather than on the
+        # packet
+        self.station_derivations = [
+            weewx.derived.Derivation('altitude_foot', (), lambda : self.altitude_ft, True),
+            weewx.derived.Derivation('altitude_meter', (), lambda : self.altitude_m, True),
+            weewx.derived.Derivation('outTemp12h', ('dateTime',), self.calc_outTemp12h, True)]
+        # the plans are made when the first packet in a unit system arrives,
+        # so quantities registered by services loaded after this one are
+        # included.
+        self.plans = {}
 
         # we will process both loop and archive events
         self.bind(weewx.NEW_LOOP_PACKET, self.new_loop_packet)
         self.bind(weewx.NEW_ARCHIVE_RECORD, self.new_archive_record)
 
+    def carry_over(self, old_service):
+        """Keep the rain events and the archive history across a reload."""
+        self.rain_events = old_service.rain_events
+        self.rain_sum = old_service.rain_sum
+        self.history = old_service.history
+        self.history_primed = old_service.history_primed
+
     def new_loop_packet(self, event):
         self.do_calculations(event.packet, 'loop')
 
     def new_archive_record(self, event):
         self.do_calculations(event.record)
+        self.history.add_record(event.record)
 
     def do_calculations(self, data_dict, data_type='archive'):
+        """Add the derived quantities to a dictionary, in place. The
+        calculations are done in the unit system of the dictionary, so only
+        the observation types that are used are ever converted."""
         self.adjust_winddir(data_dict)
-        data_us = weewx.units.to_US(data_dict)
-        for obs in self._dispatch_list:
-            calc = False
-            if obs in self.calculations:
-                if self.calculations[obs] == 'software':
-                    calc = True
-                elif (self.calculations[obs] == 'prefer_hardware' and
-                      (obs not in data_us or data_us[obs] is None)):
-                    calc = True
-            elif obs not in data_us or data_us[obs] is None:
-                calc = True
-            if calc:
-                getattr(self, 'calc_'+obs)(data_us, data_type)
-        data_x = weewx.units.to_std_system(data_us, data_dict['usUnits'])
-        data_dict.update(data_x)
+        self.get_arcint(data_dict)
+        self.get_plan(data_dict['usUnits']).calculate(data_dict, self._needs_calc)
+        if self._needs_calc('rainRate', data_dict):
+            self.calc_rainRate(data_dict, data_type)
+
+    def get_plan(self, unit_system):
+        """Return the plan for calculating the derived quantities in a unit
+        system."""
+        plan = self.plans.get(unit_system)
+        if plan is None:
+            derivations = weewx.derived.get_derivations(unit_system) + self.station_derivations
+            obs_types = [d.obs_type for d in derivations
+                         if not d.intermediate and self.calculations.get(d.obs_type) != 'hardware']
+            plan = self.plans[unit_system] = weewx.derived.Plan(obs_types, derivations)
+            syslog.syslog(syslog.LOG_DEBUG, "wxservices: Calculation order for unit system 0x%x: %s" %
+                          (unit_system, ', '.join(plan.obs_types())))
+        return plan
+
+    def _needs_calc(self, obs, data):
+        """Return True if quantity obs should be calculated for data."""
+        if obs in self.calculations:
+            if self.calculations[obs] == 'software':
+                return True
+            return (self.calculations[obs] == 'prefer_hardware' and
+                    (obs not in data or data[obs] is None))
+        return obs not in data or data[obs] is None
 
     def adjust_winddir(self, data):
         if 'windSpeed' in data and not data['windSpeed']:
@@ -86,95 +122,303 @@ class StdWXCalculate(weewx.engine.StdService):
         if 'windGust' in data and not data['windGust']:
             data['windGustDir'] = None
 
-    def calc_dewpoint(self, data, data_type):
-        if 'outTemp' in data and 'outHumidity' in data:
-            data['dewpoint'] = weewx.wxformulas.dewpointF(
-                data['outTemp'], data['outHumidity'])
-
-    def calc_inDewpoint(self, data, data_type):
-        if 'inTemp' in data and 'inHumidity' in data:
-            data['inDewpoint'] = weewx.wxformulas.dewpointF(
-                data['inTemp'], data['inHumidity'])
-
-    def calc_windchill(self, data, data_type):
-        if 'outTemp' in data and 'windSpeed' in data:
-            data['windchill'] = weewx.wxformulas.windchillF(
-                data['outTemp'], data['windSpeed'])
-
-    def calc_heatindex(self, data, data_type):
-        if 'outTemp' in data and 'outHumidity' in data:
-            data['heatindex'] = weewx.wxformulas.heatindexF(
-                data['outTemp'], data['outHumidity'])
-
-    def calc_pressure(self, data, data_type):
-        self.get_arcint(data)
-        if (self.arcint is not None and 'barometer' in data and
-            'outTemp' in data and 'outHumidity' in data):
-            t12 = self.get_temperature_12h(data['dateTime'], self.arcint)
-            if (data['barometer'] is not None and
-                data['outTemp'] is not None and
-                data['outHumidity'] is not None and
-                t12 is not None):
-                data['pressure'] = weewx.uwxutils.uWxUtilsVP.SeaLevelToSensorPressure_12(
-                    data['barometer'], self.altitude_ft,
-                    data['outTemp'], t12, data['outHumidity'])
-            else:
-                data['pressure'] = None
-
-    def calc_barometer(self, data, data_type):
-        if 'pressure' in data and 'outTemp' in data:
-            data['barometer'] = weewx.wxformulas.sealevel_pressure_US(
-                data['pressure'], self.altitude_ft, data['outTemp'])
-
-    def calc_altimeter(self, data, data_type):
-        if 'pressure' in data:
-            data['altimeter'] = weewx.wxformulas.altimeter_pressure_US(
-                data['pressure'], self.altitude_ft, algorithm='aaNOAA')
+    def calc_outTemp12h(self, ts):
+        """The temperature 12 hours before ts, in degree_F, for the pressure
+        calculation. It cannot be calculated until the archive interval is
+        known."""
+        if self.arcint is None:
+            return weewx.derived.MISSING
+        return self.get_temperature_12h(ts, self.arcint)
 
     # rainRate is simply the amount of rain in a period scaled to quantity/hr.
     # use a sliding window for the time period and the total rainfall in that
     # period for the amount of rain.  the window size is controlled by the
-    # rain_period parameter.
+    # rain_period parameter.  a running sum is kept, so each packet costs only
+    # the events that enter and leave the window.
     def calc_rainRate(self, data, data_type):
         # if this is a loop packet then cull and add to the queue
         if data_type == 'loop':
-            events = []
-            for e in self.rain_events:
-                if e[0] > data['dateTime'] - self.rain_period:
-                    events.append((e[0], e[1]))
+            cutoff = data['dateTime'] - self.rain_period
+            while self.rain_events and self.rain_events[0][0] <= cutoff:
+                self.rain_sum -= self.rain_events.popleft()[1]
+            if not self.rain_events:
+                # start over, so rounding errors do not build up
+                self.rain_sum = 0
             if 'rain' in data and data['rain']:
-                events.append((data['dateTime'], data['rain']))
-            self.rain_events = events
-        # for both loop and archive, add up the rain...
-        sum = 0
-        for e in self.rain_events:
-            sum += e[1]
-        # ...then divide by the period and scale to an hour
-        data['rainRate'] = 3600 * sum / self.rain_period
+                self.rain_events.append((data['dateTime'], data['rain']))
+                self.rain_sum += data['rain']
+        # for both loop and archive, divide the sum by the period and scale to
+        # an hour
+        data['rainRate'] = 3600 * self.rain_sum / self.rain_period
 
     def get_arcint(self, data):
         if 'interval' in data and self.arcint != data['interval'] * 60:
             self.arcint = data['interval'] * 60
 
     def get_rain(self, ts, interval=3600):
-        """Get the quantity of rain from the past interval seconds.  We
-        do not include the latest timestamp so that we do not get the latest
-        interval (if it even exists).  We do not include the first timestamp
-        because we do not want the interval before that timestamp."""
-        dbmanager = self.engine.db_binder.get_manager('wx_binding')
-        sts = ts - interval
-        r = dbmanager.getSql("SELECT SUM(rain) FROM %s "
-                             "WHERE dateTime>? AND dateTime<?" % dbmanager.table_name,
-                             (sts, ts))
-        return r[0] if r is not None else None
+        """Get the quantity of rain, in inches, from the past interval
+        seconds.  We do not include the latest timestamp so that we do not get
+        the latest interval (if it even exists).  We do not include the first
+        timestamp because we do not want the interval before that timestamp."""
+        self.prime_history(ts)
+        return self.history.sum('rain', ts - interval, ts)
 
     def get_temperature_12h(self, ts, arcint):
-        """Get the temperature from 12 hours ago.  Return None if no
-        temperature is found."""
+        """Get the temperature, in degree_F, from 12 hours ago.  Return None
+        if no temperature is found."""
+        self.prime_history(ts)
         ts12 = weeutil.weeutil.startOfInterval(ts - 12*3600, arcint)
-        if ts12 != self.last_ts12:
-            dbmanager = self.engine.db_binder.get_manager('wx_binding')
-            r = dbmanager.getRecord(ts12)
-            self.t12 = r.get('outTemp') if r is not None else None
-            self.last_ts12 = ts12
-        return self.t12
+        return self.history.get(ts12, 'outTemp')
+
+    def prime_history(self, ts):
+        """Load the archive records needed by the lookups into the history,
+        the first time they are needed."""
+        if self.history_primed:
+            return
+        self.history_primed = True
+        db_binder = getattr(self.engine, 'db_binder', None)
+        if db_binder is None:
+            return
+        try:
+            dbmanager = db_binder.get_manager('wx_binding')
+            self.history.prime(dbmanager, ts)
+        except weedb.DatabaseError, e:
+            syslog.syslog(syslog.LOG_INFO, "wxservices: Unable to load archive history: %s" % e)
+
+#==============================================================================
+#                    Class ArchiveHistory
+#==============================================================================
+
+class ArchiveHistory(object):
+    """Holds the values of a few observation types from the recent archive
+    records, in US units, indexed by time."""
+
+    # The observation types kept, and the units they are kept in:
+    obs_units = (('outTemp', 'degree_F'), ('rain', 'inch'))
+
+    def __init__(self, max_age=13*3600):
+        """Initialize the history.
+
+        max_age: How long to keep records, in seconds. It must cover the 12
+        hour lookback of the pressure calculation, plus an archive interval."""
+        self.max_age = max_age
+        self.times = []
+        self.values = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def add_record(self, record):
+        """Add an archive record. A record already in the history is
+        ignored."""
+        ts = record['dateTime']
+        if ts in self.values:
+            return
+        unit_system = record['usUnits']
+        self.values[ts] = tuple(_convert(record.get(obs_type), unit_system, obs_type, unit)
+                                if unit_system != weewx.US else record.get(obs_type)
+                                for (obs_type, unit) in ArchiveHistory.obs_units)
+        bisect.insort(self.times, ts)
+        self._expire(self.times[-1] - self.max_age)
+
+    def prime(self, dbmanager, ts):
+        """Load the records of the max_age seconds before ts from a database,
+        with a single query."""
+        columns = ', '.join(obs_type for (obs_type, unit) in ArchiveHistory.obs_units)
+        for row in dbmanager.genSql("SELECT dateTime, usUnits, %s FROM %s "
+                                    "WHERE dateTime>? ORDER BY dateTime ASC" %
+                                    (columns, dbmanager.table_name),
+                                    (ts - self.max_age,)):
+            record = dict(zip(('dateTime', 'usUnits'), row[:2]))
+            record.update(zip((obs_type for (obs_type, unit) in ArchiveHistory.obs_units), row[2:]))
+            self.add_record(record)
+
+    def get(self, ts, obs_type):
+        """Return the value of an observation type in the record with time
+        ts, or None if there is no such record."""
+        values = self.values.get(ts)
+        if values is None:
+            return None
+        return values[self._index(obs_type)]
+
+    def sum(self, obs_type, start_ts, stop_ts):
+        """Return the sum of an observation type over the records with time
+        greater than start_ts, and less than stop_ts. Return None if there
+        are no values."""
+        i = self._index(obs_type)
+        lo = bisect.bisect_right(self.times, start_ts)
+        hi = bisect.bisect_left(self.times, stop_ts, lo)
+        vals = [self.values[ts][i] for ts in self.times[lo:hi]]
+        vals = [val for val in vals if val is not None]
+        return sum(vals) if vals else None
+
+    def _index(self, obs_type):
+        for (i, (_obs_type, unit)) in enumerate(ArchiveHistory.obs_units):
+            if _obs_type == obs_type:
+                return i
+        raise weewx.ViolatedPrecondition("Type '%s' is not kept in the archive history" % obs_type)
+
+    def _expire(self, oldest_ts):
+        """Drop the records at or before oldest_ts."""
+        n = bisect.bisect_right(self.times, oldest_ts)
+        for ts in self.times[:n]:
+            del self.values[ts]
+        del self.times[:n]
+
+def _convert(val, unit_system, obs_type, target_unit):
+    """Convert a single value of an observation type from its unit in a
+    standard unit system to another unit."""
+    if val is None:
+        return None
+    (unit, group) = weewx.units.getStandardUnitType(unit_system, obs_type)
+    return weewx.units.convert((val, unit, group), target_unit)[0]
+
+#==============================================================================
+#                    The standard derived quantities
+#==============================================================================
+
+# The intermediates altitude_foot, altitude_meter, and outTemp12h (the
+# temperature 12 hours ago, in degree_F) are supplied by StdWXCalculate.
+
+def _pressure_US(barometer, T, R, t12, altitude_ft):
+    if barometer is None or T is None or R is None or t12 is None:
+        return None
+    return weewx.uwxutils.uWxUtilsVP.SeaLevelToSensorPressure_12(barometer, altitude_ft, T, t12, R)
+
+def _pressure_Metric(barometer, T, R, t12, altitude_ft, unit_system):
+    # The formula only exists in US units, so convert just the inputs and
+    # the result.
+    if barometer is None or T is None or R is None or t12 is None:
+        return None
+    pressure_inHg = _pressure_US(_convert(barometer, unit_system, 'barometer', 'inHg'),
+                                 _convert(T, unit_system, 'outTemp', 'degree_F'),
+                                 R, t12, altitude_ft)
+    return weewx.units.convert((pressure_inHg, 'inHg', 'group_pressure'), 'mbar')[0]
+
+_US = (weewx.US,)
+# Temperatures are in degree_C, and pressures in mbar, in both metric unit
+# systems, but wind speed is in km_per_hour in METRIC, and meter_per_second
+# in METRICWX.
+_METRIC = (weewx.METRIC, weewx.METRICWX)
+
+weewx.derived.register('pressure', ('barometer', 'outTemp', 'outHumidity', 'outTemp12h', 'altitude_foot'),
+                       _pressure_US, _US)
+weewx.derived.register('barometer', ('pressure', 'outTemp', 'altitude_foot'),
+                       lambda P, T, alt : weewx.wxformulas.sealevel_pressure_US(P, alt, T), _US)
+weewx.derived.register('altimeter', ('pressure', 'altitude_foot'),
+                       lambda P, alt : weewx.wxformulas.altimeter_pressure_US(P, alt, algorithm='aaNOAA'), _US)
+weewx.derived.register('windchill', ('outTemp', 'windSpeed'), weewx.wxformulas.windchillF, _US)
+weewx.derived.register('heatindex', ('outTemp', 'outHumidity'), weewx.wxformulas.heatindexF, _US)
+weewx.derived.register('dewpoint', ('outTemp', 'outHumidity'), weewx.wxformulas.dewpointF, _US)
+weewx.derived.register('inDewpoint', ('inTemp', 'inHumidity'), weewx.wxformulas.dewpointF, _US)
+
+weewx.derived.register('windSpeed_kph', ('windSpeed', 'usUnits'),
+                       lambda V, unit_system : _convert(V, unit_system, 'windSpeed', 'km_per_hour'),
+                       _METRIC, intermediate=True)
+weewx.derived.register('pressure', ('barometer', 'outTemp', 'outHumidity', 'outTemp12h', 'altitude_foot', 'usUnits'),
+                       _pressure_Metric, _METRIC)
+weewx.derived.register('barometer', ('pressure', 'outTemp', 'altitude_meter'),
+                       lambda P, T, alt : weewx.wxformulas.sealevel_pressure_Metric(P, alt, T), _METRIC)
+weewx.derived.register('altimeter', ('pressure', 'altitude_meter'),
+                       lambda P, alt : weewx.wxformulas.altimeter_pressure_Metric(P, alt, algorithm='aaNOAA'), _METRIC)
+weewx.derived.register('windchill', ('outTemp', 'windSpeed_kph'), weewx.wxformulas.windchillC, _METRIC)
+weewx.derived.register('heatindex', ('outTemp', 'outHumidity'), weewx.wxformulas.heatindexC, _METRIC)
+weewx.derived.register('dewpoint', ('outTemp', 'outHumidity'), weewx.wxformulas.dewpointC, _METRIC)
+weewx.derived.register('inDewpoint', ('inTemp', 'inHumidity'), weewx.wxformulas.dewpointC, _METRIC)
+
+# The derived quantities that can be recalculated from the archive. For each,
+# the observation types needed, and a function that calculates it from arrays
+# of those types in US units, given the altitude in feet:
+recalc_dict = {
+    'dewpoint'  : (('outTemp', 'outHumidity'),
+                   lambda T, R, alt : weewx.wxformulas.dewpointF_array(T, R)),
+    'inDewpoint': (('inTemp', 'inHumidity'),
+                   lambda T, R, alt : weewx.wxformulas.dewpointF_array(T, R)),
+    'windchill' : (('outTemp', 'windSpeed'),
+                   lambda T, V, alt : weewx.wxformulas.windchillF_array(T, V)),
+    'heatindex' : (('outTemp', 'outHumidity'),
+                   lambda T, R, alt : weewx.wxformulas.heatindexF_array(T, R)),
+    'barometer' : (('pressure', 'outTemp'),
+                   lambda P, T, alt : weewx.wxformulas.sealevel_pressure_US_array(P, alt, T)),
+    'altimeter' : (('pressure',),
+                   lambda P, alt : weewx.wxformulas.altimeter_pressure_US_array(P, alt, algorithm='aaNOAA')),
+    }
+
+def recalculate(dbmanager, obs_types, altitude_vt, start_ts=None, stop_ts=None,
+                chunk_size=1000, progress_fn=None):
+    """Recalculate derived quantities in the archive, using the same formulas
+    as StdWXCalculate, then rebuild their daily summaries.
+
+    The archive is read in chunks of chunk_size records. Each chunk is
+    calculated in one go, using the array versions of the formulas in
+    weewx.wxformulas, then written back in a single transaction.
+
+    dbmanager: An open database manager.
+
+    obs_types: An iterable with the types to be recalculated. Each must be a
+    key of recalc_dict.
+
+    altitude_vt: The altitude of the station, as a ValueTuple.
+
+    start_ts, stop_ts: Records with a timestamp greater than start_ts, and
+    less than or equal to stop_ts, will be recalculated. [Optional. Default is
+    all records.]
+
+    progress_fn: If given, it is called after each chunk, with the number of
+    records done so far, and the timestamp of the last one.
+
+    returns: The number of records recalculated.
+    """
+    obs_types = list(obs_types)
+    for obs_type in obs_types:
+        if obs_type not in recalc_dict:
+            raise weewx.ViolatedPrecondition("Unable to recalculate type '%s'" % obs_type)
+        for x in [obs_type] + list(recalc_dict[obs_type][0]):
+            if x not in dbmanager.sqlkeys:
+                raise weewx.ViolatedPrecondition("Type '%s' is not in the database" % x)
+    in_types = sorted(set([x for obs_type in obs_types for x in recalc_dict[obs_type][0]]))
+
+    altitude_ft = weewx.units.convert(altitude_vt, "foot")[0]
+    unit_system = dbmanager.std_unit_system
+    sql_select = "SELECT dateTime, %s FROM %s WHERE dateTime > ? AND dateTime <= ? "\
+        "ORDER BY dateTime LIMIT %d" % (','.join(in_types), dbmanager.table_name, chunk_size)
+    sql_update = "UPDATE %s SET %s WHERE dateTime = ?" % \
+        (dbmanager.table_name, ','.join(["%s = ?" % x for x in obs_types]))
+
+    nrecs = 0
+    first_ts = None
+    last_ts = start_ts or 0
+    while True:
+        rows = [row for row in dbmanager.genSql(sql_select, (last_ts, stop_ts or 0x7fffffff))]
+        if not rows:
+            break
+        # Turn the rows into columns, in US units:
+        columns = zip(*rows)
+        time_column = columns[0]
+        data_us = {}
+        for (i, x) in enumerate(in_types):
+            (unit, group) = weewx.units.getStandardUnitType(unit_system, x)
+            data_us[x] = weewx.units.convert((list(columns[i + 1]), unit, group),
+                                             weewx.units.getStandardUnitType(weewx.US, x)[0])[0]
+        # Do the calculations, then convert the results back:
+        results = []
+        for obs_type in obs_types:
+            (depends_on, func) = recalc_dict[obs_type]
+            result_us = func(*([data_us[x] for x in depends_on] + [altitude_ft]))
+            (unit, group) = weewx.units.getStandardUnitType(weewx.US, obs_type)
+            results.append(weewx.units.convert((result_us, unit, group),
+                                               weewx.units.getStandardUnitType(unit_system, obs_type)[0])[0])
+        with weedb.Transaction(dbmanager.connection) as cursor:
+            for (i, ts) in enumerate(time_column):
+                cursor.execute(sql_update, [result[i] for result in results] + [ts])
+        nrecs += len(rows)
+        if first_ts is None:
+            first_ts = time_column[0]
+        last_ts = time_column[-1]
+        if progress_fn:
+            progress_fn(nrecs, last_ts)
+
+    # The daily summaries of the types are now out of date:
+    if nrecs and hasattr(dbmanager, 'rebuild_day_summary'):
+        dbmanager.rebuild_day_summary(obs_types, first_ts, last_ts, progress_fn=None)
+    return nrecs
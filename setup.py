@@ -1835,7 +1835,8 @@ if __name__ == "__main__":
                          'weewx',
                          'weewx.drivers'],
           py_modules  = ['daemon'],
-          scripts     = ['bin/wee_config_database',
+          scripts     = ['bin/wee_benchmark',
+                         'bin/wee_config_database',
                          'bin/wee_config_device',
                          'bin/weewxd',
                          'bin/wee_reports'],